@@ -1,13 +1,85 @@
+import asyncio
+import json
+import os
 import re
-from fastapi import FastAPI
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import httpx
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from app import cache, metrics, versions
+from app.context import build_context, format_context
+from app.rag import (
+    QUERY_BATCH_MAX,
+    enable_query_batching,
+    encode_queries,
+    encode_query,
+    index_version,
+    normalize_question,
+    retrieve,
+    retrieve_many,
+    serving_version,
+    shard_status,
+    swap_index,
+    use_shards,
+    warmup,
+    watch_index,
+    with_neighbours,
+)
+from app.semantic_cache import SemanticCache
+
+LLM_TIMEOUT = httpx.Timeout(30.0, connect=5.0)
+LLM_MAX_CONNECTIONS = 100
+# /chat/batch: questions per request, and default LLM calls in flight per request
+BATCH_MAX_QUESTIONS = 256
+BATCH_CONCURRENCY = 8
+# retrieval is CPU-bound (query encoding, scoring); keep it off the event loop.
+# Threads mostly wait on the batched encoder, so allow a full encoder batch in flight.
+RETRIEVAL_WORKERS = max(os.cpu_count() or 4, QUERY_BATCH_MAX)
+# if set, /admin/* endpoints require it in the X-Admin-Token header
+ADMIN_TOKEN = os.environ.get("INFOHUB_ADMIN_TOKEN")
+# seconds between checks of data/index/CURRENT for a new index version; 0 = only /admin/index/reload
+INDEX_WATCH_INTERVAL = float(os.environ.get("INFOHUB_INDEX_WATCH", "10"))
+# comma-separated app.shard base URLs: retrieve from these shard servers instead of a local index
+SHARD_URLS = [u.strip() for u in os.environ.get("INFOHUB_SHARDS", "").split(",") if u.strip()]
+SHARD_TIMEOUT = float(os.environ.get("INFOHUB_SHARD_TIMEOUT", "1.0"))  # seconds per query
 
-from app.rag import retrieve
+# one pooled HTTP client shared by all requests
+client = AsyncOpenAI(
+    timeout=LLM_TIMEOUT,
+    max_retries=2,
+    http_client=DefaultAsyncHttpxClient(
+        timeout=LLM_TIMEOUT,
+        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=20),
+    ),
+)
+enable_query_batching()
+if SHARD_URLS:
+    use_shards(SHARD_URLS, SHARD_TIMEOUT)
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieve")
+# final answers, keyed on index build + question + the exact hits the answer was based on
+answer_cache = cache.make_cache("answer", maxsize=2048, ttl=6 * 3600)
+# paraphrases: similar question embedding + same retrieved sources -> reuse the answer
+semantic_cache = SemanticCache()
 
-app = FastAPI(title="InfoHub RAG API")
 
-client = OpenAI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # load and exercise the index and encoder before the server starts accepting requests
+    await asyncio.get_running_loop().run_in_executor(retrieval_pool, warmup)
+    if INDEX_WATCH_INTERVAL > 0:
+        watch_index(INDEX_WATCH_INTERVAL)
+    yield
+    await client.close()
+    retrieval_pool.shutdown(wait=False)
+
+
+app = FastAPI(title="InfoHub RAG API", lifespan=lifespan)
 
 SYSTEM_PROMPT = """შენ ხარ საქართველოს საბაჟო ინფორმაციის ასისტენტი.
 აუცილებლად უპასუხე ქართულად.
@@ -22,29 +94,50 @@ SYSTEM_PROMPT = """შენ ხარ საქართველოს სა
 
 class QuestionRequest(BaseModel):
     question: str
+    debug: bool = False  # add per-stage timings, candidate counts and token usage to the response
 
 
-@app.post("/chat")
-def chat(req: QuestionRequest):
-    question = req.question.strip()
-    if not question:
-        return {"answer": "გთხოვთ შეიყვანოთ კითხვა.", "sources": []}
+class BatchRequest(BaseModel):
+    questions: list[str]
+    concurrency: int = BATCH_CONCURRENCY  # LLM calls in flight for this batch (capped by the connection pool)
 
-    # Retrieve top-k chunks
-    hits = retrieve(question, k=5)
 
+class IndexReloadRequest(BaseModel):
+    version: str = None  # make this version CURRENT first (e.g. to roll back)
+
+
+def _retrieve_with_vec(question: str, k: int, trace=None):
+    if trace is None:
+        hits = retrieve(question, k)
+    else:
+        hits = retrieve(question, k, timings=trace.stages, counts=trace.counts)
     if not hits:
-        return {"answer": "შესაბამისი ინფორმაცია ვერ მოიძებნა.", "sources": []}
+        return hits, None
+    # retrieval already put this vector in the query-vector cache, so it's a lookup
+    return with_neighbours(hits), encode_query(question)
+
+
+async def retrieve_async(question: str, k: int = 5, trace=None):
+    """(hits with their neighbours, query vector) computed on the retrieval pool."""
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    result = await loop.run_in_executor(retrieval_pool, _retrieve_with_vec, question, k, trace)
+    if trace is not None:
+        trace.lap("retrieve", t0)  # includes waiting for a pool thread
+    return result
 
-    # Build numbered context and a map: number -> URL
-    context_parts = []
-    sources_map = {}  # {1: url1, 2: url2, ...}
 
-    for i, h in enumerate(hits, start=1):
-        context_parts.append(f"[{i}] {h['chunk']}")
-        sources_map[i] = h["url"]
+def _retrieve_many_with_vecs(questions, k: int):
+    hits_list = retrieve_many(questions, k)
+    with_hits = [q for q, hits in zip(questions, hits_list) if hits]
+    vecs = iter(encode_queries(with_hits))  # cached by retrieve_many, so lookups
+    return [(with_neighbours(hits), next(vecs)) if hits else (hits, None) for hits in hits_list]
 
-    context = "\n\n".join(context_parts)
+
+def build_messages(question: str, passages):
+    """Prompt over build_context() passages plus the map: number -> URL used to resolve citations."""
+    sources_map = {p["n"]: p["url"] for p in passages}  # {1: url1, 2: url2, ...}
+    context = format_context(passages)
 
     user_prompt = f"""კონტექსტი (InfoHub ამონარიდები):
 {context}
@@ -59,18 +152,33 @@ def chat(req: QuestionRequest):
 (არ დაამატო სხვა წყაროები; გამოიყენე მხოლოდ მოცემული კონტექსტის ნომრები.)
 """
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.2,
-        max_tokens=350,
-    )
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+    return messages, sources_map
+
+
+def answer_key(question: str, hits):
+    return (index_version(), normalize_question(question), tuple(h["idx"] for h in hits))
 
-    answer = response.choices[0].message.content or ""
 
+def lookup_answer(question: str, hits, qvec):
+    """Exact answer cache first, then the semantic one. Returns (exact key, cached result or None)."""
+    key = answer_key(question, hits)
+    cached = answer_cache.get(key)
+    if cached is None and qvec is not None:
+        cached = semantic_cache.lookup(qvec, [h["url"] for h in hits], index_version())
+    return key, cached
+
+
+def store_answer(key, question: str, hits, qvec, result):
+    answer_cache.set(key, result)
+    if qvec is not None:
+        semantic_cache.add(normalize_question(question), qvec, [h["url"] for h in hits], index_version(), result)
+
+
+def resolve_sources(answer: str, sources_map):
     # Extract citations like [1], [2] from the answer
     cited_nums = re.findall(r"\[(\d+)\]", answer)
     cited_nums = [int(n) for n in cited_nums if n.isdigit()]
@@ -90,7 +198,261 @@ def chat(req: QuestionRequest):
     if not used_sources:
         used_sources = list(sources_map.values())[:2]
 
-    return {
+    return used_sources
+
+
+def new_trace(endpoint: str, debug: bool):
+    return metrics.Trace(endpoint) if metrics.METRICS_ENABLED or debug else None
+
+
+def finish(trace, response: Response, debug: bool, outcome: str, result):
+    """Record the request's trace; expose it as Server-Timing and, if asked, a debug field."""
+    if trace is None:
+        return result
+    trace.observe(outcome)
+    response.headers["Server-Timing"] = trace.server_timing()
+    if debug:
+        result = {**result, "debug": trace.debug()}  # never mutate a cached answer
+    return result
+
+
+async def answer_question(question: str, hits, qvec, trace=None):
+    """Cached or freshly generated answer for retrieved hits. Returns (result, outcome)."""
+    t0 = time.perf_counter()
+    key, cached = lookup_answer(question, hits, qvec)
+    if trace is not None:
+        t0 = trace.lap("answer_cache", t0)
+    if cached is not None:
+        return cached, "cached"
+
+    messages, sources_map = build_messages(question, build_context(question, hits))
+    if trace is not None:
+        t0 = trace.lap("context", t0)
+
+    completion = await client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=messages,
+        temperature=0.2,
+        max_tokens=350,
+    )
+
+    answer = completion.choices[0].message.content or ""
+    if trace is not None:
+        trace.lap("llm", t0)
+        if completion.usage is not None:
+            trace.usage = {"prompt": completion.usage.prompt_tokens, "completion": completion.usage.completion_tokens}
+
+    result = {
         "answer": answer,
-        "sources": used_sources
+        "sources": resolve_sources(answer, sources_map)
     }
+    store_answer(key, question, hits, qvec, result)
+    return result, "answered"
+
+
+@app.post("/chat")
+async def chat(req: QuestionRequest, response: Response):
+    question = req.question.strip()
+    if not question:
+        return {"answer": "გთხოვთ შეიყვანოთ კითხვა.", "sources": []}
+    trace = new_trace("chat", req.debug)
+
+    # Retrieve top-k chunks
+    hits, qvec = await retrieve_async(question, k=5, trace=trace)
+
+    if not hits:
+        return finish(trace, response, req.debug, "no_hits",
+                      {"answer": "შესაბამისი ინფორმაცია ვერ მოიძებნა.", "sources": []})
+
+    result, outcome = await answer_question(question, hits, qvec, trace)
+    return finish(trace, response, req.debug, outcome, result)
+
+
+@app.post("/chat/batch")
+async def chat_batch(req: BatchRequest, response: Response):
+    """
+    Many questions at once: {"results": [...]} in request order, each shaped like a /chat
+    response, or {"error": ...} if that question's LLM call failed. Retrieval runs in bulk
+    (retrieve_many), then at most `concurrency` LLM calls are in flight.
+    """
+    if len(req.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=413, detail=f"at most {BATCH_MAX_QUESTIONS} questions per batch")
+    questions = [q.strip() for q in req.questions]
+    asked = [q for q in questions if q]
+    trace = new_trace("chat_batch", False)
+
+    loop = asyncio.get_running_loop()
+    t0 = time.perf_counter()
+    retrieved = await loop.run_in_executor(retrieval_pool, _retrieve_many_with_vecs, asked, 5)
+    if trace is not None:
+        t0 = trace.lap("retrieve", t0)
+
+    semaphore = asyncio.Semaphore(max(1, min(req.concurrency, LLM_MAX_CONNECTIONS)))
+
+    async def one(question, hits, qvec):
+        if not hits:
+            return {"answer": "შესაბამისი ინფორმაცია ვერ მოიძებნა.", "sources": []}
+        async with semaphore:
+            try:
+                result, _ = await answer_question(question, hits, qvec)
+            except Exception as e:
+                return {"error": str(e)}
+        return result
+
+    answered = iter(await asyncio.gather(*(one(q, hits, qvec) for q, (hits, qvec) in zip(asked, retrieved))))
+    results = [next(answered) if q else {"answer": "გთხოვთ შეიყვანოთ კითხვა.", "sources": []} for q in questions]
+    if trace is not None:
+        trace.lap("answers", t0)
+    return finish(trace, response, False, "answered", {"results": results})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Prometheus text format: stage/request histograms, candidate counts, LLM tokens, cache hits (per worker)."""
+    body = metrics.render(metrics.cache_lines(cache.stats() + [semantic_cache.stats()]))
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """Per-tier size and hit-rate counters (counters are per worker process)."""
+    return {"caches": cache.stats() + [semantic_cache.stats()]}
+
+
+def check_admin(token):
+    if ADMIN_TOKEN and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+
+@app.post("/admin/cache/flush")
+def flush_caches(x_admin_token: str = Header(default=None)):
+    """Drop every cached vector, hit list and answer in this worker (and the shared backend, if any)."""
+    check_admin(x_admin_token)
+    cache.clear_all()
+    semantic_cache.clear()
+    return {"flushed": True}
+
+
+@app.get("/admin/index")
+def index_status(x_admin_token: str = Header(default=None)):
+    """Index version this worker serves, the CURRENT one on disk, all kept versions and the shard servers' status."""
+    check_admin(x_admin_token)
+    status = {"serving": serving_version(), "current": versions.current(), "versions": versions.list_versions()}
+    if SHARD_URLS:
+        status["shards"] = shard_status()
+    return status
+
+
+@app.post("/admin/index/reload")
+async def reload_index(req: IndexReloadRequest = None, x_admin_token: str = Header(default=None)):
+    """
+    Load, warm and swap in the CURRENT index version (after optionally making `version`
+    CURRENT) in this worker; requests keep being served by the old one meanwhile. Other
+    workers follow within INFOHUB_INDEX_WATCH seconds.
+    """
+    check_admin(x_admin_token)
+    previous = serving_version()
+    t0 = time.perf_counter()
+    try:
+        if req is not None and req.version:
+            versions.set_current(req.version)
+        serving = await asyncio.get_running_loop().run_in_executor(None, swap_index)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"previous": previous, "serving": serving, "seconds": round(time.perf_counter() - t0, 3)}
+
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(req: QuestionRequest):
+    """
+    Server-sent events, in order:
+      sources   - retrieved context [{n, url, title}], sent before the LLM starts
+      token     - {"text": ...} answer deltas as the model produces them
+      citations - {"sources": [...]} URLs actually cited ([n] -> URL), same as /chat
+      done      - {} ({"debug": {...}} if requested; headers are gone by then, so no Server-Timing)
+    An "error" event replaces the rest if the LLM call fails.
+    """
+    question = req.question.strip()
+    trace = new_trace("chat_stream", req.debug)
+
+    def done(outcome):
+        if trace is None:
+            return sse("done", {})
+        trace.observe(outcome)
+        return sse("done", {"debug": trace.debug()} if req.debug else {})
+
+    async def events():
+        if not question:
+            yield sse("token", {"text": "გთხოვთ შეიყვანოთ კითხვა."})
+            yield sse("citations", {"sources": []})
+            yield sse("done", {})
+            return
+
+        hits, qvec = await retrieve_async(question, k=5, trace=trace)
+        if not hits:
+            yield sse("sources", {"sources": []})
+            yield sse("token", {"text": "შესაბამისი ინფორმაცია ვერ მოიძებნა."})
+            yield sse("citations", {"sources": []})
+            yield done("no_hits")
+            return
+
+        passages = build_context(question, hits)
+        messages, sources_map = build_messages(question, passages)
+        yield sse("sources", {"sources": [{"n": p["n"], "url": p["url"], "title": p["title"]} for p in passages]})
+
+        t0 = time.perf_counter()
+        key, cached = lookup_answer(question, hits, qvec)
+        if trace is not None:
+            t0 = trace.lap("answer_cache", t0)
+        if cached is not None:
+            yield sse("token", {"text": cached["answer"]})
+            yield sse("citations", {"sources": cached["sources"]})
+            yield done("cached")
+            return
+
+        parts = []
+        try:
+            stream = await client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=messages,
+                temperature=0.2,
+                max_tokens=350,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            async for chunk in stream:
+                if chunk.usage is not None and trace is not None:
+                    trace.usage = {"prompt": chunk.usage.prompt_tokens, "completion": chunk.usage.completion_tokens}
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts and trace is not None:
+                        trace.stages["llm_first_token"] = time.perf_counter() - t0
+                    parts.append(delta)
+                    yield sse("token", {"text": delta})
+        except Exception as e:
+            if trace is not None:
+                trace.observe("error")
+            yield sse("error", {"message": str(e)})
+            return
+        if trace is not None:
+            trace.lap("llm", t0)
+
+        answer = "".join(parts)
+        result = {"answer": answer, "sources": resolve_sources(answer, sources_map)}
+        store_answer(key, question, hits, qvec, result)
+        yield sse("citations", {"sources": result["sources"]})
+        yield done("answered")
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
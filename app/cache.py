@@ -0,0 +1,161 @@
+"""
+Bounded LRU + TTL caches for query vectors, retrieval hits and final answers.
+
+Entries live in process memory by default. Set INFOHUB_CACHE_DB to a SQLite file
+(e.g. data/cache.sqlite3) to share them between API workers and restarts.
+Values in the shared backend are pickled, so the file must only be writable by the service.
+"""
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DB = os.environ.get("INFOHUB_CACHE_DB")
+
+_caches = {}  # name -> cache, for stats()
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after `ttl` seconds."""
+
+    backend = "memory"
+
+    def __init__(self, name, maxsize=1024, ttl=3600):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "backend": self.backend,
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SqliteCache(TTLCache):
+    """
+    Same interface, backed by one SQLite table per cache so every worker sees every entry.
+    Size trimming evicts the least recently used entries (a hit refreshes `used`, at the cost
+    of a write per hit); hit/miss counters stay per process.
+    A forked worker opens its own connection (SQLite connections must not cross fork).
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path, name, maxsize=1024, ttl=3600):
+        super().__init__(name, maxsize, ttl)
+        self._table = "cache_" + "".join(c if c.isalnum() else "_" for c in name)
+        self._path = path
+        self._pid = None
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self._table} "
+                "(key TEXT PRIMARY KEY, value BLOB, expires REAL, used REAL)"
+            )
+        self._writes = 0
+
+    @property
+    def _conn(self):
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self._path, check_same_thread=False, timeout=5)
+            self._pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def _key(key):
+        return hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        key = self._key(key)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value FROM {self._table} WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(f"UPDATE {self._table} SET used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def set(self, key, value):
+        now = time.time()
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?, ?)",
+                (self._key(key), blob, now + self.ttl, now),
+            )
+            # trim now and then rather than on every write
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._conn.execute(f"DELETE FROM {self._table} WHERE expires <= ?", (now,))
+                self._conn.execute(
+                    f"DELETE FROM {self._table} WHERE key NOT IN "
+                    f"(SELECT key FROM {self._table} ORDER BY used DESC LIMIT ?)",
+                    (self.maxsize,),
+                )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self._table}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+
+def make_cache(name, maxsize=1024, ttl=3600):
+    cache = SqliteCache(CACHE_DB, name, maxsize, ttl) if CACHE_DB else TTLCache(name, maxsize, ttl)
+    _caches[name] = cache
+    return cache
+
+
+def stats():
+    return [c.stats() for c in _caches.values()]
+
+
+def clear_all():
+    for c in _caches.values():
+        c.clear()
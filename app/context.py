@@ -0,0 +1,131 @@
+"""
+Prompt context from retrieved hits, packed into a token budget.
+
+Each hit is merged with the neighbouring chunks of its URL that rag.with_neighbours()
+found (their 200-character overlap is sent once). Sentences are then packed by relevance
+until INFOHUB_CONTEXT_TOKENS is reached: first the best sentence of every passage in rank
+order, then the other sentences sharing terms with the question, then the rest, nearest
+to those first (an answer need not repeat the question's words). Tokens are counted with
+tiktoken's o200k_base (the gpt-4o family's encoding) when it is installed and its
+encoding file is available (TIKTOKEN_CACHE_DIR for offline hosts), else estimated.
+"""
+import math
+import os
+import re
+
+from app.rag import _tokenize
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("INFOHUB_CONTEXT_TOKENS", "1000"))
+TOKEN_ENCODING = "o200k_base"
+STEM_CHARS = 6  # Georgian inflects by suffix: compare terms on their first characters
+MAX_OVERLAP = 400  # longest chunk overlap looked for when merging neighbours (build uses 200)
+MIN_OVERLAP = 50  # shorter is a chance match: rows in between were dropped by the build
+GAP = " … "  # marks sentences left out between two kept ones
+
+SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+        except Exception:  # not installed, or the encoding file can't be fetched
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    # a BPE token is rarely shorter than 4 UTF-8 bytes' worth of text: errs high
+    return math.ceil(len(text.encode("utf-8")) / 4)
+
+
+def _stems(tokens):
+    return {t[:STEM_CHARS] for t in tokens}
+
+
+def _overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that `b` starts with (MIN_OVERLAP..MAX_OVERLAP), else 0."""
+    for n in range(min(len(a), len(b), MAX_OVERLAP), MIN_OVERLAP - 1, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def _join(a: str, b: str) -> str:
+    # consecutive rows are not always consecutive chunks (tiny and near-duplicate chunks
+    # are dropped at build time): without the overlap, mark the gap
+    n = _overlap(a, b)
+    return a + b[n:] if n else a + GAP + b
+
+
+def merge_adjacent(hits):
+    """
+    Passages {"url", "title", "text", "rows"} in rank order: hits of one URL on consecutive
+    chunk rows are joined into one passage, placed where its best-ranked hit was.
+    """
+    passages = []
+    for h in hits:
+        prev = next((p for p in passages if p["url"] == h["url"]
+                     and (h["idx"] == p["rows"][-1] + 1 or h["idx"] == p["rows"][0] - 1)), None)
+        if prev is None:
+            passages.append({"url": h["url"], "title": h["title"], "text": h["chunk"], "rows": [h["idx"]]})
+        elif h["idx"] > prev["rows"][-1]:
+            prev["text"] = _join(prev["text"], h["chunk"])
+            prev["rows"].append(h["idx"])
+        else:
+            prev["text"] = _join(h["chunk"], prev["text"])
+            prev["rows"].insert(0, h["idx"])
+    return passages
+
+
+def build_context(question: str, hits, budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Numbered passages [{"n", "url", "title", "text"}] for the prompt, within `budget` tokens.
+    Hits may carry "neighbours" (rag.with_neighbours), merged into their passage.
+    Passages with no sentence left are dropped, so numbering follows what is sent.
+    """
+    q_stems = _stems(_tokenize(question))
+    neighbours = [{**n, "url": h["url"], "title": h["title"]} for h in hits for n in h.get("neighbours", ())]
+    passages = merge_adjacent(list(hits) + neighbours)
+    tiers = []  # per passage: (best sentence, other matching ones, filler), each [(score, position, sentence, tokens)]
+    for p in passages:
+        sentences = [s for s in SENTENCE_RE.split(p["text"]) if s.strip()]
+        scores = [len(q_stems & _stems(_tokenize(s))) for s in sentences]
+        if not any(scores):
+            scores = [1] + [0] * (len(sentences) - 1)  # no term in common: lead with its opening
+        sents = [(sc, i, s, count_tokens(s)) for i, (s, sc) in enumerate(zip(sentences, scores))]
+        matching = sorted((x for x in sents if x[0]), key=lambda x: (-x[0], x[1]))
+        at = [x[1] for x in matching]
+        filler = sorted((x for x in sents if not x[0]), key=lambda x: (min(abs(x[1] - i) for i in at), x[1]))
+        tiers.append((matching[:1], matching[1:], filler))
+
+    chosen = [[] for _ in passages]
+    left = budget
+    # every passage's best sentence first, in rank order; then the other matching sentences; then filler
+    for tier in range(3):
+        for kept, passage_tiers in zip(chosen, tiers):
+            for sent in passage_tiers[tier]:
+                if sent[3] <= left:
+                    kept.append(sent)
+                    left -= sent[3]
+
+    out = []
+    for p, kept in zip(passages, chosen):
+        if not kept:
+            continue
+        kept.sort(key=lambda x: x[1])
+        text = kept[0][2]
+        for prev, sent in zip(kept, kept[1:]):
+            text += (" " if sent[1] == prev[1] + 1 else GAP) + sent[2]
+        out.append({"n": len(out) + 1, "url": p["url"], "title": p["title"], "text": text})
+    return out
+
+
+def format_context(passages, with_source: bool = False):
+    """The context block: "[n] text" per passage, optionally with TITLE/URL lines."""
+    if with_source:
+        return "\n".join(f"[{p['n']}] TITLE: {p['title']}\nURL: {p['url']}\nTEXT: {p['text']}\n" for p in passages)
+    return "\n\n".join(f"[{p['n']}] {p['text']}" for p in passages)
@@ -0,0 +1,172 @@
+"""
+Scatter-gather retrieval over shard servers.
+
+A build made with `python -m ingest.build_index --shards N` splits the docs by URL hash
+into N shards, each with its own chunk store, BM25 index, embeddings and FAISS index, and
+`app.shard` serves one shard per process. ShardCoordinator sends every query to all shards
+at once and merges their candidates into the hits retrieve() computes on a single index:
+shard BM25 indexes score with the whole corpus's idf and document lengths, so the global
+top n are among the shards' top n and keep their scores. A shard that fails or misses the
+deadline is left out of that query and counted in infohub_shard_failures_total.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import httpx
+
+from app import metrics, rag
+
+# concurrent requests per shard; the API runs up to api.RETRIEVAL_WORKERS retrievals at once
+SHARD_REQUESTS_IN_FLIGHT = 32
+
+
+class ShardCoordinator:
+    """Fan queries out to the shard servers at `urls`, waiting at most `timeout` seconds for each."""
+
+    def __init__(self, urls, timeout=1.0):
+        self.urls = [u.rstrip("/") for u in urls]
+        self.timeout = timeout
+        # what the shards last agreed on; cache keys use the build id
+        self.version = None
+        self.build_id = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _session(self):
+        # pooled connections and threads don't survive fork: one client and pool per process
+        with self._lock:
+            if self._pid != os.getpid():
+                n = len(self.urls) * SHARD_REQUESTS_IN_FLIGHT
+                self._client = httpx.Client(timeout=self.timeout, limits=httpx.Limits(max_connections=n))
+                self._pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="shard")
+                self._pid = os.getpid()
+            return self._client, self._pool
+
+    def _gather(self, method, path, bodies):
+        """
+        Call the shards in `bodies` (shard -> JSON body or None) in parallel under one deadline.
+        Returns shard -> parsed response, None for a shard that failed or timed out.
+        """
+        client, pool = self._session()
+        futures = {shard: pool.submit(client.request, method, self.urls[shard] + path, json=body)
+                   for shard, body in bodies.items()}
+        wait(futures.values(), timeout=self.timeout)
+        results = {}
+        for shard, f in futures.items():
+            results[shard] = None
+            if not f.done():
+                f.cancel()  # still queued or in flight; the client timeout ends the latter
+                metrics.SHARD_FAILURES.inc(str(shard), "timeout")
+                continue
+            try:
+                r = f.result()
+                r.raise_for_status()
+                results[shard] = r.json()
+            except httpx.TimeoutException:
+                metrics.SHARD_FAILURES.inc(str(shard), "timeout")
+            except (httpx.HTTPError, ValueError):
+                metrics.SHARD_FAILURES.inc(str(shard), "error")
+        return results
+
+    def _agreed(self, results):
+        # the build all shards answered from, or None if one failed or they are mid-swap
+        answers = list(results.values())
+        builds = {(r["version"], r["build_id"]) for r in answers if r is not None}
+        if None in answers or len(builds) != 1:
+            return None
+        self.version, self.build_id = builds.pop()
+        return self.build_id
+
+    def status(self):
+        """Each shard's /status, in shard order (None for a shard that didn't answer)."""
+        results = self._gather("GET", "/status", dict.fromkeys(range(len(self.urls))))
+        return [results[shard] for shard in range(len(self.urls))]
+
+    def refresh(self):
+        """
+        Re-read the version the shards serve; returns it (the last agreed one while they
+        differ). Raises ValueError if the servers don't serve shards 0..N-1 of an N-shard build.
+        """
+        status = self.status()
+        for shard, s in enumerate(status):
+            if s is not None and (s["shard"], s["shards"]) != (shard, len(self.urls)):
+                raise ValueError(f"{self.urls[shard]} serves shard {s['shard']} of {s['shards']}, "
+                                 f"expected shard {shard} of {len(self.urls)}")
+        self._agreed(dict(enumerate(status)))
+        return self.version
+
+    def chunks(self, rows):
+        """Chunks at corpus-wide `rows` ({"idx", "title", "url", "chunk"}) from the shards holding them."""
+        body = {"rows": rows, "version": self.version, "partial": True}
+        found = []
+        for r in self._gather("POST", "/chunks", dict.fromkeys(range(len(self.urls)), body)).values():
+            if r is not None:
+                found += r["chunks"]
+        return found
+
+    def retrieve(self, question, qvec, k, bm25_candidates, semantic_candidates, timings=None, counts=None,
+                 t=None):
+        """
+        Top k hits over all shards for a normalized question (`qvec`: its embedding, or None
+        for BM25 only), plus the build id they come from: None unless every shard answered,
+        all from the same build. Candidates come back as scores and URLs; the text is fetched
+        for the final hits only, from the shards that hold them.
+        """
+        if t is None:
+            t = time.perf_counter()
+        body = {"question": question, "bm25_candidates": bm25_candidates, "semantic_candidates": semantic_candidates}
+        if qvec is not None:
+            body["qvec"] = qvec.tolist()
+        results = self._gather("POST", "/search", dict.fromkeys(range(len(self.urls)), body))
+        t = rag._lap(timings, "shards", t)
+        build_id = self._agreed(results)
+
+        # the same candidates, in the same order, as rag._retrieve over the whole index. Ties
+        # go to the lowest corpus-wide row everywhere: a shard's top_k keeps its lowest local
+        # rows, which are its lowest global ones (rows.npy ascends), and the sort keys end in idx.
+        found = []
+        for shard, r in results.items():
+            for c in r["candidates"] if r is not None else ():
+                c["shard"], c["version"] = shard, r["version"]
+                found.append(c)
+        candidates = sorted((c for c in found if c["in_bm25"]), key=lambda c: (-c["bm25"], c["idx"]))
+        candidates = candidates[:bm25_candidates]
+        n_extra = 0
+        if semantic_candidates:
+            seen = {c["idx"] for c in candidates}
+            dense = sorted((c for c in found if c["ann"] is not None), key=lambda c: (-c["ann"], c["idx"]))
+            extra = sorted((c for c in dense[:semantic_candidates] if c["idx"] not in seen), key=lambda c: c["idx"])
+            candidates += extra
+            n_extra = len(extra)
+        if counts is not None:
+            counts["bm25_candidates"] = len(candidates) - n_extra
+            if semantic_candidates:
+                counts["ann_candidates"] = n_extra
+            counts["shards_failed"] = sum(r is None for r in results.values())
+        if not candidates:
+            return [], build_id
+
+        rag._combine(candidates, [c["semantic"] for c in candidates] if qvec is not None else None)
+        t = rag._lap(timings, "rerank", t)
+        final = rag._dedupe(candidates, "url", k)
+        t = rag._lap(timings, "dedupe", t)
+
+        requests = {}
+        for c in final:
+            requests.setdefault(c["shard"], {"rows": [], "version": c["version"]})["rows"].append(c["idx"])
+        texts = {}
+        for shard, r in self._gather("POST", "/chunks", requests).items():
+            if r is None:
+                build_id = None  # hits of that shard are dropped
+                continue
+            texts.update((h["idx"], h) for h in r["chunks"])
+        hits = []
+        for c in final:
+            if c["idx"] in texts:
+                for field in ("ann", "in_bm25", "shard", "version"):
+                    del c[field]
+                hits.append({**c, "title": texts[c["idx"]]["title"], "chunk": texts[c["idx"]]["chunk"]})
+        rag._lap(timings, "fetch", t)
+        return hits, build_id
@@ -0,0 +1,158 @@
+"""
+Text embedder backends for the E5 encoder.
+
+`torch` (default) is SentenceTransformer. `onnx` runs an exported copy of the same model
+on ONNX Runtime with the `tokenizers` library, so serving needs neither torch nor
+transformers; `onnx-int8` uses the dynamically int8-quantized export. Select with
+INFOHUB_EMBEDDER; export once with
+
+    python -m app.embedder export [--quantize]
+"""
+import argparse
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+EMBEDDER_BACKENDS = ("torch", "onnx", "onnx-int8")
+EMBEDDER_BACKEND = os.environ.get("INFOHUB_EMBEDDER", "torch")
+ONNX_DIR = Path(os.environ.get("INFOHUB_ONNX_DIR", "data/onnx"))
+
+
+class OnnxEncoder:
+    """
+    Drop-in for the SentenceTransformer.encode calls used here: tokenize, run the
+    transformer, pool (mean or CLS, as exported) and optionally L2-normalize.
+    """
+
+    def __init__(self, path=ONNX_DIR, quantized=False):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = Path(path)
+        self.config = json.loads((path / "export.json").read_text(encoding="utf-8"))
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = path / ("model.int8.onnx" if quantized else "model.onnx")
+        self.session = ort.InferenceSession(str(model_file), opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self.session.get_inputs()}
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, show_progress_bar=False):
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer.encode_batch(list(texts[start:start + batch_size]))
+            ids = np.array([e.ids for e in batch], dtype=np.int64)
+            mask = np.array([e.attention_mask for e in batch], dtype=np.int64)
+            feed = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self._inputs:
+                feed["token_type_ids"] = np.zeros_like(ids)
+            hidden = self.session.run(None, feed)[0]
+
+            if self.config["pooling"] == "cls":
+                vecs = hidden[:, 0]
+            else:
+                m = mask[:, :, None].astype(hidden.dtype)
+                vecs = (hidden * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+            if normalize_embeddings:
+                vecs = vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+            out.append(vecs.astype("float32"))
+        if not out:
+            return np.empty((0, self.config["dim"]), dtype="float32")
+        return np.concatenate(out)
+
+
+def embedder_id(model_name, backend=None):
+    """Identifies what produced a vector; caches keyed on it never mix backends."""
+    backend = backend or EMBEDDER_BACKEND
+    return model_name if backend == "torch" else f"{model_name}+{backend}"
+
+
+def load_embedder(model_name, backend=None, onnx_dir=ONNX_DIR):
+    backend = backend or EMBEDDER_BACKEND
+    if backend == "torch":
+        # imported here so the ONNX backend never pays for torch
+        from sentence_transformers import SentenceTransformer
+
+        return SentenceTransformer(model_name)
+    if backend not in EMBEDDER_BACKENDS:
+        raise ValueError(f"unknown embedder backend {backend!r}; expected one of {EMBEDDER_BACKENDS}")
+
+    encoder = OnnxEncoder(onnx_dir, quantized=backend == "onnx-int8")
+    if encoder.config["model"] != model_name:
+        raise ValueError(f"{onnx_dir} holds an export of {encoder.config['model']}, not {model_name}")
+    return encoder
+
+
+def export_onnx(model_name, out_dir=ONNX_DIR, quantize=False, opset=17):
+    """Export the SentenceTransformer's transformer + tokenizer; pooling is redone in numpy."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, tokenizer = st[0].auto_model.eval(), st.tokenizer
+    pooling = next((m.get_config_dict() for m in st if type(m).__name__ == "Pooling"), {})
+    # sentence-transformers < 3 spells the mode as one flag per mode
+    pooling_mode = pooling.get("pooling_mode") or ("cls" if pooling.get("pooling_mode_cls_token") else "mean")
+    if pooling_mode not in ("mean", "cls"):
+        raise ValueError(f"pooling mode {pooling_mode!r} is not supported by the ONNX encoder")
+
+    sample = tokenizer(["query: export sample"], return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic = {n: {0: "batch", 1: "seq"} for n in names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "seq"}
+
+    class Wrapper(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(names, args))).last_hidden_state
+
+    with torch.no_grad():
+        torch.onnx.export(
+            Wrapper(transformer), tuple(sample[n] for n in names), str(out_dir / "model.onnx"),
+            input_names=names, output_names=["last_hidden_state"], dynamic_axes=dynamic,
+            opset_version=opset, dynamo=False,
+        )
+    tokenizer.backend_tokenizer.save(str(out_dir / "tokenizer.json"))
+    (out_dir / "export.json").write_text(json.dumps({
+        "model": model_name,
+        "dim": st.get_sentence_embedding_dimension(),
+        "max_seq_length": st.max_seq_length,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "pooling": pooling_mode,
+    }, indent=2), encoding="utf-8")
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(out_dir / "model.onnx"), str(out_dir / "model.int8.onnx"), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+def main():
+    from app.rag import MODEL_NAME
+
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export", help="export the encoder to ONNX")
+    exp.add_argument("--model", default=MODEL_NAME)
+    exp.add_argument("--out", default=str(ONNX_DIR))
+    exp.add_argument("--quantize", action="store_true", help="also write a dynamic int8 model.int8.onnx")
+    args = ap.parse_args()
+
+    out = export_onnx(args.model, args.out, args.quantize)
+    print(f"Saved: {out}/")
+
+
+if __name__ == "__main__":
+    main()
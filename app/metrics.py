@@ -0,0 +1,149 @@
+"""
+Request tracing and Prometheus metrics, without a client library.
+
+A Trace collects seconds per stage and a few counts for one request; `observe()` folds
+it into process-wide histograms/counters that /metrics renders in the Prometheus text
+format. Like the cache counters, values are per worker process (scrape every worker).
+Set INFOHUB_METRICS=0 to skip tracing; requests that ask for debug output are traced anyway.
+"""
+import bisect
+import os
+import threading
+import time
+
+METRICS_ENABLED = os.environ.get("INFOHUB_METRICS", "1") != "0"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 500)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, values)) + "}"
+
+
+def _num(v):
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, v in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        for labels, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + ("+Inf",), counts):
+                cumulative += c
+                le = bound if bound == "+Inf" else _num(float(bound))
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("infohub_stage_seconds", "Time spent per request stage.", ("endpoint", "stage"))
+REQUEST_SECONDS = Histogram("infohub_request_seconds", "End-to-end request time.", ("endpoint", "outcome"))
+CANDIDATES = Histogram("infohub_retrieval_candidates", "Candidates scored per uncached retrieval.",
+                       ("source",), buckets=COUNT_BUCKETS)
+LLM_TOKENS = Counter("infohub_llm_tokens_total", "LLM tokens used.", ("kind",))
+SHARD_FAILURES = Counter("infohub_shard_failures_total", "Shard requests that failed or timed out.",
+                         ("shard", "reason"))
+
+_registry = [STAGE_SECONDS, REQUEST_SECONDS, CANDIDATES, LLM_TOKENS, SHARD_FAILURES]
+
+
+class Trace:
+    """Per-request stage timings (seconds) and counts; pass `stages`/`counts` down to retrieve()."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.counts = {}
+        self.usage = {}
+
+    def lap(self, stage, t0):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - t0
+        return now
+
+    def server_timing(self):
+        """Server-Timing header value, durations in milliseconds."""
+        return ", ".join(f"{stage};dur={1000 * sec:.2f}" for stage, sec in self.stages.items())
+
+    def debug(self):
+        return {
+            "timings_ms": {stage: round(1000 * sec, 3) for stage, sec in self.stages.items()},
+            "counts": dict(self.counts),
+            "usage": dict(self.usage),
+        }
+
+    def observe(self, outcome):
+        """Record the finished request in the process-wide metrics."""
+        self.stages["total"] = time.perf_counter() - self.start
+        if not METRICS_ENABLED:
+            return
+        for stage, sec in self.stages.items():
+            STAGE_SECONDS.observe(sec, self.endpoint, stage)
+        REQUEST_SECONDS.observe(self.stages["total"], self.endpoint, outcome)
+        for source, n in self.counts.items():
+            if source.endswith("_candidates"):
+                CANDIDATES.observe(n, source[: -len("_candidates")])
+        for kind, n in self.usage.items():
+            LLM_TOKENS.inc(kind, amount=n)
+
+
+def render(extra=()):
+    """Prometheus text exposition of every metric plus `extra` pre-rendered lines."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    lines += extra
+    return "\n".join(lines) + "\n"
+
+
+def cache_lines(cache_stats):
+    """Cache hit/miss counters from cache.stats()-style dicts, rendered at scrape time."""
+    lines = []
+    for name, key in (("infohub_cache_hits_total", "hits"), ("infohub_cache_misses_total", "misses")):
+        lines += [f"# HELP {name} Cache {key} per cache tier.", f"# TYPE {name} counter"]
+        lines += [f'{name}{{cache="{s["name"]}"}} {s[key]}' for s in cache_stats]
+    return lines
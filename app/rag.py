@@ -1,35 +1,365 @@
+import bisect
+from array import array
 import json
+import math
+import os
+import queue
 import re
-import numpy as np
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from pathlib import Path
+
 import faiss
-from sentence_transformers import SentenceTransformer
-from rank_bm25 import BM25Okapi
+import numpy as np
+
+from app import versions
+from app.cache import make_cache
+from app.embedder import EMBEDDER_BACKEND, embedder_id, load_embedder
 
 MODEL_NAME = "intfloat/multilingual-e5-base"
 
-_index = None
-_meta = None
+# Micro-batching of query encodes across concurrent requests (enabled by the API)
+QUERY_BATCH_MAX = 32
+QUERY_BATCH_WAIT = 0.003  # seconds the first request waits for company
+# retrieve_many(): questions scored per BM25/encoder/FAISS call
+RETRIEVE_MANY_BATCH = 256
+# warmup(): one query through every component before a worker takes traffic
+WARMUP_QUERY = "საბაჟო დეკლარაცია"
+
+# on-disk precision of the chunk embeddings used for the rerank (chosen at build time)
+VEC_DTYPES = ("float32", "float16", "int8")
+# chunks the FAISS index adds to the BM25 candidates per query; 0 keeps retrieval BM25-first only
+ANN_CANDIDATES = int(os.environ.get("INFOHUB_ANN_CANDIDATES", "0"))
+# set in a shard server process (app.shard): the shard of each index version it loads
+SERVE_SHARD = os.environ.get("INFOHUB_SHARD")
+CHUNKS_FORMAT_VERSION = 1
+BM25_FORMAT_VERSION = 1
+BM25_BLOCK_CELLS = 1 << 22  # query x doc scores held at once by BM25Index.top_k_many (32 MB)
+# bump whenever _tokenize changes, so stale prebuilt lexical indexes get rejected
+TOKENIZER_VERSION = 1
+
+_index = None  # ServingIndex new requests use; swap_index() replaces it whole
+_shards = None  # app.coordinator.ShardCoordinator when shard servers hold the index (use_shards)
 _embedder = None
-_bm25 = None
-_bm25_tokens = None
+_batcher = None
+_query_batching = False
+_loaded = None  # pid of the process load_store() completed in (forked workers inherit the globals)
+_embedder_pid = None
+_load_lock = threading.Lock()
+_swap_lock = threading.Lock()
+
+# query vectors depend only on the model; hits also on the index build
+_query_vec_cache = make_cache("query_vec", maxsize=4096, ttl=24 * 3600)
+_hits_cache = make_cache("retrieval", maxsize=2048, ttl=3600)
 
 
-def load_store():
-    global _index, _meta, _embedder, _bm25, _bm25_tokens
+def load_store(embedder: bool = True):
+    """
+    Load the CURRENT index version (and, with `embedder`, the query encoder).
+    Safe to call again in a forked worker: mapped artifacts and the torch model are kept
+    (their pages stay shared with the parent), threads and ONNX Runtime sessions are recreated.
+    """
+    global _index, _embedder, _batcher, _loaded, _embedder_pid
 
-    if _meta is None:
-        _meta = json.load(open("data/index_meta.json", "r", encoding="utf-8"))
+    # retrieve() runs on several API threads: fast path once loaded, else load exactly once
+    pid = os.getpid()
+    if _loaded == pid:
+        return
+    with _load_lock:
+        if _index is None and _shards is None:
+            _index = ServingIndex.load()
+        if not embedder:
+            return
+        # an ONNX Runtime session's thread pool does not survive fork: each process opens its own
+        if _embedder is None or (_embedder_pid != pid and EMBEDDER_BACKEND != "torch"):
+            _embedder = load_embedder(MODEL_NAME)  # torch or ONNX Runtime, per INFOHUB_EMBEDDER
+            _embedder_pid = pid
+        if _query_batching and (_batcher is None or _batcher.pid != pid):
+            _batcher = BatchingEncoder(_embedder)
+        _loaded = pid
 
-    # BM25 is built only from meta chunks; doesn't need FAISS at all
-    if _bm25 is None:
-        _bm25_tokens = [_tokenize(m["chunk"]) for m in _meta]
-        _bm25 = BM25Okapi(_bm25_tokens)
 
-    # Semantic components (optional rerank)
-    if _index is None:
-        _index = faiss.read_index("data/index.faiss")
-    if _embedder is None:
-        _embedder = SentenceTransformer(MODEL_NAME)
+def swap_index(version: str = None):
+    """
+    Load `version` (default: CURRENT) beside the serving index, warm it, then switch new
+    requests to it. Requests already running finish on the old one, which is unmapped once
+    the last of them lets go of it. Returns the version now served.
+    """
+    global _index
+    load_store(embedder=False)
+    if _shards is not None:
+        # shard servers swap on their own; ask them what they serve now
+        return _shards.refresh()
+    with _swap_lock:
+        version = version or versions.current()
+        if version is None or version == _index.version:
+            return _index.version
+        index = ServingIndex.load(version)
+        index.page_in()
+        index.warm()
+        _index = index
+        return version
+
+
+def watch_index(interval: float):
+    """Check CURRENT every `interval` seconds on a daemon thread and swap to each new version."""
+
+    def run():
+        failed = None
+        while True:
+            time.sleep(interval)
+            version = versions.current()
+            if version == failed:
+                continue
+            try:
+                swap_index(version)
+            except Exception as e:  # keep serving the loaded version; retry once CURRENT moves on
+                failed = version
+                print(f"index watch: cannot serve {version}: {e}", file=sys.stderr, flush=True)
+
+    threading.Thread(target=run, name="index-watch", daemon=True).start()
+
+
+def serving_version():
+    load_store()
+    return _index.version if _shards is None else _shards.version
+
+
+def shard_status():
+    """Each shard server's /status when serving from shards (use_shards), else None."""
+    return None if _shards is None else _shards.status()
+
+
+def use_shards(urls, timeout: float):
+    """
+    Serve retrieval from shard servers (app.shard, one per shard of a build made with
+    --shards) instead of a local index: each query goes to all of them in parallel and
+    their candidates are merged here. Call before the first retrieve.
+    """
+    global _shards
+    from app.coordinator import ShardCoordinator
+
+    _shards = ShardCoordinator(urls, timeout)
+
+
+def preload():
+    """
+    For a server that forks its workers (gunicorn --preload): load the index and, for the
+    torch backend, the model before forking, and read the artifacts into the page cache.
+    Workers then start on pages shared with this process instead of private copies.
+    """
+    load_store(embedder=EMBEDDER_BACKEND == "torch")
+    if _shards is None:
+        _index.page_in()
+
+
+def warmup():
+    """
+    Load everything and run one query through each component (encoder, BM25, FAISS), so a
+    worker's first request doesn't pay for lazy initialization. Bypasses the caches.
+    """
+    load_store()
+    swap_index()  # a worker forked from a long-running parent may have inherited an old version
+    _warmup_vector()
+    if _shards is None:
+        _index.warm()
+
+
+def _warmup_vector():
+    return np.asarray(_embedder.encode(["query: " + WARMUP_QUERY], normalize_embeddings=True), dtype="float32")
+
+
+def set_search_params(index, index_type, params):
+    """Apply query-time knobs recorded in the version manifest to a loaded (ID-mapped) FAISS index."""
+    if index_type == "hnsw" and "ef_search" in params:
+        faiss.downcast_index(index.index).hnsw.efSearch = params["ef_search"]
+    elif index_type in ("ivf_flat", "ivf_pq") and "nprobe" in params:
+        faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+
+
+class ChunkIdMap:
+    """Stable 63-bit chunk ids (what FAISS returns) -> rows of the chunk store / vector matrix."""
+
+    def __init__(self, ids):
+        self._order = np.argsort(ids, kind="stable")
+        self._sorted = ids[self._order]
+
+    def rows(self, ids):
+        ids = ids[ids >= 0]  # FAISS pads missing results with -1
+        pos = np.minimum(np.searchsorted(self._sorted, ids), len(self._sorted) - 1)
+        found = self._sorted[pos] == ids
+        return self._order[pos[found]]
+
+
+class ServingIndex:
+    """
+    One index version, loaded from its directory (see app.versions). Chunk text/titles/URLs,
+    BM25 postings, the embedding matrix and the FAISS index are all memory-mapped read-only:
+    nothing is decoded or paged in until a query needs it, and processes share the pages.
+    A request reads the module's current instance once, so it never mixes two versions.
+    """
+
+    def __init__(self, version, info, chunks, bm25, vecs, ann=None, ann_rows=None, shard=None, rows=None):
+        self.version = version
+        self.info = info
+        # cache keys use the build id, so a rebuild never serves stale hits (and a no-op one keeps them)
+        self.build_id = info["build_id"]
+        self.chunks = chunks
+        self.bm25 = bm25
+        self.vecs = vecs
+        self.ann = ann
+        self.ann_rows = ann_rows
+        self.shard = shard
+        self.rows = rows  # a shard's corpus-wide row of each of its rows
+
+    @property
+    def path(self):
+        return versions.path(self.version, self.shard)
+
+    @classmethod
+    def load(cls, version: str = None, shard=SERVE_SHARD):
+        """Load `version` (default: CURRENT), or just its shard `shard` of a sharded build."""
+        version = version or versions.current_path().name
+        info = versions.read_manifest(version)
+        if (shard is None) != (info.get("shards", 1) == 1):
+            raise ValueError(f"index version {version} has {info.get('shards', 1)} shard(s); "
+                             + ("start a shard server per shard (app.shard)" if shard is None
+                                else "a shard server needs a build made with --shards"))
+        path = versions.path(version, shard)
+        ann = ann_rows = None
+        # ANN index only when it feeds candidates; knobs (efSearch/nprobe) come from the build
+        if ANN_CANDIDATES > 0 and (path / versions.ANN_FILE).exists():
+            ann = faiss.read_index(str(path / versions.ANN_FILE), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            set_search_params(ann, info["index"]["type"], info["index"]["params"])
+            ann_rows = ChunkIdMap(np.load(path / versions.ANN_IDS_FILE))
+        return cls(
+            version, info,
+            ChunkStore.load(path / versions.CHUNKS_DIR),
+            BM25Index.load(path / versions.BM25_DIR),
+            VectorStore.load(path / versions.VECS_FILE),
+            ann, ann_rows, shard,
+            np.load(path / versions.ROWS_FILE, mmap_mode="r") if shard is not None else None,
+        )
+
+    def page_in(self):
+        """Start reading the artifacts in use into the page cache (asynchronous read-ahead)."""
+        if not hasattr(os, "posix_fadvise"):
+            return
+        for f in sorted(self.path.rglob("*")):
+            if not f.is_file() or (self.ann is None and f.name == versions.ANN_FILE):
+                continue
+            fd = os.open(f, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+
+    def warm(self):
+        """One query through BM25, the embedding matrix and FAISS (a stored vector stands in for the query)."""
+        top_idx, _ = self.bm25.top_k(_tokenize(WARMUP_QUERY), 1)
+        if not len(top_idx):
+            return
+        qvec = np.ascontiguousarray(self.vecs.reconstruct(top_idx), dtype="float32")
+        self.vecs.scores(top_idx, qvec[0])
+        if self.ann is not None:
+            self.ann.search(qvec, 1)
+
+
+class BatchingEncoder:
+    """
+    Collects concurrent query-encoding calls for up to `max_wait` seconds or `max_batch`
+    texts, encodes them in one forward pass on a background thread and hands each
+    caller its own row. Callers block in encode() like they would on the model itself.
+    """
+
+    def __init__(self, model, max_batch=QUERY_BATCH_MAX, max_wait=QUERY_BATCH_WAIT):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.SimpleQueue()
+        self.pid = os.getpid()  # the thread below only exists in this process
+        threading.Thread(target=self._run, name="query-encoder", daemon=True).start()
+
+    def encode(self, text):
+        fut = Future()
+        self._queue.put((text, fut))
+        return fut.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for text, _ in batch]
+            try:
+                vecs = self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True)
+                vecs = np.asarray(vecs, dtype="float32")
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), vec in zip(batch, vecs):
+                fut.set_result(vec)
+
+
+def enable_query_batching():
+    """Route query encodes through a shared BatchingEncoder (call before the first retrieve)."""
+    global _query_batching
+    _query_batching = True
+
+
+def index_version():
+    load_store()
+    return _index.build_id if _shards is None else _shards.build_id
+
+
+def normalize_question(question: str) -> str:
+    # cache key and encoder input alike: whitespace variants share one entry. Case is kept,
+    # it carries meaning for the encoder (acronyms, names); BM25 lowercases on its own
+    return " ".join(question.split())
+
+
+def encode_query(question: str):
+    """Normalized query embedding of normalize_question(question) (cached)."""
+    question = normalize_question(question)
+    key = (embedder_id(MODEL_NAME), question)
+    qvec = _query_vec_cache.get(key)
+    if qvec is None:
+        if _batcher is not None:
+            qvec = _batcher.encode("query: " + question)
+        else:
+            qvec = _embedder.encode(["query: " + question], normalize_embeddings=True)
+            qvec = np.asarray(qvec, dtype="float32")[0]
+        _query_vec_cache.set(key, qvec)
+    return qvec
+
+
+def encode_queries(questions):
+    """encode_query() for many questions: cache misses are encoded in one call."""
+    ident = embedder_id(MODEL_NAME)
+    keys = [(ident, normalize_question(q)) for q in questions]
+    vecs = [_query_vec_cache.get(key) for key in keys]
+    todo = list(dict.fromkeys(key for key, v in zip(keys, vecs) if v is None))
+    if todo:
+        new = _embedder.encode(["query: " + q for _, q in todo], batch_size=QUERY_BATCH_MAX,
+                               normalize_embeddings=True)
+        new = dict(zip(todo, np.asarray(new, dtype="float32")))
+        for key, v in new.items():
+            _query_vec_cache.set(key, v)
+        vecs = [new[key] if v is None else v for key, v in zip(keys, vecs)]
+    return np.stack(vecs) if vecs else np.empty((0, 0), dtype="float32")
 
 
 def _tokenize(s: str):
@@ -39,52 +369,814 @@ def _tokenize(s: str):
     return [t for t in s.split() if len(t) >= 2]
 
 
-def retrieve(question: str, k: int = 5, bm25_candidates: int = 60, use_semantic_rerank: bool = True):
+class StringTable:
+    """
+    Read-only list of strings kept as one UTF-8 blob plus an offsets array.
+    Both files are memory-mapped; a string is decoded only when indexed.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+    @staticmethod
+    def write(prefix, strings):
+        writer = StringTableWriter(prefix)
+        for s in strings:
+            writer.append(s)
+        writer.close()
+
+    @classmethod
+    def load(cls, prefix):
+        prefix = Path(prefix)
+        blob_path = prefix.with_suffix(".bin")
+        # np.memmap refuses empty files
+        if blob_path.stat().st_size:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            blob = np.zeros(0, dtype=np.uint8)
+        return cls(blob, np.load(prefix.with_suffix(".offsets.npy"), mmap_mode="r"))
+
+
+class StringTableWriter:
+    """Appends strings straight to a StringTable's blob file; offsets are written on close()."""
+
+    def __init__(self, prefix):
+        self.prefix = Path(prefix)
+        self.file = open(self.prefix.with_suffix(".bin"), "wb")
+        self.offsets = array("q", [0])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def append(self, s):
+        data = s.encode("utf-8")
+        self.file.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self.file.close()
+        np.save(self.prefix.with_suffix(".offsets.npy"), np.frombuffer(self.offsets, dtype=np.int64))
+
+
+class ChunkStore:
+    """
+    Columnar chunk metadata: chunk texts in one StringTable, URLs and titles
+    interned into their own tables and referenced per chunk by int32 ids.
+    """
+
+    def __init__(self, texts, urls, titles, url_ids, title_ids):
+        self.texts = texts
+        self.urls = urls
+        self.titles = titles
+        self.url_ids = url_ids
+        self.title_ids = title_ids
+
+    def __len__(self):
+        return len(self.url_ids)
+
+    def text(self, i):
+        return self.texts[i]
+
+    def url(self, i):
+        return self.urls[self.url_ids[i]]
+
+    def title(self, i):
+        return self.titles[self.title_ids[i]]
+
+    @staticmethod
+    def write(path, metas):
+        """metas: iterable of {"url", "title", "chunk"} dicts, in index row order."""
+        writer = ChunkStoreWriter(path)
+        for m in metas:
+            writer.append(m["url"], m["title"], m["chunk"])
+        writer.close()
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        header = json.loads((path / "header.json").read_text(encoding="utf-8"))
+        if header.get("format_version") != CHUNKS_FORMAT_VERSION:
+            raise ValueError(f"{path} has an unsupported format; rebuild it with `python -m ingest.build_index`.")
+        return cls(
+            StringTable.load(path / "text"),
+            StringTable.load(path / "urls"),
+            StringTable.load(path / "titles"),
+            np.load(path / "url_ids.npy", mmap_mode="r"),
+            np.load(path / "title_ids.npy", mmap_mode="r"),
+        )
+
+
+class ChunkStoreWriter:
+    """Streams chunks into a ChunkStore directory; only the URL/title interning stays in memory."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.texts = StringTableWriter(self.path / "text")
+        self.url_ids, self.title_ids = {}, {}
+        self.url_col, self.title_col = array("i"), array("i")
+
+    def __len__(self):
+        return len(self.texts)
+
+    def append(self, url, title, chunk):
+        self.url_col.append(self.url_ids.setdefault(url, len(self.url_ids)))
+        self.title_col.append(self.title_ids.setdefault(title, len(self.title_ids)))
+        self.texts.append(chunk)
+
+    def close(self):
+        path = self.path
+        self.texts.close()
+        StringTable.write(path / "urls", self.url_ids)
+        StringTable.write(path / "titles", self.title_ids)
+        np.save(path / "url_ids.npy", np.frombuffer(self.url_col, dtype=np.int32))
+        np.save(path / "title_ids.npy", np.frombuffer(self.title_col, dtype=np.int32))
+        header = {
+            "format_version": CHUNKS_FORMAT_VERSION,
+            "n_chunks": len(self.texts),
+            "n_urls": len(self.url_ids),
+            "n_titles": len(self.title_ids),
+        }
+        (path / "header.json").write_text(json.dumps(header, indent=2), encoding="utf-8")
+
+
+class VectorStore:
+    """
+    Chunk embedding matrix stored as float32, float16 or 8-bit codes with a per-dimension
+    scalar quantizer (vmin + code * scale, like FAISS SQ8). The codes are memory-mapped
+    and scored as they are: only the candidate rows are read and widened.
+    """
+
+    def __init__(self, codes, vmin=None, scale=None):
+        self.codes = codes
+        self.vmin = vmin
+        self.scale = scale
+
+    @property
+    def dtype(self):
+        return "int8" if self.scale is not None else self.codes.dtype.name
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def nbytes(self):
+        extra = 0 if self.scale is None else self.vmin.nbytes + self.scale.nbytes
+        return self.codes.nbytes + extra
+
+    def scores(self, rows, qvec):
+        """Inner products of rows `rows` with float32 `qvec`."""
+        block = np.asarray(self.codes[rows], dtype="float32")
+        if self.scale is None:
+            return block @ qvec
+        # (vmin + c * scale) . q  ==  c . (scale * q) + vmin . q
+        return block @ (self.scale * qvec) + float(self.vmin @ qvec)
+
+    def reconstruct(self, rows=slice(None)):
+        block = np.asarray(self.codes[rows], dtype="float32")
+        return block if self.scale is None else self.vmin + block * self.scale
+
+    @staticmethod
+    def quantize(vecs, dtype):
+        vecs = np.asarray(vecs, dtype="float32")
+        if dtype == "float32":
+            return VectorStore(vecs)
+        if dtype == "float16":
+            return VectorStore(vecs.astype("float16"))
+        if dtype != "int8":
+            raise ValueError(f"unknown vector dtype {dtype!r}; expected one of {VEC_DTYPES}")
+        vmin, scale = VectorStore._sq_params([vecs] if len(vecs) else [], vecs.shape[1])
+        return VectorStore(VectorStore._sq_codes(vecs, vmin, scale), vmin, scale)
+
+    @staticmethod
+    def _sq_params(blocks, dim):
+        """Per-dimension (vmin, scale) spanning every row of `blocks` in 255 steps."""
+        vmin = vmax = None
+        for block in blocks:
+            lo, hi = block.min(axis=0), block.max(axis=0)
+            vmin = lo if vmin is None else np.minimum(vmin, lo)
+            vmax = hi if vmax is None else np.maximum(vmax, hi)
+        if vmin is None:
+            vmin, vmax = np.zeros(dim, dtype="float32"), np.ones(dim, dtype="float32")
+        span = vmax - vmin
+        return vmin.astype("float32"), np.where(span > 0, span / 255, 1.0).astype("float32")
+
+    @staticmethod
+    def _sq_codes(block, vmin, scale):
+        return np.clip(np.rint((block - vmin) / scale), 0, 255).astype(np.uint8)
+
+    @staticmethod
+    def write(path, vecs, dtype, block_rows=65536):
+        """
+        quantize(vecs, dtype).save(path) for a (memory-mapped) float32 matrix too large to
+        copy: rows are converted and written `block_rows` at a time. Returns the loaded store.
+        """
+        path = Path(path)
+        if dtype not in VEC_DTYPES:
+            raise ValueError(f"unknown vector dtype {dtype!r}; expected one of {VEC_DTYPES}")
+        n, dim = vecs.shape
+        blocks = [slice(a, min(n, a + block_rows)) for a in range(0, n, block_rows)]
+        vmin = scale = None
+        if dtype == "int8":
+            vmin, scale = VectorStore._sq_params((np.asarray(vecs[s], dtype="float32") for s in blocks), dim)
+
+        codes = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8 if dtype == "int8" else dtype,
+                                          shape=(n, dim))
+        for s in blocks:
+            block = np.asarray(vecs[s], dtype="float32")
+            codes[s] = VectorStore._sq_codes(block, vmin, scale) if scale is not None else block
+        codes.flush()
+        del codes
+        VectorStore(None, vmin, scale)._save_params(path)
+        return VectorStore.load(path)
+
+    def save(self, path):
+        path = Path(path)
+        np.save(path, self.codes)
+        self._save_params(path)
+
+    def _save_params(self, path):
+        sq_path = Path(path).with_suffix(".sq.npy")
+        if self.scale is not None:
+            np.save(sq_path, np.stack([self.vmin, self.scale]))
+        elif sq_path.exists():
+            sq_path.unlink()
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        codes = np.load(path, mmap_mode="r")
+        if codes.dtype == np.uint8:
+            vmin, scale = np.load(path.with_suffix(".sq.npy"))
+            return cls(codes, vmin, scale)
+        return cls(codes)
+
+
+class SortedVocab:
+    """
+    term -> term id lookup over a sorted StringTable (binary search, the vocabulary is never
+    loaded into a dict). Recently looked-up query terms are memoized in a bounded one.
+    """
+
+    MEMO_SIZE = 50_000
+
+    def __init__(self, terms):
+        self.terms = terms
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.terms)
+
+    def get(self, term):
+        try:
+            return self._memo[term]
+        except KeyError:
+            pass
+        i = bisect.bisect_left(self.terms, term)
+        found = i if i < len(self.terms) and self.terms[i] == term else None
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[term] = found
+        return found
+
+
+class BM25Builder:
+    """
+    Collects BM25Index postings one document at a time, in typed arrays (a few bytes
+    per posting), so an index build can stream documents instead of holding their tokens.
+    """
+
+    def __init__(self):
+        self.vocab = {}
+        self.terms = array("q")
+        self.docs = array("i")
+        self.tfs = array("q")
+        self.doc_len = array("q")
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    def add(self, tokens):
+        d = len(self.doc_len)
+        self.doc_len.append(len(tokens))
+        for term, tf in Counter(tokens).items():
+            self.terms.append(self.vocab.setdefault(term, len(self.vocab)))
+            self.docs.append(d)
+            self.tfs.append(tf)
+
+    def finish(self, k1=1.5, b=0.75, epsilon=0.25):
+        return BM25Index.from_postings(self.vocab, np.frombuffer(self.terms, dtype=np.int64),
+                                       np.frombuffer(self.docs, dtype=np.int32),
+                                       np.frombuffer(self.tfs, dtype=np.int64),
+                                       np.frombuffer(self.doc_len, dtype=np.int64), k1, b, epsilon)
+
+
+class BM25Index:
+    """
+    BM25Okapi over an inverted index (scores match rank_bm25.BM25Okapi).
+
+    Postings are CSR arrays: term t owns doc_ids[indptr[t]:indptr[t + 1]],
+    and weights[...] holds the precomputed tf/length part of the formula,
+    so a query only touches the postings of its own terms.
+    """
+
+    def __init__(self, vocab, indptr, doc_ids, tfs, weights, idf, doc_len, avgdl, k1=1.5, b=0.75, epsilon=0.25):
+        self.vocab = vocab  # term -> term id (dict, or SortedVocab when loaded)
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.weights = weights
+        self.idf = idf
+        self.doc_len = doc_len
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.n_docs = len(doc_len)
+
+    @classmethod
+    def build(cls, corpus_tokens, k1=1.5, b=0.75, epsilon=0.25):
+        builder = BM25Builder()
+        for tokens in corpus_tokens:
+            builder.add(tokens)
+        return builder.finish(k1, b, epsilon)
+
+    @classmethod
+    def from_postings(cls, vocab, post_terms, post_docs, post_tfs, doc_len, k1=1.5, b=0.75, epsilon=0.25):
+        """Index from unordered (term id, doc id, tf) postings; see BM25Builder."""
+        n_docs = len(doc_len)
+        doc_len = np.asarray(doc_len, dtype=np.int64)
+
+        # group postings by term; stable sort keeps doc ids ascending inside a term
+        terms = np.asarray(post_terms, dtype=np.int64)
+        order = np.argsort(terms, kind="stable")
+        doc_ids = np.asarray(post_docs, dtype=np.int32)[order]
+        tfs = np.asarray(post_tfs, dtype=np.int64)[order]
+        df = np.bincount(terms, minlength=len(vocab))
+        indptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        # Same idf (incl. epsilon floor for negative values) and arithmetic
+        # order as rank_bm25, so scores are bit-for-bit comparable.
+        idf = np.empty(len(vocab), dtype=np.float64)
+        idf_sum = 0
+        for t, freq in enumerate(df.tolist()):
+            idf[t] = math.log(n_docs - freq + 0.5) - math.log(freq + 0.5)
+            idf_sum += idf[t]
+        eps = epsilon * idf_sum / max(len(vocab), 1)
+        idf[idf < 0] = eps
+
+        avgdl = int(doc_len.sum()) / max(n_docs, 1)
+        weights = tfs * (k1 + 1) / (tfs + k1 * (1 - b + b * doc_len[doc_ids] / avgdl))
+
+        return cls(vocab, indptr, doc_ids, tfs, weights, idf, doc_len, avgdl, k1, b, epsilon)
+
+    def subset(self, rows):
+        """
+        Index of just the docs `rows` (ascending), renumbered 0..len(rows)-1. idf and the
+        length normalization stay the whole corpus's, so every doc scores exactly as it does
+        here, and the renumbering keeps the id order top_k breaks ties by: top-n lists of
+        disjoint subsets (shards) merge, by score then original id, into this index's top n.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        if np.any(np.diff(rows) <= 0):
+            raise ValueError("subset rows must be strictly ascending")
+        local = np.full(self.n_docs, -1, dtype=np.int64)
+        local[rows] = np.arange(len(rows))
+        keep = local[self.doc_ids] >= 0
+        n_terms = len(self.indptr) - 1
+        df = np.bincount(np.repeat(np.arange(n_terms), np.diff(self.indptr))[keep], minlength=n_terms)
+        present = np.flatnonzero(df)
+        term_ids = np.full(n_terms, -1, dtype=np.int64)
+        term_ids[present] = np.arange(len(present))
+        vocab = {t: int(term_ids[i]) for t, i in self.vocab.items() if term_ids[i] >= 0}
+        indptr = np.zeros(len(present) + 1, dtype=np.int64)
+        np.cumsum(df[present], out=indptr[1:])
+        return BM25Index(vocab, indptr, local[self.doc_ids[keep]].astype(np.int32), self.tfs[keep],
+                         self.weights[keep], self.idf[present], self.doc_len[rows], self.avgdl,
+                         self.k1, self.b, self.epsilon)
+
+    def save(self, path):
+        """
+        Write the index as flat arrays + a versioned header; load() memory-maps them.
+        Terms are stored sorted so lookups can binary-search the mapped vocabulary.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+
+        terms = sorted(self.vocab)
+        old_ids = np.fromiter((self.vocab.get(t) for t in terms), dtype=np.int64, count=len(terms))
+        lens = np.diff(self.indptr)[old_ids]
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(lens, out=indptr[1:])
+        # position of every posting in the old layout, segment by segment
+        gather = np.repeat(self.indptr[old_ids] - indptr[:-1], lens) + np.arange(indptr[-1])
+
+        StringTable.write(path / "vocab", terms)
+        np.save(path / "indptr.npy", indptr)
+        np.save(path / "doc_ids.npy", np.asarray(self.doc_ids)[gather])
+        np.save(path / "tfs.npy", np.asarray(self.tfs)[gather])
+        np.save(path / "weights.npy", np.asarray(self.weights)[gather])
+        np.save(path / "idf.npy", np.asarray(self.idf)[old_ids])
+        np.save(path / "doc_len.npy", np.asarray(self.doc_len))
+        header = {
+            "format_version": BM25_FORMAT_VERSION,
+            "tokenizer_version": TOKENIZER_VERSION,
+            "n_docs": self.n_docs,
+            "n_terms": len(terms),
+            "n_postings": int(indptr[-1]),
+            "avgdl": self.avgdl,
+            "k1": self.k1,
+            "b": self.b,
+            "epsilon": self.epsilon,
+        }
+        # header last: its presence marks a complete index
+        (path / "header.json").write_text(json.dumps(header, indent=2), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        header = json.loads((path / "header.json").read_text(encoding="utf-8"))
+        if header.get("format_version") != BM25_FORMAT_VERSION or header.get("tokenizer_version") != TOKENIZER_VERSION:
+            raise ValueError(
+                f"{path} was built with an incompatible BM25 format/tokenizer; "
+                "rebuild it with `python -m ingest.build_index`."
+            )
+
+        def arr(name):
+            return np.load(path / f"{name}.npy", mmap_mode="r")
+
+        return cls(
+            SortedVocab(StringTable.load(path / "vocab")),
+            arr("indptr"), arr("doc_ids"), arr("tfs"), arr("weights"), arr("idf"), arr("doc_len"),
+            header["avgdl"], header["k1"], header["b"], header["epsilon"],
+        )
+
+    def _postings(self, q_tokens):
+        # repeated query terms count once per occurrence, like rank_bm25
+        term_ids = [t for t in map(self.vocab.get, q_tokens) if t is not None]
+        if not term_ids:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+        spans = [(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        docs = np.concatenate([self.doc_ids[s:e] for s, e in spans])
+        contrib = np.concatenate([self.idf[t] * self.weights[s:e] for t, (s, e) in zip(term_ids, spans)])
+        return docs, contrib
+
+    def get_scores(self, q_tokens):
+        """Dense scores for every doc (same output as BM25Okapi.get_scores)."""
+        docs, contrib = self._postings(q_tokens)
+        return np.bincount(docs, weights=contrib, minlength=self.n_docs)
+
+    def scores_for(self, q_tokens, doc_ids):
+        """Scores for just `doc_ids` (any order), touching only the query terms' postings."""
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        docs, contrib = self._postings(q_tokens)
+        order = np.argsort(doc_ids)
+        sorted_ids = doc_ids[order]
+        pos = np.minimum(np.searchsorted(sorted_ids, docs), max(len(doc_ids) - 1, 0))
+        hit = sorted_ids[pos] == docs if len(doc_ids) else np.zeros(len(docs), dtype=bool)
+        return np.bincount(order[pos[hit]], weights=contrib[hit], minlength=len(doc_ids))
+
+    def top_k(self, q_tokens, n):
+        """
+        Top-n doc ids and scores, best first (ties broken by lower doc id).
+        Work is proportional to the postings touched; docs without any query
+        term only get scanned for when fewer than n docs matched (score 0 padding).
+        """
+        docs, contrib = self._postings(q_tokens)
+        touched, inv = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inv, weights=contrib, minlength=len(touched))
+
+        if len(touched) > n:
+            part = _top_positions(scores, n)  # touched is ascending: ties go to lower doc ids
+            touched, scores = touched[part], scores[part]
+        elif len(touched) < n:
+            untouched = np.ones(self.n_docs, dtype=bool)
+            untouched[touched] = False
+            pad = np.flatnonzero(untouched)[: n - len(touched)]
+            touched = np.concatenate([touched, pad])
+            scores = np.concatenate([scores, np.zeros(len(pad))])
+
+        order = np.lexsort((touched, -scores))
+        return touched[order], scores[order]
+
+    def get_scores_many(self, queries_tokens):
+        """Dense (query x doc) scores: the batch's postings summed in one sparse product."""
+        postings = [self._postings(q) for q in queries_tokens]
+        lengths = [len(d) for d, _ in postings]
+        docs = np.concatenate([d for d, _ in postings] + [np.empty(0, dtype=np.int32)])
+        contrib = np.concatenate([c for _, c in postings] + [np.empty(0)])
+        rows = np.repeat(np.arange(len(postings), dtype=np.int64), lengths)
+        scores = np.bincount(rows * self.n_docs + docs, weights=contrib, minlength=len(postings) * self.n_docs)
+        return scores.reshape(len(postings), self.n_docs)
+
+    def top_k_many(self, queries_tokens, n):
+        """top_k() for a batch of queries, scored BM25_BLOCK_CELLS query x doc cells at a time."""
+        n = min(n, self.n_docs)
+        if n <= 0:  # as top_k: nothing asked for (or an empty index), nothing to score
+            return [(np.empty(0, dtype=np.int64), np.empty(0)) for _ in queries_tokens]
+        block = max(1, BM25_BLOCK_CELLS // max(self.n_docs, 1))
+        results = []
+        for start in range(0, len(queries_tokens), block):
+            tokens = queries_tokens[start:start + block]
+            scores = self.get_scores_many(tokens)
+            part = np.stack([_top_positions(row, n) for row in scores])
+            top = np.take_along_axis(scores, part, axis=1)
+            order = np.lexsort((part, -top))
+            part, top = np.take_along_axis(part, order, axis=1), np.take_along_axis(top, order, axis=1)
+            for q, ids, sc in zip(tokens, part, top):
+                # fewer than n matching docs: top_k decides which zero-score docs pad the list
+                results.append((ids, sc) if sc[-1] > 0 else self.top_k(q, n))
+        return results
+
+
+def _top_positions(scores, n):
+    """
+    Positions of the n highest `scores` (any order). Of the scores tied at the cutoff the
+    lowest positions are taken, so the result is deterministic, unlike argpartition's pick.
+    """
+    if len(scores) <= n:
+        return np.arange(len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    kth = np.partition(scores, len(scores) - n)[len(scores) - n]
+    above = np.flatnonzero(scores > kth)
+    return np.concatenate([above, np.flatnonzero(scores == kth)[: n - len(above)]])
+
+
+def retrieve(question: str, k: int = 5, bm25_candidates: int = 60, use_semantic_rerank: bool = True,
+             semantic_candidates: int = None, timings: dict = None, counts: dict = None):
     """
     BM25-first retrieval:
     1) Rank ALL chunks by BM25 (keyword relevance)
     2) Take top N candidates (e.g., 60)
-    3) (Optional) rerank those candidates by semantic similarity
+    3) (Optional) add the ANN index's top `semantic_candidates` chunks (default ANN_CANDIDATES)
+    4) (Optional) rerank those candidates by semantic similarity
+    Results are cached per (index build, normalized question, parameters).
+    Seconds spent per stage are added to `timings` and candidate counts set in `counts`,
+    if given (nothing on a cache hit).
+    """
+    load_store()
+    if _shards is not None:
+        return _retrieve_sharded(_shards, question, k, bm25_candidates, use_semantic_rerank,
+                                 semantic_candidates, timings, counts)
+    index = _index  # one version for the whole request, even if a swap lands meanwhile
+    if semantic_candidates is None:
+        semantic_candidates = ANN_CANDIDATES
+    if index.ann is None or not use_semantic_rerank:
+        semantic_candidates = 0
+
+    key = (index.build_id, normalize_question(question), k, bm25_candidates, use_semantic_rerank,
+           semantic_candidates)
+    hits = _hits_cache.get(key)
+    if hits is None:
+        hits = _retrieve(index, question, k, bm25_candidates, use_semantic_rerank, semantic_candidates,
+                         timings, counts)
+        _hits_cache.set(key, hits)
+    # callers may annotate hits; never hand out the cached dicts themselves
+    return [dict(h) for h in hits]
+
+
+def retrieve_many(questions, k: int = 5, bm25_candidates: int = 60, use_semantic_rerank: bool = True,
+                  semantic_candidates: int = None):
+    """
+    retrieve() for many questions, same results and cache: the misses are tokenized and
+    BM25-scored per batch in one pass, encoded in one model call and searched in one FAISS call.
+    With shard servers (use_shards) each question is retrieved on its own.
     """
     load_store()
+    if _shards is not None:
+        if use_semantic_rerank:
+            encode_queries(questions)  # one model call
+        return [retrieve(q, k, bm25_candidates, use_semantic_rerank, semantic_candidates) for q in questions]
+    index = _index
+    questions = [normalize_question(q) for q in questions]
+    if semantic_candidates is None:
+        semantic_candidates = ANN_CANDIDATES
+    if index.ann is None or not use_semantic_rerank:
+        semantic_candidates = 0
+
+    def key(q):
+        return (index.build_id, q, k, bm25_candidates, use_semantic_rerank, semantic_candidates)
+
+    results = [_hits_cache.get(key(q)) for q in questions]
+    todo = list(dict.fromkeys(q for q, hits in zip(questions, results) if hits is None))
+    found = {}
+    for start in range(0, len(todo), RETRIEVE_MANY_BATCH):
+        batch = todo[start:start + RETRIEVE_MANY_BATCH]
+        tokens = [_tokenize(q) for q in batch]
+        tops = index.bm25.top_k_many(tokens, bm25_candidates)
+        qvecs = encode_queries(batch) if use_semantic_rerank else None
+        if semantic_candidates:
+            _, ann_ids = index.ann.search(qvecs, semantic_candidates)
+        for j, q in enumerate(batch):
+            top_idx, top_scores = tops[j]
+            if semantic_candidates:
+                top_idx, top_scores, _ = _add_ann_candidates(index, tokens[j], top_idx, top_scores, ann_ids[j])
+            found[q] = _rank(index, top_idx, top_scores, qvecs[j] if use_semantic_rerank else None, k)
+            _hits_cache.set(key(q), found[q])
 
+    return [[dict(h) for h in (hits if hits is not None else found[q])] for q, hits in zip(questions, results)]
+
+
+def with_neighbours(hits):
+    """
+    Set each hit's "neighbours": the chunks just before and after it that belong to the same
+    URL and aren't hits themselves, as [{"idx", "chunk"}], for build_context to merge into
+    the hit's passage. Returns `hits`.
+    """
+    load_store()
+    have = {h["idx"] for h in hits}
+    want = {}  # neighbour row -> the hit it must share a URL with
+    for h in hits:
+        h["neighbours"] = []
+        for row in (h["idx"] - 1, h["idx"] + 1):
+            if row >= 0 and row not in have:
+                want[row] = h
+    if not want:
+        return hits
+    if _shards is not None:
+        found = _shards.chunks(sorted(want))
+    else:
+        index = _index
+        found = [{"idx": row, "url": index.chunks.url(row), "chunk": index.chunks.text(row)}
+                 for row in sorted(want) if row < len(index.chunks)]
+    for c in found:
+        h = want[c["idx"]]
+        if c["url"] == h["url"]:
+            h["neighbours"].append({"idx": c["idx"], "chunk": c["chunk"]})
+    return hits
+
+
+def _lap(timings, stage, t0):
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - t0
+    return now
+
+
+def _retrieve(index, question: str, k: int, bm25_candidates: int, use_semantic_rerank: bool,
+              semantic_candidates: int = 0, timings: dict = None, counts: dict = None):
+    t = time.perf_counter()
     q_tokens = _tokenize(question)
-    bm25_scores = _bm25.get_scores(q_tokens)
+    t = _lap(timings, "tokenize", t)
+    # Take top bm25 indices (only the query terms' postings are scored)
+    top_idx, top_scores = index.bm25.top_k(q_tokens, bm25_candidates)
+    t = _lap(timings, "bm25", t)
+    if counts is not None:
+        counts["bm25_candidates"] = len(top_idx)
+
+    if use_semantic_rerank:
+        qvec = encode_query(question)
+        t = _lap(timings, "encode", t)
+
+    if semantic_candidates:
+        _, ann_ids = index.ann.search(qvec.reshape(1, -1), semantic_candidates)
+        top_idx, top_scores, n_extra = _add_ann_candidates(index, q_tokens, top_idx, top_scores, ann_ids[0])
+        t = _lap(timings, "ann", t)
+        if counts is not None:
+            counts["ann_candidates"] = n_extra
 
-    # Take top bm25 indices
-    top_idx = np.argsort(bm25_scores)[::-1][:bm25_candidates]
+    return _rank(index, top_idx, top_scores, qvec if use_semantic_rerank else None, k, timings, t)
 
+
+def _retrieve_sharded(shards, question, k, bm25_candidates, use_semantic_rerank, semantic_candidates,
+                      timings=None, counts=None):
+    # hits are cached only when every shard answered, all from the build the key names
+    normalized = normalize_question(question)
+    if semantic_candidates is None:
+        semantic_candidates = ANN_CANDIDATES
+    if not use_semantic_rerank:
+        semantic_candidates = 0
+    key = (shards.build_id, normalized, k, bm25_candidates, use_semantic_rerank, semantic_candidates)
+    hits = _hits_cache.get(key)
+    if hits is None:
+        t = time.perf_counter()
+        qvec = None
+        if use_semantic_rerank:
+            qvec = encode_query(question)
+            t = _lap(timings, "encode", t)
+        hits, build_id = shards.retrieve(normalized, qvec, k, bm25_candidates, semantic_candidates, timings, counts, t)
+        if build_id is not None and build_id == key[0]:
+            _hits_cache.set(key, hits)
+    return [dict(h) for h in hits]
+
+
+def shard_search(question: str, qvec=None, bm25_candidates: int = 60, semantic_candidates: int = 0):
+    """
+    A shard server's part of a sharded retrieve() (see app.coordinator): the shard's top
+    `bm25_candidates` chunks by BM25, which scores with the whole corpus's statistics, plus
+    its FAISS index's top `semantic_candidates` if it loaded one. Each candidate comes with
+    its corpus-wide row, URL, BM25 and semantic score (if `qvec`) and FAISS score; the text
+    of the final hits is fetched afterwards with shard_chunks().
+    """
+    if _index is None:
+        load_store(embedder=False)
+    index = _index
+    q_tokens = _tokenize(normalize_question(question))
+    top_idx, top_scores = index.bm25.top_k(q_tokens, bm25_candidates)
+    n_bm25 = len(top_idx)
+    ann_scores = {}
+    if semantic_candidates and qvec is not None and index.ann is not None:
+        dists, ann_ids = index.ann.search(qvec.reshape(1, -1), semantic_candidates)
+        found = ann_ids[0] >= 0
+        ann_scores = dict(zip(index.ann_rows.rows(ann_ids[0]).tolist(), dists[0][found].tolist()))
+        top_idx, top_scores, _ = _add_ann_candidates(index, q_tokens, top_idx, top_scores, ann_ids[0])
+    sem_scores = index.vecs.scores(top_idx, qvec) if qvec is not None else None
+
+    candidates = []
+    for j, (i, score) in enumerate(zip(top_idx.tolist(), top_scores)):
+        candidates.append({
+            "idx": int(index.rows[i]),
+            "bm25": float(score),
+            "semantic": None if sem_scores is None else float(sem_scores[j]),
+            "ann": ann_scores.get(i),
+            "in_bm25": j < n_bm25,
+            "url": index.chunks.url(i),
+        })
+    return {"version": index.version, "build_id": index.build_id, "candidates": candidates}
+
+
+def shard_chunks(rows, version: str = None, partial: bool = False):
+    """
+    Title, URL and text of the shard's chunks at corpus-wide `rows`, from `version` if it is
+    still served. Rows the shard doesn't hold raise ValueError, or are skipped if `partial`.
+    """
+    index = _index
+    if version is not None and version != index.version:
+        raise ValueError(f"shard serves {index.version}, not {version}")
+    rows = np.asarray(rows, dtype=np.int64)
+    local = np.searchsorted(index.rows, rows)
+    held = local < len(index.rows)
+    held[held] = index.rows[local[held]] == rows[held]
+    if not held.all():
+        if not partial:
+            raise ValueError("rows not in this shard")
+        rows, local = rows[held], local[held]
+    return [{"idx": r, "title": index.chunks.title(i), "url": index.chunks.url(i), "chunk": index.chunks.text(i)}
+            for r, i in zip(rows.tolist(), local.tolist())]
+
+
+def _add_ann_candidates(index, q_tokens, top_idx, top_scores, ann_ids):
+    # Dense recall for paraphrases BM25 misses; their BM25 scores are filled in for mixing
+    extra = np.setdiff1d(index.ann_rows.rows(ann_ids), top_idx)
+    if len(extra):
+        top_idx = np.concatenate([top_idx, extra])
+        top_scores = np.concatenate([top_scores, index.bm25.scores_for(q_tokens, extra)])
+    return top_idx, top_scores, len(extra)
+
+
+def _rank(index, top_idx, top_scores, qvec, k, timings=None, t=None):
+    """Mix BM25 with semantic scores (if `qvec`), de-dupe by URL, decode the top k."""
+    if t is None:
+        t = time.perf_counter()
+    # candidates carry only ids; text/title/url are decoded for the final hits
+    url_ids = index.chunks.url_ids[top_idx]
     candidates = []
-    for idx in top_idx:
-        m = _meta[idx]
+    for idx, score, url_id in zip(top_idx, top_scores, url_ids):
         candidates.append({
             "idx": int(idx),
-            "bm25": float(bm25_scores[idx]),
-            "title": m["title"],
-            "url": m["url"],
-            "chunk": m["chunk"],
+            "bm25": float(score),
+            "url_id": int(url_id),
         })
 
-    if use_semantic_rerank:
-        # compute semantic similarity only for these candidates
-        qvec = _embedder.encode(["query: " + question], normalize_embeddings=True)
-        qvec = np.asarray(qvec, dtype="float32")
+    sem_scores = None
+    if qvec is not None:
+        # Exact cosine scores for just the candidate rows (vectors are normalized)
+        rows = np.fromiter((c["idx"] for c in candidates), dtype=np.int64, count=len(candidates))
+        sem_scores = index.vecs.scores(rows, qvec)
+    _combine(candidates, sem_scores)
+    t = _lap(timings, "rerank", t)
 
-        # We need vectors for these indices; FAISS IndexFlatIP doesn't support direct fetch,
-        # so we approximate by searching FAISS widely and mapping scores.
-        # Simple trick: build a dict of semantic scores for many nearest neighbors.
-        sem_k = max(400, bm25_candidates * 5)
-        sem_scores, sem_idxs = _index.search(qvec, sem_k)
-        sem_map = {int(i): float(s) for s, i in zip(sem_scores[0], sem_idxs[0])}
+    final = _dedupe(candidates, "url_id", k)
+    for c in final:
+        i = c["idx"]
+        c["title"] = index.chunks.title(i)
+        c["url"] = index.chunks.url(i)
+        c["chunk"] = index.chunks.text(i)
+    _lap(timings, "dedupe", t)
 
+    return final
+
+
+def _combine(candidates, sem_scores=None):
+    """Set each candidate's "semantic" and "combined" score and sort them best first."""
+    if sem_scores is not None:
         # Normalize BM25 for mixing
         bm_vals = [c["bm25"] for c in candidates]
         bm_min, bm_max = min(bm_vals), max(bm_vals)
         denom = (bm_max - bm_min) if (bm_max - bm_min) > 1e-9 else 1.0
 
-        for c in candidates:
+        for c, sem in zip(candidates, sem_scores):
             bm_norm = (c["bm25"] - bm_min) / denom
-            sem = sem_map.get(c["idx"], 0.0)  # 0 if not in sem neighbors
+            sem = float(sem)
             c["semantic"] = sem
             # combine: keyword heavy + semantic support
             c["combined"] = 0.75 * bm_norm + 0.25 * max(0.0, sem)
@@ -95,20 +1187,20 @@ def retrieve(question: str, k: int = 5, bm25_candidates: int = 60, use_semantic_
 
     candidates.sort(key=lambda x: x["combined"], reverse=True)
 
+
+def _dedupe(candidates, field, k):
     # de-dupe by URL so results cover multiple docs
     final = []
     seen = set()
     for c in candidates:
-        if c["url"] in seen:
+        if c[field] in seen:
             continue
-        seen.add(c["url"])
+        seen.add(c[field])
         final.append(c)
         if len(final) >= k:
             break
-
     return final
 
-
 if __name__ == "__main__":
     print("BM25-first Retrieval Test")
     q = input("კითხვა (Georgian): ").strip()
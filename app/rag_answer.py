@@ -1,5 +1,6 @@
 from openai import OpenAI
-from app.rag import retrieve  # uses your retrieval code
+from app.context import build_context, format_context
+from app.rag import retrieve, with_neighbours  # uses your retrieval code
 
 SYSTEM_PROMPT = """შენ ხარ საქართველოს საბაჟო ინფორმაციის ასისტენტი.
 შენ აუცილებლად უნდა უპასუხო ქართულად.
@@ -11,26 +12,18 @@ SYSTEM_PROMPT = """შენ ხარ საქართველოს სა
 4) არ დაამატო სხვა ბმულები; მხოლოდ infohub.rs.ge დომენი.
 """
 
-def build_context(hits):
-    # Keep context tight to control cost and reduce confusion
-    blocks = []
-    for i, h in enumerate(hits, start=1):
-        blocks.append(
-            f"[{i}] TITLE: {h['title']}\nURL: {h['url']}\nTEXT: {h['chunk']}\n"
-        )
-    return "\n".join(blocks)
-
 def main():
     client = OpenAI()
 
     question = input("კითხვა (Georgian): ").strip()
-    hits = retrieve(question, k=5)
+    hits = with_neighbours(retrieve(question, k=5))
 
     if not hits:
         print("\nვერ მოიძებნა შესაბამისი წყაროები.\n")
         return
 
-    context = build_context(hits)
+    # Keep context tight to control cost and reduce confusion
+    context = format_context(build_context(question, hits), with_source=True)
 
     user_prompt = f"""კონტექსტი (InfoHub ამონარიდები):
 {context}
@@ -0,0 +1,103 @@
+"""
+Semantic answer cache: reuse an answer for a paraphrased question.
+
+Past question embeddings sit in a small FAISS inner-product index. A new question
+hits when a cached one is within `threshold` cosine similarity, was answered on the
+same index build, and retrieval returned the same set of source URLs for it.
+"""
+import os
+import threading
+import time
+
+import faiss
+import numpy as np
+
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("INFOHUB_SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_SIZE = 2048
+SEMANTIC_CACHE_TTL = 6 * 3600
+SEMANTIC_CACHE_PROBE = 5  # neighbours checked for a matching source set
+
+
+class SemanticCache:
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, maxsize=SEMANTIC_CACHE_SIZE, ttl=SEMANTIC_CACHE_TTL):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None  # created on first add, once the embedding dim is known
+        self._entries = {}  # id -> entry dict
+        self._next_id = 0
+
+    def lookup(self, qvec, sources, version):
+        """Cached value for a near-duplicate question, or None. `qvec` must be L2-normalized."""
+        with self._lock:
+            if self._index is None or not self._entries:
+                self.misses += 1
+                return None
+            now = time.monotonic()
+            sims, ids = self._index.search(np.asarray(qvec, dtype="float32").reshape(1, -1), SEMANTIC_CACHE_PROBE)
+            key = frozenset(sources)
+            for sim, i in zip(sims[0], ids[0]):
+                if i < 0 or sim < self.threshold:
+                    break  # results are sorted by similarity
+                entry = self._entries.get(int(i))
+                if entry is None or entry["expires"] < now:
+                    continue
+                if entry["version"] == version and entry["sources"] == key:
+                    entry["used"] = now
+                    self.hits += 1
+                    return entry["value"]
+            self.misses += 1
+            return None
+
+    def add(self, question, qvec, sources, version, value):
+        qvec = np.asarray(qvec, dtype="float32").reshape(1, -1)
+        with self._lock:
+            if self._index is None:
+                self._index = faiss.IndexIDMap(faiss.IndexFlatIP(qvec.shape[1]))
+            now = time.monotonic()
+            self._evict(now)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(qvec, np.array([entry_id], dtype=np.int64))
+            self._entries[entry_id] = {
+                "question": question,
+                "sources": frozenset(sources),
+                "version": version,
+                "value": value,
+                "expires": now + self.ttl,
+                "used": now,
+            }
+
+    def _evict(self, now):
+        # expired entries first, then least recently used down to make room for one more
+        drop = [i for i, e in self._entries.items() if e["expires"] < now]
+        overflow = len(self._entries) - len(drop) - self.maxsize + 1
+        if overflow > 0:
+            alive = sorted((e["used"], i) for i, e in self._entries.items() if e["expires"] >= now)
+            drop += [i for _, i in alive[:overflow]]
+        if drop:
+            self._index.remove_ids(np.asarray(drop, dtype=np.int64))
+            for i in drop:
+                del self._entries[i]
+
+    def clear(self):
+        with self._lock:
+            self._index = None
+            self._entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "name": "semantic_answer",
+            "backend": "memory",
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,91 @@
+"""
+Shard server: serves one shard of a build made with `python -m ingest.build_index --shards N`
+to the API's ShardCoordinator (app/coordinator.py). Start one per shard:
+
+    INFOHUB_SHARD=0 uvicorn app.shard:app --port 8100
+    INFOHUB_SHARD=1 uvicorn app.shard:app --port 8101
+    INFOHUB_SHARDS=http://127.0.0.1:8100,http://127.0.0.1:8101 uvicorn app.api:app
+
+For FAISS candidates set INFOHUB_ANN_CANDIDATES on the shard servers as well as the API:
+the API asks for that many, and a shard server only loads its FAISS index with it set.
+Like the API, a shard server follows CURRENT: it swaps to new versions every
+INFOHUB_INDEX_WATCH seconds.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import numpy as np
+from fastapi import FastAPI, HTTPException, Response
+from pydantic import BaseModel
+
+from app import rag
+
+INDEX_WATCH_INTERVAL = float(os.environ.get("INFOHUB_INDEX_WATCH", "10"))
+
+if rag.SERVE_SHARD is None:
+    raise SystemExit("set INFOHUB_SHARD to the shard this server serves")
+
+search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # no query encoder here: the coordinator sends the query embedding
+    await asyncio.get_running_loop().run_in_executor(search_pool, warm)
+    if INDEX_WATCH_INTERVAL > 0:
+        rag.watch_index(INDEX_WATCH_INTERVAL)
+    yield
+    search_pool.shutdown(wait=False)
+
+
+def warm():
+    rag.load_store(embedder=False)
+    rag._index.page_in()
+    rag._index.warm()
+
+
+app = FastAPI(title="InfoHub RAG shard", lifespan=lifespan)
+
+
+def json_response(data):
+    # plain dicts of floats and strings: skip FastAPI's jsonable_encoder, which costs more than the search
+    return Response(json.dumps(data, ensure_ascii=False), media_type="application/json")
+
+
+class SearchRequest(BaseModel):
+    question: str  # normalized
+    qvec: list[float] = None  # query embedding for the semantic scores and FAISS
+    bm25_candidates: int = 60
+    semantic_candidates: int = 0
+
+
+class ChunksRequest(BaseModel):
+    rows: list[int]  # corpus-wide rows, as /search returns them
+    version: str = None  # fail instead of answering from another version
+    partial: bool = False  # skip rows of other shards instead of failing
+
+
+@app.get("/status")
+def status():
+    index = rag._index
+    return {"shard": int(rag.SERVE_SHARD), "shards": index.info["shards"], "version": index.version,
+            "build_id": index.build_id, "n_chunks": len(index.chunks)}
+
+
+@app.post("/search")
+async def search(req: SearchRequest):
+    qvec = None if req.qvec is None else np.asarray(req.qvec, dtype="float32")
+    result = await asyncio.get_running_loop().run_in_executor(
+        search_pool, rag.shard_search, req.question, qvec, req.bm25_candidates, req.semantic_candidates)
+    return json_response(result)
+
+
+@app.post("/chunks")
+def chunks(req: ChunksRequest):
+    try:
+        return json_response({"chunks": rag.shard_chunks(req.rows, req.version, req.partial)})
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
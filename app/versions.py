@@ -0,0 +1,111 @@
+"""
+Versioned index directories.
+
+Every build_index run that changes the index writes a new directory under data/index/
+(named <UTC time>-<build id>, so names sort by age) holding all the serving artifacts
+plus manifest.json: the build settings, a format version and the size of every file.
+data/index/CURRENT names the version to serve. It is replaced atomically, so readers
+see either the old name or the new one, and a version's directory is complete before
+it can be named there. KEEP_VERSIONS versions are kept: CURRENT and the newest others.
+"""
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+INDEX_ROOT = Path("data/index")
+CURRENT_FILE = INDEX_ROOT / "CURRENT"
+MANIFEST_FILE = "manifest.json"
+INDEX_FORMAT_VERSION = 1
+KEEP_VERSIONS = int(os.environ.get("INFOHUB_KEEP_VERSIONS", "3"))
+
+# artifacts inside a version directory
+CHUNKS_DIR = "chunks"
+BM25_DIR = "bm25"
+VECS_FILE = "index_vecs.npy"  # embeddings (float32/float16/int8 codes); int8 adds index_vecs.sq.npy
+ANN_FILE = "index.faiss"
+ANN_IDS_FILE = "chunk_ids.npy"  # FAISS id of every chunk row
+# a build with --shards N > 1 has these artifacts per shard, in shards/0 ... shards/N-1,
+# plus the corpus-wide row of each of the shard's chunk rows
+SHARDS_DIR = "shards"
+ROWS_FILE = "rows.npy"
+
+
+def path(version, shard=None):
+    """A version's directory, or one of its shards' (see SHARDS_DIR)."""
+    root = INDEX_ROOT / version
+    return root if shard is None else root / SHARDS_DIR / str(shard)
+
+
+def current():
+    """Name of the version to serve, or None before the first build."""
+    try:
+        return CURRENT_FILE.read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_path():
+    version = current()
+    if version is None:
+        raise FileNotFoundError(f"no index in {INDEX_ROOT}/; build one with `python -m ingest.build_index`.")
+    return path(version)
+
+
+def list_versions():
+    """Complete versions, oldest first (directories without a manifest are unfinished)."""
+    if not INDEX_ROOT.exists():
+        return []
+    return sorted(p.name for p in INDEX_ROOT.iterdir() if (p / MANIFEST_FILE).exists())
+
+
+def read_manifest(version):
+    """The version's manifest, after checking its format and that every listed file is intact."""
+    root = path(version)
+    manifest = json.loads((root / MANIFEST_FILE).read_text(encoding="utf-8"))
+    if manifest.get("format_version") != INDEX_FORMAT_VERSION:
+        raise ValueError(f"{root} has an unsupported format; rebuild it with `python -m ingest.build_index`.")
+    for name, size in manifest["files"].items():
+        f = root / name
+        if not f.exists() or f.stat().st_size != size:
+            raise ValueError(f"{root} is incomplete or damaged: {name} is missing or has the wrong size")
+    return manifest
+
+
+def publish(staging, info, keep=KEEP_VERSIONS):
+    """
+    Turn the finished build in `staging` into a new version: write its manifest (build
+    `info` + file sizes), move it under INDEX_ROOT, make it CURRENT and prune old versions.
+    Returns the version name.
+    """
+    staging = Path(staging)
+    version = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + info["build_id"]
+    files = {str(f.relative_to(staging)): f.stat().st_size for f in sorted(staging.rglob("*")) if f.is_file()}
+    manifest = {"format_version": INDEX_FORMAT_VERSION, "version": version,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), **info, "files": files}
+    (staging / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    INDEX_ROOT.mkdir(parents=True, exist_ok=True)
+    os.replace(staging, path(version))
+    set_current(version)
+    prune(keep)
+    return version
+
+
+def set_current(version):
+    """Point CURRENT at an existing version (also how to roll back)."""
+    read_manifest(version)
+    tmp = CURRENT_FILE.with_suffix(".tmp")
+    tmp.write_text(version + "\n", encoding="utf-8")
+    os.replace(tmp, CURRENT_FILE)
+
+
+def prune(keep=KEEP_VERSIONS):
+    """Keep `keep` versions, CURRENT and the newest others, and delete the rest. Returns the removed names."""
+    cur = current()
+    old = [v for v in list_versions() if v != cur]
+    removed = old[:max(0, len(old) - max(keep - 1, 0))]
+    for version in removed:
+        # processes still serving it keep their mappings: unlinked files live on until unmapped
+        shutil.rmtree(path(version), ignore_errors=True)
+    return removed
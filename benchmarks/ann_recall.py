@@ -0,0 +1,111 @@
+"""
+Recall@k and query latency of the ANN index types in ingest/build_index.py against
+exact (flat) inner-product search, to pick an --index-type and its knobs as the corpus grows.
+
+Queries are corpus vectors with noise added (so they are near, not on, a stored chunk).
+Without a built index use --synthetic to generate a clustered corpus. A float16/int8
+store is widened back to float32 first, so its own quantization error is not counted.
+
+    python -m benchmarks.ann_recall [--vecs path/to/index_vecs.npy] [--synthetic 200000] [--queries 500] [--k 10]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app import versions
+from app.rag import VectorStore, set_search_params
+from ingest.build_index import make_faiss_index
+
+# (index type, build params, search params to sweep)
+GRID = [
+    ("flat_fp16", {}, [{}]),
+    ("flat_sq8", {}, [{}]),
+    ("hnsw", {"hnsw_m": 16, "ef_construction": 200}, [{"ef_search": ef} for ef in (16, 32, 64, 128)]),
+    ("hnsw", {"hnsw_m": 32, "ef_construction": 200}, [{"ef_search": ef} for ef in (16, 32, 64, 128)]),
+    ("ivf_flat", {}, [{"nprobe": p} for p in (1, 4, 16, 64)]),
+    ("ivf_pq", {"pq_m": 16, "pq_bits": 8}, [{"nprobe": p} for p in (4, 16, 64)]),
+    ("ivf_pq", {"pq_m": 48, "pq_bits": 8}, [{"nprobe": p} for p in (4, 16, 64)]),
+]
+
+
+def normalize(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def synthetic_corpus(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 200), dim))
+    return normalize(centers[rng.integers(len(centers), size=n)] + 0.5 * rng.standard_normal((n, dim)))
+
+
+def make_queries(vecs, n, seed=1):
+    rng = np.random.default_rng(seed)
+    base = vecs[rng.choice(len(vecs), size=n, replace=False)]
+    return normalize(base + 0.05 * rng.standard_normal(base.shape))
+
+
+def index_bytes(index):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.faiss"
+        faiss.write_index(index, str(path))
+        return path.stat().st_size
+
+
+def timed_search(index, queries, k):
+    # one query at a time, like the API
+    t0 = time.perf_counter()
+    ids = np.vstack([index.search(q.reshape(1, -1), k)[1] for q in queries])
+    return ids, 1000 * (time.perf_counter() - t0) / len(queries)
+
+
+def recall(found, truth):
+    k = truth.shape[1]
+    return float(np.mean([len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)]))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vecs", help="embedding matrix (default: the CURRENT index version's)")
+    ap.add_argument("--synthetic", type=int, default=0, help="generate N synthetic vectors instead of --vecs")
+    ap.add_argument("--dim", type=int, default=768, help="dimension of synthetic vectors")
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--k", type=int, default=10)
+    args = ap.parse_args()
+
+    if args.synthetic:
+        vecs = synthetic_corpus(args.synthetic, args.dim)
+    else:
+        vecs = VectorStore.load(args.vecs or versions.current_path() / versions.VECS_FILE).reconstruct()
+    queries = make_queries(vecs, min(args.queries, len(vecs)))
+    ids = np.arange(len(vecs), dtype=np.int64)
+    print(f"corpus={len(vecs)} x {vecs.shape[1]}  queries={len(queries)}  k={args.k}\n")
+
+    flat, _ = make_faiss_index("flat", vecs, {})
+    flat.add_with_ids(vecs, ids)
+    truth, flat_ms = timed_search(flat, queries, args.k)
+    print(f"{'index':<42}{'search':<16}{'recall@k':>9}{'ms/query':>10}{'build s':>9}{'size MB':>9}")
+    print(f"{'flat':<42}{'-':<16}{1.0:>9.3f}{flat_ms:>10.3f}{0.0:>9.1f}{index_bytes(flat) / 2**20:>9.1f}")
+
+    for index_type, build_params, sweep in GRID:
+        if index_type == "ivf_pq" and vecs.shape[1] % build_params["pq_m"]:
+            continue
+        t0 = time.perf_counter()
+        index, params = make_faiss_index(index_type, vecs, build_params)
+        index.add_with_ids(vecs, ids)
+        build_s = time.perf_counter() - t0
+        size_mb = index_bytes(index) / 2**20
+        label = index_type + " " + " ".join(f"{k}={v}" for k, v in params.items() if k in build_params or
+                                            (k == "nlist" and index_type.startswith("ivf")))
+        for search_params in sweep:
+            set_search_params(index, index_type, search_params)
+            found, ms = timed_search(index, queries, args.k)
+            knob = " ".join(f"{k}={v}" for k, v in search_params.items()) or "-"
+            print(f"{label:<42}{knob:<16}{recall(found, truth):>9.3f}{ms:>10.3f}{build_s:>9.1f}{size_mb:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
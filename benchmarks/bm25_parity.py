@@ -0,0 +1,95 @@
+"""
+Check that app.rag.BM25Index ranks exactly like rank_bm25.BM25Okapi and time both, and
+that ties at the top-n cutoff go to the lowest doc ids.
+
+    python -m benchmarks.bm25_parity [--queries 200] [--top 60]
+"""
+import argparse
+import random
+import time
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from app import versions
+from app.rag import BM25Index, ChunkStore, _tokenize
+
+
+def make_queries(corpus_tokens, n, seed=0):
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < n:
+        toks = rng.choice(corpus_tokens)
+        if len(toks) < 3:
+            continue
+        size = rng.randint(2, min(8, len(toks)))
+        start = rng.randint(0, len(toks) - size)
+        queries.append(toks[start:start + size])
+    return queries
+
+
+def check_ties(n_docs=3300, n_tied=300, top=60, seed=0):
+    """
+    A query matching `n_tied` identical docs equally, more than `top`: top_k and top_k_many
+    must both return the lowest tied doc ids.
+    """
+    rng = random.Random(seed)
+    tied = set(rng.sample(range(n_docs), n_tied))
+    corpus = [["tied", "doc"] if i in tied else [f"w{rng.randrange(500)}" for _ in range(6)] for i in range(n_docs)]
+    engine = BM25Index.build(corpus)
+    expected = np.array(sorted(tied)[:top])
+    idx, _ = engine.top_k(["tied"], top)
+    (many_idx, _), = engine.top_k_many([["tied"]], top)
+    ok = np.array_equal(idx, expected) and np.array_equal(many_idx, expected)
+    print(f"ties: {n_tied} tied docs of {n_docs}, top {top}: " + ("lowest ids OK" if ok else
+          f"FAILED, top_k={idx[:5].tolist()}..., top_k_many={many_idx[:5].tolist()}..., "
+          f"expected {expected[:5].tolist()}..."))
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", help="chunk store directory (default: the CURRENT index version's)")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--top", type=int, default=60)
+    args = ap.parse_args()
+
+    chunks = ChunkStore.load(args.chunks or versions.current_path() / versions.CHUNKS_DIR)
+    corpus_tokens = [_tokenize(chunks.text(i)) for i in range(len(chunks))]
+    queries = make_queries(corpus_tokens, args.queries)
+
+    t0 = time.perf_counter()
+    ref = BM25Okapi(corpus_tokens)
+    t1 = time.perf_counter()
+    engine = BM25Index.build(corpus_tokens)
+    t2 = time.perf_counter()
+    print(f"chunks={len(corpus_tokens)}  build: rank_bm25={t1 - t0:.2f}s  BM25Index={t2 - t1:.2f}s")
+
+    ref_time = new_time = 0.0
+    mismatches = 0
+    for q in queries:
+        t0 = time.perf_counter()
+        scores = ref.get_scores(q)
+        ref_idx = np.argsort(scores)[::-1][:args.top]
+        t1 = time.perf_counter()
+        idx, top = engine.top_k(q, args.top)
+        t2 = time.perf_counter()
+        ref_time += t1 - t0
+        new_time += t2 - t1
+
+        # same scores in the same order; ids may only differ inside tied groups
+        same_scores = np.array_equal(np.sort(scores[ref_idx])[::-1], top)
+        same_ids = np.array_equal(engine.get_scores(q)[idx], top) and np.array_equal(scores[idx], top)
+        if not (same_scores and same_ids):
+            mismatches += 1
+            print(f"MISMATCH: {q}")
+
+    n = len(queries)
+    print(f"queries={n}  rank_bm25={1000 * ref_time / n:.2f} ms/q  BM25Index={1000 * new_time / n:.2f} ms/q")
+    print("parity OK" if not mismatches else f"parity FAILED on {mismatches}/{n} queries")
+    ties_ok = check_ties(top=args.top)
+    raise SystemExit(1 if mismatches or not ties_ok else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Load test for POST /chat against a local stub of the OpenAI chat-completions API.
+
+The stub answers after --llm-delay seconds, so the numbers show how many
+concurrent requests the API keeps in flight, not how fast the real LLM is.
+Retrieval uses the built index in data/ unless --stub-retrieval is given.
+
+    python -m benchmarks.chat_load [--concurrency 64] [--requests 512] [--llm-delay 0.5]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+
+QUESTIONS = [
+    "როგორ შევავსო საბაჟო დეკლარაცია?",
+    "რა არის საბაჟო ღირებულება?",
+    "როგორ ხდება საქონლის დროებითი შემოტანა?",
+    "რა დოკუმენტებია საჭირო ექსპორტისთვის?",
+]
+
+
+def make_stub_llm(delay: float):
+    stub = FastAPI()
+
+    @stub.post("/v1/chat/completions")
+    async def completions(body: dict):
+        await asyncio.sleep(delay)
+        return {
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "საბაჟო დეკლარაცია ივსება ელექტრონულად [1]."},
+            }],
+            "usage": {"prompt_tokens": 800, "completion_tokens": 20, "total_tokens": 820},
+        }
+
+    return stub
+
+
+def serve(app, port):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def run_load(url, n_requests, concurrency, questions=QUESTIONS):
+    sem = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as http:
+        async def one(i):
+            nonlocal errors
+            async with sem:
+                t0 = time.perf_counter()
+                try:
+                    r = await http.post(url, json={"question": questions[i % len(questions)]})
+                    r.raise_for_status()
+                    latencies.append(time.perf_counter() - t0)
+                except httpx.HTTPError:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        elapsed = time.perf_counter() - t0
+
+    return latencies, errors, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--requests", type=int, default=512)
+    ap.add_argument("--llm-delay", type=float, default=0.5)
+    ap.add_argument("--no-answer-cache", action="store_true",
+                    help="disable the answer cache so every request reaches the LLM")
+    ap.add_argument("--stub-retrieval", action="store_true",
+                    help="replace retrieve() with a canned hit list (no index needed)")
+    ap.add_argument("--llm-port", type=int, default=8765)
+    ap.add_argument("--api-port", type=int, default=8766)
+    args = ap.parse_args()
+
+    serve(make_stub_llm(args.llm_delay), args.llm_port)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{args.llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    from app import api  # reads OPENAI_BASE_URL at import
+
+    if args.stub_retrieval:
+        hits = [{"idx": i, "url": f"https://infohub.rs.ge/ka/workspace/document/{i}", "title": "stub",
+                 "chunk": "საბაჟო დეკლარაცია " * 40} for i in range(5)]
+        api.retrieve = lambda question, k=5: hits[:k]
+        api.index_version = lambda: "stub"
+        api.encode_query = lambda question: None  # no vector -> semantic cache is skipped
+        api.warmup = lambda: None  # no index to load
+    if args.no_answer_cache:
+        api.answer_cache.get = lambda key: None
+        api.semantic_cache.lookup = lambda *a: None
+    serve(api.app, args.api_port)
+
+    url = f"http://127.0.0.1:{args.api_port}/chat"
+    asyncio.run(run_load(url, min(args.concurrency, args.requests), args.concurrency))  # warm-up
+    latencies, errors, elapsed = asyncio.run(run_load(url, args.requests, args.concurrency))
+
+    latencies.sort()
+    p = lambda q: 1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    print(f"requests={args.requests} concurrency={args.concurrency} llm_delay={args.llm_delay}s errors={errors}")
+    print(f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    if latencies:
+        print(f"latency ms: p50={p(0.50):.0f} p90={p(0.90):.0f} p99={p(0.99):.0f} "
+              f"mean={1000 * statistics.mean(latencies):.0f}")
+
+
+if __name__ == "__main__":
+    main()
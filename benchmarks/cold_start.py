@@ -0,0 +1,62 @@
+"""
+Cold-start cost of the lexical index: what every API start used to do (tokenize
+every chunk and construct rank_bm25.BM25Okapi over them, then score a query) versus
+memory-mapping the prebuilt bm25/ directory of the CURRENT index version.
+Both read the chunk text from the same version's chunk store.
+
+Each path runs in a fresh interpreter, like a new API worker would.
+
+    python -m benchmarks.cold_start [--runs 3]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+REBUILD = """
+import time
+import numpy as np
+from rank_bm25 import BM25Okapi
+from app import versions
+from app.rag import ChunkStore, _tokenize
+t0 = time.perf_counter()
+chunks = ChunkStore.load(versions.current_path() / versions.CHUNKS_DIR)
+bm25 = BM25Okapi([_tokenize(chunks.text(i)) for i in range(len(chunks))])
+np.argsort(bm25.get_scores(_tokenize("საბაჟო დეკლარაცია")))[::-1][:60]
+print(time.perf_counter() - t0)
+"""
+
+PREBUILT = """
+import time
+from app import versions
+from app.rag import BM25Index, _tokenize
+t0 = time.perf_counter()
+bm25 = BM25Index.load(versions.current_path() / versions.BM25_DIR)
+bm25.top_k(_tokenize("საბაჟო დეკლარაცია"), 60)
+print(time.perf_counter() - t0)
+"""
+
+
+def run(code, runs):
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    rebuild = run(REBUILD, args.runs)
+    prebuilt = run(PREBUILT, args.runs)
+    r, p = statistics.median(rebuild), statistics.median(prebuilt)
+    print(f"BM25Okapi per start: {1000 * r:8.1f} ms (median of {args.runs})")
+    print(f"load prebuilt bm25 : {1000 * p:8.1f} ms (median of {args.runs})")
+    print(f"speedup            : {r / p:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Prompt tokens of the context: five full chunks (what /chat used to send) versus
+app.context.build_context at one or more token budgets, over a fixed question set.
+
+The packed context is built the way /chat builds it, from the hits plus their neighbouring
+chunks (rag.with_neighbours). Also reports term coverage: the share of the question's terms
+found in the full context that are still in the packed one. First checks the merging and
+the sentence selection on synthetic hits (exits 1 if that fails). Run from a directory
+with a built index.
+
+    python -m benchmarks.context_packing [--budgets 600,1000,1500] [--questions file.txt]
+    python -m benchmarks.context_packing --embedder stub --sample 200   # suite corpus: questions from data/raw_docs
+"""
+import argparse
+import statistics
+import sys
+
+QUESTIONS = [
+    "როგორ შევავსო საბაჟო დეკლარაცია?",
+    "რა არის საბაჟო ღირებულება?",
+    "როგორ ხდება საქონლის დროებითი შემოტანა?",
+    "რა დოკუმენტებია საჭირო ექსპორტისთვის?",
+    "ვინ იხდის დღგ-ს იმპორტზე?",
+    "როგორ დავარეგისტრირო ავტომობილი საბაჟოზე?",
+    "რა ვადაში უნდა წარვადგინო საბაჟო დეკლარაცია?",
+    "როგორ ხდება საბაჟო ღირებულების კორექტირება?",
+    "რა არის წარმოშობის სერტიფიკატი და როდის არის საჭირო?",
+    "როგორ გავასაჩივრო საბაჟო ორგანოს გადაწყვეტილება?",
+    "რა შეღავათები მოქმედებს თავისუფალ ინდუსტრიულ ზონაში?",
+    "როგორ ხდება აქციზური მარკების მიღება?",
+]
+
+
+def check_merge():
+    """
+    merge_adjacent on synthetic hits: overlapping neighbours of one URL (rows 9-11, in any
+    rank order) become one passage with each overlap sent once; consecutive rows that don't
+    overlap (a chunk between them was dropped) are joined with GAP; other URLs stay apart.
+    """
+    from app import context
+
+    doc = " ".join(f"w{i:03d}" for i in range(600))
+    cuts = [doc[s:s + 900] for s in (0, 700, 1400)]  # as the build chunks: 900 chars, 200 overlap
+
+    def hit(url, idx, chunk):
+        return {"url": url, "title": "t", "idx": idx, "chunk": chunk}
+
+    hits = [hit("a", 10, cuts[1]), hit("b", 11, "other document"), hit("a", 11, cuts[2]), hit("a", 9, cuts[0]),
+            hit("c", 20, doc[:400]), hit("c", 21, doc[1500:1900])]
+    got = [(p["url"], p["rows"], p["text"]) for p in context.merge_adjacent(hits)]
+    expected = [("a", [9, 10, 11], doc[:2300]), ("b", [11], "other document"),
+                ("c", [20, 21], doc[:400] + context.GAP + doc[1500:1900])]
+    ok = got == expected
+    print("merge_adjacent: " + ("OK" if ok else f"FAILED, got {[(u, r, t[:40]) for u, r, t in got]}"))
+    return ok
+
+
+def check_packing():
+    """
+    build_context merges a hit with its "neighbours" into one passage, and keeps sentences
+    without the question's terms as filler: all of them with room, none with just enough
+    budget for the matching ones.
+    """
+    from app import context
+
+    text = ("Opening remarks about the service and how this page is organised for readers. "
+            "The declaration form is filed online through the customs portal of the service. "
+            "It usually takes about three working days before the decision reaches the applicant. "
+            "Fees are listed separately in the annex that follows the main part of this page. "
+            "Appeals against a decision go to the dispute resolution council of the revenue service.")
+    a, b = 150, 300  # the chunks overlap by 60 characters, as build chunks do by 200
+    hit = {"url": "a", "title": "t", "idx": 5, "chunk": text[a - 60:b],
+           "neighbours": [{"idx": 4, "chunk": text[:a]}, {"idx": 6, "chunk": text[b - 60:]}]}
+    roomy = context.build_context("declaration form", [hit], budget=10_000)
+    matching = "The declaration form is filed online through the customs portal of the service."
+    tight = context.build_context("declaration form", [hit], budget=context.count_tokens(matching))
+    ok = len(roomy) == 1 and roomy[0]["text"] == text and [p["text"] for p in tight] == [matching]
+    print("build_context neighbours + filler: " + ("OK" if ok else f"FAILED, got {roomy} / {tight}"))
+    return ok
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--budgets", default="600,1000,1500")
+    ap.add_argument("--questions", help="one question per line (default: the built-in set)")
+    ap.add_argument("--sample", type=int, default=0, help="use N questions sampled from --raw-docs instead")
+    ap.add_argument("--raw-docs", default="data/raw_docs")
+    ap.add_argument("--embedder", choices=("stub", "configured"), default="configured")
+    args = ap.parse_args()
+
+    if not (check_merge() & check_packing()):
+        sys.exit(1)
+    from app import context, rag
+
+    if args.embedder == "stub":
+        from benchmarks.stubs import HashEmbedder
+
+        embedder = HashEmbedder()
+        rag.load_embedder = lambda model_name: embedder
+    if args.sample:
+        from benchmarks.corpus import sample_queries
+
+        questions = sample_queries(args.raw_docs, args.sample, seed=3)
+    elif args.questions:
+        with open(args.questions, encoding="utf-8") as f:
+            questions = [ln.strip() for ln in f if ln.strip()]
+    else:
+        questions = QUESTIONS
+
+    context.count_tokens("warm-up")
+    counter = "tiktoken " + context.TOKEN_ENCODING if context._encoding else "estimate (tiktoken unavailable)"
+    budgets = [int(b) for b in args.budgets.split(",")]
+    full_tokens, packed, coverage = [], {b: [] for b in budgets}, {b: [] for b in budgets}
+    n_neighbours = []
+    for q in questions:
+        hits = rag.with_neighbours(rag.retrieve(q, k=5))
+        if not hits:
+            continue
+        n_neighbours.append(sum(len(h["neighbours"]) for h in hits))
+        full = "\n\n".join(f"[{i}] {h['chunk']}" for i, h in enumerate(hits, start=1))
+        full_tokens.append(context.count_tokens(full))
+        q_stems = context._stems(rag._tokenize(q))
+        in_full = q_stems & context._stems(rag._tokenize(full))
+        for b in budgets:
+            text = context.format_context(context.build_context(q, hits, budget=b))
+            packed[b].append(context.count_tokens(text))
+            kept = in_full & context._stems(rag._tokenize(text))
+            coverage[b].append(len(kept) / len(in_full) if in_full else 1.0)
+
+    if not full_tokens:
+        raise SystemExit("no question retrieved anything")
+    total = sum(full_tokens)
+    print(f"{len(full_tokens)} questions, tokens counted with {counter}, "
+          f"{statistics.mean(n_neighbours):.1f} neighbouring chunks merged per question")
+    print(f"{'context':<18}{'tokens/q':>10}{'total':>9}{'saved':>8}{'coverage':>10}")
+    print(f"{'5 full chunks':<18}{statistics.mean(full_tokens):>10.0f}{total:>9}{'':>8}{1:>10.0%}")
+    for b in budgets:
+        saved = 1 - sum(packed[b]) / total
+        print(f"{f'packed, {b}':<18}{statistics.mean(packed[b]):>10.0f}{sum(packed[b]):>9}{saved:>8.0%}"
+              f"{statistics.mean(coverage[b]):>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
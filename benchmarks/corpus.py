@@ -0,0 +1,92 @@
+"""
+Synthetic Georgian-ish corpus in the data/raw_docs format, for offline benchmarks.
+
+Words are random Georgian-letter syllable strings drawn from a Zipf distribution; each
+document leans on its own topic words, so BM25 and embeddings see some structure, and
+every page carries the same footer line (dropped by build_index like real nav/footer text).
+Sizes are given in chunks, as build_index will cut them (about 10 per document).
+
+    python -m benchmarks.corpus --chunks 10000 [--out data/raw_docs] [--seed 0]
+"""
+import argparse
+import itertools
+import json
+import random
+from pathlib import Path
+
+CONSONANTS = "ბგდვზთკლმნპჟრსტფქღყშჩცძწჭხჯჰ"
+VOWELS = "აეიოუ"
+FOOTER = "© შემოსავლების სამსახური. ყველა უფლება დაცულია."
+CHUNKS_PER_DOC = 10
+CHUNK_STRIDE = 700  # build_index chunk_size - overlap
+SCALES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+
+
+def make_vocab(rng, size):
+    vocab = set()
+    while len(vocab) < size:
+        n = rng.choice((2, 2, 3, 3, 3, 4))
+        vocab.add("".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(n)))
+    return sorted(vocab)
+
+
+def make_doc(rng, vocab, cum_weights, i, n_chars):
+    topic = rng.sample(vocab, 12)
+    lines, length = [], 0
+    while length < n_chars:
+        words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(8, 16))
+        for j in rng.sample(range(len(words)), 3):
+            words[j] = rng.choice(topic)  # topic words make documents distinguishable
+        line = " ".join(words).capitalize() + "."
+        lines.append(line)
+        length += len(line) + 1
+    lines.append(FOOTER)
+    return {
+        "url": f"https://infohub.rs.ge/ka/workspace/document/{i}",
+        "title": " ".join(topic[:4]).capitalize(),
+        "text": "\n".join(lines),
+    }
+
+
+def generate(out_dir, n_chunks, seed=0, vocab_size=20_000):
+    """Write about `n_chunks` chunks' worth of doc_*.json files; returns the number of docs."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    vocab = make_vocab(rng, vocab_size)
+    cum_weights = list(itertools.accumulate(1 / (r + 1) for r in range(len(vocab))))  # Zipf
+    n_docs = max(1, n_chunks // CHUNKS_PER_DOC)
+    for i in range(n_docs):
+        doc = make_doc(rng, vocab, cum_weights, i, CHUNKS_PER_DOC * CHUNK_STRIDE)
+        (out_dir / f"doc_{i:07d}.json").write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+    return n_docs
+
+
+def sample_queries(raw_dir, n, seed=1):
+    """Short word runs lifted from random documents: every query has lexical matches."""
+    rng = random.Random(seed)
+    files = sorted(Path(raw_dir).glob("doc_*.json"))
+    queries = set()
+    for _ in range(20 * n):
+        if len(queries) >= n:
+            break
+        text = json.loads(rng.choice(files).read_text(encoding="utf-8"))["text"]
+        words = rng.choice(text.splitlines()[:-1]).rstrip(".").lower().split()
+        size = rng.randint(3, min(6, len(words)))
+        start = rng.randint(0, len(words) - size)
+        queries.add(" ".join(words[start:start + size]))
+    return sorted(queries)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--chunks", type=int, default=10_000)
+    ap.add_argument("--out", default="data/raw_docs")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    n_docs = generate(args.out, args.chunks, args.seed)
+    print(f"Wrote {n_docs} documents (~{n_docs * CHUNKS_PER_DOC} chunks) to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+ONNX Runtime embedder vs the PyTorch SentenceTransformer: cosine agreement of the
+embeddings, single-query encode latency, and worker startup (import + load + first encode).
+
+Exports the model to --onnx-dir first if there is no matching export there. Exits non-zero
+when a backend's worst cosine to PyTorch is below --min-cosine, so it doubles as the
+equivalence check; point --model at a small local model to run it quickly.
+
+    python -m benchmarks.embedder_backends [--model path/or/name] [--onnx-dir data/onnx] [--min-cosine 0.99]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.embedder import ONNX_DIR, export_onnx, load_embedder
+from app.rag import MODEL_NAME
+
+TEXTS = [
+    "query: როგორ შევავსო საბაჟო დეკლარაცია?",
+    "query: რა არის საბაჟო ღირებულება?",
+    "query: ვინ იხდის დღგ-ს იმპორტზე?",
+    "query: how do I register an imported car?",
+    "passage: საქონლის დროებითი შემოტანა ხორციელდება საბაჟო დეკლარაციის საფუძველზე. " * 8,
+    "passage: The customs value of goods is the transaction value, adjusted where required. " * 20,
+]
+
+STARTUP = """
+import sys, time
+t0 = time.perf_counter()
+from app.embedder import load_embedder
+load_embedder(sys.argv[1], sys.argv[2], sys.argv[3]).encode(["query: warm-up"], normalize_embeddings=True)
+print(time.perf_counter() - t0)
+"""
+
+
+def startup_seconds(model, backend, onnx_dir):
+    # fresh interpreter: the cost a new API worker pays before its first query
+    out = subprocess.run([sys.executable, "-c", STARTUP, model, backend, str(onnx_dir)],
+                         capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": "."})
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def latency_ms(model, repeats):
+    times = []
+    for i in range(repeats):
+        text = f"{TEXTS[i % 4]} {i}"
+        t0 = time.perf_counter()
+        model.encode([text], normalize_embeddings=True)
+        times.append(1000 * (time.perf_counter() - t0))
+    return statistics.median(times)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--onnx-dir", default=str(ONNX_DIR))
+    ap.add_argument("--repeats", type=int, default=50)
+    ap.add_argument("--min-cosine", type=float, default=0.99)
+    args = ap.parse_args()
+
+    onnx_dir = Path(args.onnx_dir)
+    export = onnx_dir / "export.json"
+    if (not export.exists() or json.loads(export.read_text(encoding="utf-8"))["model"] != args.model
+            or not (onnx_dir / "model.int8.onnx").exists()):
+        print(f"exporting {args.model} to {onnx_dir} ...")
+        export_onnx(args.model, onnx_dir, quantize=True)
+
+    reference = load_embedder(args.model, "torch")
+    ref = np.asarray(reference.encode(TEXTS, normalize_embeddings=True), dtype="float32")
+
+    print(f"{'backend':<11}{'min cos':>9}{'mean cos':>10}{'p50 ms':>9}{'startup s':>11}")
+    failed = False
+    for backend in ("torch", "onnx", "onnx-int8"):
+        model = reference if backend == "torch" else load_embedder(args.model, backend, onnx_dir)
+        cos = np.sum(np.asarray(model.encode(TEXTS, normalize_embeddings=True), dtype="float32") * ref, axis=1)
+        failed |= bool(cos.min() < args.min_cosine)
+        print(f"{backend:<11}{cos.min():>9.4f}{cos.mean():>10.4f}{latency_ms(model, args.repeats):>9.2f}"
+              f"{startup_seconds(args.model, backend, onnx_dir):>11.2f}")
+
+    if failed:
+        sys.exit(f"a backend disagrees with PyTorch below cosine {args.min_cosine}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Fetch throughput (docs/sec) of ingest/fetch_docs.py against a local stand-in for InfoHub.
+
+The stand-in serves JS-rendered pages (text appears after a short delay, like the SPA)
+with slow images, answers the pre-check's HEAD without ETag/Last-Modified (so every page
+is rendered), and fails the page GET of every Nth doc once to exercise the retry path.
+
+    python -m benchmarks.fetch_throughput [--docs 40] [--concurrency 8]
+"""
+import argparse
+import asyncio
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from ingest import fetch_docs
+
+RENDER_DELAY_MS = 300
+IMAGE_DELAY_S = 0.5
+FLAKY_EVERY = 7
+
+PAGE = """<!doctype html><html><head><title>Doc {n}</title></head>
+<body><div id="root">loading…</div><img src="/img/{n}.png">
+<script>
+setTimeout(function () {{
+  var p = [];
+  for (var i = 0; i < 40; i++) p.push("საბაჟო დეკლარაცია დოკუმენტი {n} აბზაცი " + i + ".");
+  document.getElementById("root").innerHTML = "<main>" + p.join("<br>") + "</main>";
+}}, {delay});
+</script></body></html>"""
+
+
+class StandIn(BaseHTTPRequestHandler):
+    failed_once = set()
+    lock = threading.Lock()
+
+    def do_GET(self):
+        if self.path.startswith("/img/"):
+            time.sleep(IMAGE_DELAY_S)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.end_headers()
+            return
+
+        n = int(self.path.rsplit("/", 1)[-1])
+        # the first GET of the page is the browser's: HEAD pre-checks never use up the failure
+        with self.lock:
+            flaky = n % FLAKY_EVERY == 0 and n not in self.failed_once
+            self.failed_once.add(n)
+        if flaky:
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        body = PAGE.format(n=n, delay=RENDER_DELAY_MS).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        # like the SPA: no validators, so the pre-check can't skip a page
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=40)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--skip-sequential", action="store_true")
+    args = ap.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    links = [f"{base}/doc/{n}" for n in range(args.docs)]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.skip_sequential:
+            StandIn.failed_once.clear()
+            t0 = time.perf_counter()
+            saved = fetch_docs.fetch_all(links, out_dir=Path(tmp), registry_path=Path(tmp) / "seq_registry.json")
+            results["sequential"] = (saved, time.perf_counter() - t0)
+
+        StandIn.failed_once.clear()
+        t0 = time.perf_counter()
+        saved = asyncio.run(fetch_docs.fetch_all_async(
+            links, args.concurrency, out_dir=Path(tmp), registry_path=Path(tmp) / "async_registry.json"))
+        results[f"async x{args.concurrency}"] = (saved, time.perf_counter() - t0)
+
+    server.shutdown()
+    print()
+    for mode, (saved, elapsed) in results.items():
+        print(f"{mode:>14}: {saved}/{args.docs} saved in {elapsed:6.1f}s  -> {args.docs / elapsed:6.2f} docs/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Query-encoding latency and throughput: one encode() per request (current behaviour)
+versus app.rag.BatchingEncoder collecting concurrent requests into one forward pass.
+
+    python -m benchmarks.query_batching [--threads 16] [--queries 400] [--model intfloat/multilingual-e5-base]
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import numpy as np
+
+from app.embedder import load_embedder
+from app.rag import MODEL_NAME, QUERY_BATCH_MAX, QUERY_BATCH_WAIT, BatchingEncoder
+
+QUESTIONS = [
+    "როგორ შევავსო საბაჟო დეკლარაცია?",
+    "რა არის საბაჟო ღირებულება?",
+    "როგორ ხდება საქონლის დროებითი შემოტანა?",
+    "რა დოკუმენტებია საჭირო ექსპორტისთვის?",
+    "ვინ იხდის დღგ-ს იმპორტზე?",
+    "როგორ დავარეგისტრირო ავტომობილი საბაჟოზე?",
+]
+
+
+def run(encode, threads, n_queries):
+    latencies = []
+    lock = threading.Lock()
+    per_thread = n_queries // threads
+
+    def worker(t):
+        for i in range(per_thread):
+            text = f"query: {QUESTIONS[(t + i) % len(QUESTIONS)]} {t}-{i}"  # unique, nothing cached
+            t0 = time.perf_counter()
+            encode(text)
+            dt = time.perf_counter() - t0
+            with lock:
+                latencies.append(dt)
+
+    t0 = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    return latencies, time.perf_counter() - t0
+
+
+def report(name, latencies, elapsed):
+    latencies.sort()
+    pct = lambda q: 1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+    print(f"{name:>22}: {len(latencies) / elapsed:7.1f} q/s   p50={pct(0.50):6.1f} ms   "
+          f"p99={pct(0.99):6.1f} ms   mean={1000 * statistics.mean(latencies):6.1f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=MODEL_NAME)
+    ap.add_argument("--threads", type=int, default=16)
+    ap.add_argument("--queries", type=int, default=400)
+    ap.add_argument("--max-batch", type=int, default=QUERY_BATCH_MAX)
+    ap.add_argument("--max-wait-ms", type=float, default=1000 * QUERY_BATCH_WAIT)
+    args = ap.parse_args()
+
+    model = load_embedder(args.model)  # backend per INFOHUB_EMBEDDER
+    model.encode(QUESTIONS, normalize_embeddings=True)  # warm-up
+
+    def direct(text):
+        return np.asarray(model.encode([text], normalize_embeddings=True), dtype="float32")[0]
+
+    batcher = BatchingEncoder(model, max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000)
+
+    print(f"threads={args.threads} queries={args.queries} max_batch={args.max_batch} max_wait={args.max_wait_ms}ms\n")
+    report("per-request encode", *run(direct, args.threads, args.queries))
+    report("batched encode", *run(batcher.encode, args.threads, args.queries))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Bulk retrieval: a retrieve() loop versus retrieve_many() over the same uncached questions,
+checking that both return the same hits, plus BM25 candidates for a question whose
+candidates tie at the cutoff and for bm25_candidates=0. Run from a directory with a built
+index (the repo root, or a benchmarks.suite scale directory with --embedder stub).
+
+    python -m benchmarks.retrieve_many [--queries 2000] [--embedder stub|configured] [--ann-candidates 20]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--embedder", choices=("stub", "configured"), default="configured",
+                    help="stub: benchmarks.stubs.HashEmbedder, for indexes the suite built")
+    ap.add_argument("--ann-candidates", type=int, default=20)
+    ap.add_argument("--raw-docs", default="data/raw_docs")
+    args = ap.parse_args()
+
+    os.environ["INFOHUB_ANN_CANDIDATES"] = str(args.ann_candidates)  # read at import
+    from app import rag
+    from benchmarks.corpus import sample_queries
+
+    if args.embedder == "stub":
+        from benchmarks.stubs import HashEmbedder
+
+        embedder = HashEmbedder()
+        rag.load_embedder = lambda model_name: embedder
+    rag.load_store()
+    questions = sample_queries(args.raw_docs, args.queries, seed=5)
+
+    def cold():
+        rag._hits_cache.clear()
+        rag._query_vec_cache.clear()
+
+    cold()
+    t0 = time.perf_counter()
+    looped = [rag.retrieve(q) for q in questions]
+    loop_s = time.perf_counter() - t0
+
+    cold()
+    t0 = time.perf_counter()
+    batched = rag.retrieve_many(questions)
+    many_s = time.perf_counter() - t0
+
+    same = sum([h["idx"] for h in a] == [h["idx"] for h in b] for a, b in zip(looped, batched))
+    print(f"{len(questions)} questions, {len(rag._index.chunks)} chunks, ann_candidates={args.ann_candidates}")
+    print(f"  retrieve() loop : {loop_s:7.2f} s  {len(questions) / loop_s:8.1f} q/s")
+    print(f"  retrieve_many() : {many_s:7.2f} s  {len(questions) / many_s:8.1f} q/s  ({loop_s / many_s:.1f}x)")
+    print(f"  identical hits  : {same}/{len(questions)}")
+    print(f"  tied candidates : {'identical' if tied_candidates(rag) else 'DIFFERENT'}")
+    print(f"  no candidates   : {'identical' if no_candidates(rag, questions[:50]) else 'DIFFERENT'}")
+
+
+def tied_candidates(rag, n=60):
+    """
+    BM25 candidates of top_k (what retrieve uses) and top_k_many (retrieve_many) for the
+    index's most common term: the chunks with the same length and count of it tie, so the
+    cutoff usually splits a tied group. Both must keep the same (lowest) chunk ids.
+    """
+    bm25 = rag._index.bm25
+    term = bm25.vocab.terms[int(np.argmax(np.diff(bm25.indptr)))]  # a loaded index has a SortedVocab
+    idx, _ = bm25.top_k([term], n)
+    (many_idx, _), = bm25.top_k_many([[term]], n)
+    return np.array_equal(idx, many_idx)
+
+
+def no_candidates(rag, questions):
+    """bm25_candidates=0: retrieve and retrieve_many (top_k / top_k_many) both come back empty-handed alike."""
+    rag._hits_cache.clear()
+    looped = [rag.retrieve(q, bm25_candidates=0) for q in questions]
+    rag._hits_cache.clear()
+    batched = rag.retrieve_many(questions, bm25_candidates=0)
+    return [[h["idx"] for h in a] for a in looped] == [[h["idx"] for h in b] for b in batched]
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Offline hit-rate / false-hit-rate of the semantic answer cache on a question log.
+
+The log is either plain text (one question per line) or JSONL with {"question": ...,
+"group": ...}, where questions sharing a group are paraphrases with the same answer.
+Questions are replayed in order against a fresh cache per threshold (no LLM calls);
+a hit served from a question of another group counts as a false hit.
+
+    python -m benchmarks.semantic_cache_eval questions.jsonl [--thresholds 0.88,0.90,0.92,0.95]
+"""
+import argparse
+import json
+
+from app.rag import encode_query, index_version, normalize_question, retrieve
+from app.semantic_cache import SemanticCache
+
+
+def read_log(path):
+    rows = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                rec = json.loads(line)
+                rows.append((rec["question"], rec.get("group")))
+            else:
+                rows.append((line, None))
+    return rows
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("log")
+    ap.add_argument("--thresholds", default="0.88,0.90,0.92,0.95")
+    ap.add_argument("--k", type=int, default=5)
+    args = ap.parse_args()
+
+    rows = read_log(args.log)
+    version = index_version()
+
+    # retrieval and encoding once per question; only the cache replay depends on the threshold
+    prepared = []
+    for question, group in rows:
+        hits = retrieve(question, k=args.k)
+        if not hits:
+            continue
+        prepared.append((question, group, encode_query(question), [h["url"] for h in hits]))
+
+    exact_repeats = len(prepared) - len({normalize_question(q) for q, *_ in prepared})
+    labeled = any(g is not None for _, g, *_ in prepared)
+    print(f"questions={len(rows)} with hits={len(prepared)} exact repeats={exact_repeats}\n")
+    print(f"{'threshold':>9}  {'hits':>5}  {'hit rate':>8}  {'false hits':>10}  {'false-hit rate':>14}")
+
+    for threshold in (float(t) for t in args.thresholds.split(",")):
+        cache = SemanticCache(threshold=threshold, maxsize=len(prepared) + 1)
+        hits = false_hits = 0
+        for question, group, qvec, sources in prepared:
+            served = cache.lookup(qvec, sources, version)
+            if served is None:
+                cache.add(normalize_question(question), qvec, sources, version, {"group": group})
+                continue
+            hits += 1
+            if labeled and served["group"] != group:
+                false_hits += 1
+
+        n = len(prepared) or 1
+        fhr = f"{false_hits / hits:14.1%}" if labeled and hits else f"{'n/a':>14}"
+        fh = f"{false_hits:10d}" if labeled else f"{'n/a':>10}"
+        print(f"{threshold:9.2f}  {hits:5d}  {hits / n:8.1%}  {fh}  {fhr}")
+
+
+if __name__ == "__main__":
+    main()
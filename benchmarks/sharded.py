@@ -0,0 +1,186 @@
+"""
+Sharded scatter-gather retrieval against a single index over the same corpus. Builds the
+index unsharded and with --shards N (the same chunks and rows), records retrieve() hits on
+the single index, starts one local app.shard process per shard and retrieves the same
+questions through the ShardCoordinator: reports identical top-k lists and latency. Then
+freezes one shard (SIGSTOP) to show a query degrading to the other shards at the timeout.
+
+Everything happens in its own working directory (--workdir, default a temporary one that
+is removed afterwards), like benchmarks.suite: the corpus is synthetic unless --raw-docs
+names one, and data/index and data/emb_cache elsewhere are never touched.
+
+    python -m benchmarks.sharded [--shards 4] [--chunks 4000] [--queries 500] [--ann-candidates 0]
+    python -m benchmarks.sharded --raw-docs data/raw_docs --embedder configured   # the real corpus and model
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def start_shards(n, ann_candidates):
+    from benchmarks.suite import free_port
+
+    env = dict(os.environ, INFOHUB_ANN_CANDIDATES=str(ann_candidates), INFOHUB_INDEX_WATCH="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [str(REPO), os.environ.get("PYTHONPATH")])))
+    procs, urls = [], []
+    for shard in range(n):
+        port = free_port()
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.shard:app", "--port", str(port), "--log-level", "warning"],
+            env=dict(env, INFOHUB_SHARD=str(shard))))
+        urls.append(f"http://127.0.0.1:{port}")
+    for proc, url in zip(procs, urls):
+        for _ in range(600):
+            if proc.poll() is not None:
+                raise SystemExit(f"shard server {url} exited with {proc.returncode}")
+            try:
+                if httpx.get(url + "/status", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        else:
+            raise SystemExit(f"shard server {url} did not start")
+    return procs, urls
+
+
+def timed(rag, questions):
+    from benchmarks.suite import summarize
+
+    rag._hits_cache.clear()
+    hits, seconds = [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        hits.append(rag.retrieve(q))
+        seconds.append(time.perf_counter() - t0)
+    return hits, summarize(seconds)
+
+
+def neighbour_rows(rag, results, n=50):
+    # rows rag.with_neighbours() adds to the first n questions' hits, as /chat would
+    return [[c["idx"] for h in rag.with_neighbours([dict(h) for h in hits]) for c in h["neighbours"]]
+            for hits in results[:n]]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--queries", type=int, default=500)
+    ap.add_argument("--embedder", choices=("stub", "configured"), default="stub",
+                    help="stub: benchmarks.stubs.HashEmbedder, for the synthetic corpus")
+    ap.add_argument("--ann-candidates", type=int, default=0)
+    ap.add_argument("--index-type", default="flat")
+    ap.add_argument("--timeout", type=float, default=0.5, help="seconds the coordinator waits per query")
+    ap.add_argument("--raw-docs", help="corpus to index (default: a synthetic one of --chunks chunks)")
+    ap.add_argument("--chunks", type=int, default=4000)
+    ap.add_argument("--workdir", help="where to build (default: a temporary directory, removed afterwards)")
+    args = ap.parse_args()
+
+    raw_docs = Path(args.raw_docs).resolve() if args.raw_docs else None
+    if "INFOHUB_ONNX_DIR" not in os.environ and Path("data/onnx").exists():
+        os.environ["INFOHUB_ONNX_DIR"] = str(Path("data/onnx").resolve())  # before leaving the repo root
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="infohub-sharded-")).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        run(args, raw_docs)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run(args, raw_docs):
+    """The benchmark, in the current (scratch) directory."""
+    raw = Path("data/raw_docs")
+    if raw_docs is not None and not raw.exists():
+        raw.parent.mkdir(parents=True, exist_ok=True)
+        raw.symlink_to(raw_docs, target_is_directory=True)
+    elif not raw.exists():
+        from benchmarks.corpus import generate
+
+        generate(raw, args.chunks)
+
+    os.environ["INFOHUB_ANN_CANDIDATES"] = str(args.ann_candidates)  # read at import
+    os.environ.pop("INFOHUB_CACHE_DB", None)
+    from app import rag
+    from benchmarks.corpus import sample_queries
+    from ingest import build_index
+
+    if args.embedder == "stub":
+        from benchmarks.stubs import HashEmbedder
+
+        embedder = HashEmbedder()
+        rag.load_embedder = build_index.load_embedder = lambda model_name: embedder
+
+    with contextlib.redirect_stdout(sys.stderr):
+        single_build = build_index.build(args.index_type)
+    rag.load_store()
+    questions = sample_queries(raw, args.queries, seed=11)
+    rag.encode_queries(questions)  # both runs look the query vectors up
+    ref, single = timed(rag, questions)
+    n_chunks = len(rag._index.chunks)
+    # the most common term: chunks of equal length and term count tie, and the 60-candidate
+    # cutoff splits a tied group. BM25 only, all 60 kept, so every tie decision shows
+    bm25 = rag._index.bm25
+    tie_term = bm25.vocab.terms[int(np.argmax(np.diff(bm25.indptr)))]
+    tie_ref = [h["idx"] for h in rag._retrieve(rag._index, tie_term, 60, 60, False)]
+    neighbours_ref = neighbour_rows(rag, ref)
+
+    with contextlib.redirect_stdout(sys.stderr):
+        sharded_build = build_index.build(args.index_type, n_shards=args.shards)
+    procs, urls = start_shards(args.shards, args.ann_candidates)
+    try:
+        rag.use_shards(urls, args.timeout)
+        rag._shards.refresh()
+        shard_sizes = [s["n_chunks"] for s in rag._shards.status()]
+        got, sharded = timed(rag, questions)
+        tie_got = [h["idx"] for h in rag._shards.retrieve(tie_term, None, 60, 60, 0)[0]]
+        neighbours_got = neighbour_rows(rag, got)
+
+        # one shard frozen: every query waits out the timeout and is answered by the others
+        procs[0].send_signal(signal.SIGSTOP)
+        degraded_qs = questions[:20]
+        counts = {}
+        try:
+            partial, degraded = timed(rag, degraded_qs)
+            rag.retrieve(degraded_qs[0], counts=counts)  # partial hits are never cached
+        finally:
+            procs[0].send_signal(signal.SIGCONT)
+    finally:
+        for proc in procs:
+            proc.terminate()
+            proc.wait()
+
+    same = sum([h["idx"] for h in a] == [h["idx"] for h in b] for a, b in zip(ref, got))
+    overlap = sum(len({h["idx"] for h in a} & {h["idx"] for h in b}) for a, b in zip(ref, got))
+    kept = sum(len({h["idx"] for h in a} & {h["idx"] for h in b}) for a, b in zip(ref, partial))
+    print(f"{len(questions)} questions, {n_chunks} chunks, {args.shards} shards {shard_sizes}, "
+          f"index {args.index_type}, ann_candidates={args.ann_candidates}")
+    print(f"build: single {sum(single_build.values()):.1f} s, sharded {sum(sharded_build.values()):.1f} s")
+    print(f"{'retrieval':<26}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}")
+    for name, s in (("single index", single), (f"{args.shards} shards", sharded),
+                    (f"shard 0 frozen ({args.timeout:g} s)", degraded)):
+        print(f"{name:<26}{s['p50_ms']:>9.2f}{s['p90_ms']:>9.2f}{s['p99_ms']:>9.2f}")
+    print(f"identical top-k: {same}/{len(questions)}, hits in common: {overlap}/{sum(len(h) for h in ref)}")
+    print(f"tied BM25 candidates ({tie_term!r}, top 60): {'identical' if tie_got == tie_ref else 'DIFFERENT'}")
+    print(f"neighbouring chunks of the hits ({sum(map(len, neighbours_ref))}): "
+          + ("identical" if neighbours_got == neighbours_ref else "DIFFERENT"))
+    print(f"shard 0 frozen: {counts.get('shards_failed', 0)} shard(s) failed per query, "
+          f"{kept}/{sum(len(h) for h in ref[:len(degraded_qs)])} hits kept")
+
+
+if __name__ == "__main__":
+    main()
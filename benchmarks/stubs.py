@@ -0,0 +1,33 @@
+"""
+Offline stand-ins used by the benchmark suite: an embedder with the encode() interface
+of SentenceTransformer that needs no model download and costs far less than a forward pass.
+The stub LLM server lives in benchmarks.chat_load.
+"""
+import zlib
+
+import numpy as np
+
+from app.rag import _tokenize
+
+
+class HashEmbedder:
+    """
+    Deterministic bag-of-words embedding: each token hashes to a fixed random vector and
+    a text is the (normalized) sum. Texts sharing words get similar vectors, so the
+    rerank and ANN stages do real work on realistic shapes.
+    """
+
+    def __init__(self, dim=768, buckets=1 << 14, seed=0):
+        self.dim = dim
+        self.buckets = buckets
+        self.table = np.random.default_rng(seed).standard_normal((buckets, dim)).astype("float32")
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=False, show_progress_bar=False):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, text in enumerate(texts):
+            rows = [zlib.crc32(t.encode("utf-8")) % self.buckets for t in _tokenize(text)]
+            if rows:
+                out[i] = self.table[rows].sum(axis=0)
+        if normalize_embeddings:
+            out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+        return out
@@ -0,0 +1,233 @@
+"""
+Reproducible end-to-end benchmark: synthetic corpus -> build_index -> retrieve -> /chat.
+
+For each scale (chunks: 1k / 10k / 100k) a fresh interpreter, working in its own directory
+under --workdir, generates the corpus, times the build_index stages (full build and a
+no-op incremental rebuild), store loading, uncached retrieve() per stage (bm25, encode,
+ann, rerank, dedupe), and POST /chat under concurrency against a stub LLM. The embedder is
+benchmarks.stubs.HashEmbedder unless --embedder configured, so nothing needs a network.
+
+Results go to one JSON file; --compare prints the change against an earlier one.
+
+    python -m benchmarks.suite [--scales 1k,10k] [--out benchmarks/results/<rev>.json] [--compare old.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.corpus import SCALES, generate, sample_queries
+
+REPO = Path(__file__).resolve().parent.parent
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def summarize(seconds):
+    ms = sorted(1000 * s for s in seconds)
+    pct = lambda q: ms[min(len(ms) - 1, int(q * len(ms)))]
+    return {"n": len(ms), "p50_ms": pct(0.50), "p90_ms": pct(0.90), "p99_ms": pct(0.99),
+            "mean_ms": statistics.mean(ms)}
+
+
+def run_worker(args):
+    """One scale, in the current directory. Returns the result dict."""
+    os.environ["INFOHUB_ANN_CANDIDATES"] = str(args.ann_candidates)  # read at import
+    os.environ.pop("INFOHUB_CACHE_DB", None)
+
+    from benchmarks.chat_load import make_stub_llm, run_load, serve
+
+    llm_port = free_port()
+    serve(make_stub_llm(args.llm_delay), llm_port)
+    os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{llm_port}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    from app import api, rag
+    from ingest import build_index
+
+    if args.embedder == "stub":
+        from benchmarks.stubs import HashEmbedder
+
+        embedder = HashEmbedder()
+        rag.load_embedder = build_index.load_embedder = lambda model_name: embedder
+
+    n_chunks = SCALES[args.scale]
+    result = {"scale": args.scale, "target_chunks": n_chunks}
+
+    raw = Path("data/raw_docs")
+    if not raw.exists():
+        t0 = time.perf_counter()
+        result["n_docs"] = generate(raw, n_chunks, seed=args.seed)
+        result["generate_s"] = time.perf_counter() - t0
+    shutil.rmtree("data/emb_cache", ignore_errors=True)
+    shutil.rmtree("data/index", ignore_errors=True)
+
+    # build_index prints progress; keep stdout for the JSON result
+    with contextlib.redirect_stdout(sys.stderr):
+        build = build_index.build(args.index_type, vec_dtype=args.vec_dtype)
+        rebuild = build_index.build(args.index_type, vec_dtype=args.vec_dtype)
+    result["build_s"] = build
+    result["build_total_s"] = sum(build.values())
+    result["rebuild_s"] = rebuild
+    result["rebuild_total_s"] = sum(rebuild.values())
+
+    t0 = time.perf_counter()
+    rag.load_store()
+    result["load_s"] = time.perf_counter() - t0
+    result["n_chunks"] = len(rag._index.chunks)
+
+    queries = sample_queries(raw, args.queries, seed=args.seed + 1)
+    totals, stages = [], {}
+    for q in queries:
+        timings = {}
+        t0 = time.perf_counter()
+        rag.retrieve(q, k=5, timings=timings)
+        totals.append(time.perf_counter() - t0)
+        for stage, sec in timings.items():
+            stages.setdefault(stage, []).append(sec)
+    result["retrieve"] = summarize(totals)
+    result["retrieve"]["qps"] = len(totals) / sum(totals)
+    result["retrieve"]["stages_mean_ms"] = {s: 1000 * statistics.mean(v) for s, v in stages.items()}
+
+    cached = []
+    for q in queries:
+        t0 = time.perf_counter()
+        rag.retrieve(q, k=5)
+        cached.append(time.perf_counter() - t0)
+    result["retrieve_cached"] = summarize(cached)
+
+    # /chat: every request retrieves and reaches the (stub) LLM
+    api.answer_cache.get = lambda key: None
+    api.semantic_cache.lookup = lambda *a: None
+    api_port = free_port()
+    serve(api.app, api_port)
+    url = f"http://127.0.0.1:{api_port}/chat"
+    rag._hits_cache.clear()
+    latencies, errors, elapsed = asyncio.run(run_load(url, args.chat_requests, args.concurrency, queries))
+    result["chat"] = summarize(latencies) if latencies else {"n": 0}
+    result["chat"].update({"rps": len(latencies) / elapsed, "errors": errors, "concurrency": args.concurrency,
+                           "llm_delay_s": args.llm_delay})
+    return result
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO, capture_output=True, text=True)
+        return out.stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def flatten(d, prefix=""):
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            out.update(flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = v
+    return out
+
+
+def compare(old, new, threshold):
+    """Print timing metrics that moved by more than `threshold` (lower is better for _s/_ms)."""
+    old_scales = {s["scale"]: flatten(s) for s in old["scales"]}
+    print(f"\nvs {old['revision']} ({old['timestamp']}):")
+    for scale in new["scales"]:
+        before = old_scales.get(scale["scale"])
+        if before is None:
+            continue
+        for key, value in flatten(scale).items():
+            timing = any(part.endswith(("_s", "_ms")) for part in key.split("."))
+            if not timing or key not in before or before[key] <= 0:
+                continue
+            change = value / before[key] - 1
+            if abs(change) >= threshold:
+                flag = "SLOWER" if change > 0 else "faster"
+                print(f"  {scale['scale']:>5} {key:<36} {before[key]:10.3f} -> {value:10.3f}  {change:+.0%} {flag}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", default="1k,10k", help=f"comma-separated, from {', '.join(SCALES)}")
+    ap.add_argument("--workdir", default="data/bench", help="corpora and indexes, one directory per scale")
+    ap.add_argument("--out", default=None, help="results JSON (default benchmarks/results/<git revision>.json)")
+    ap.add_argument("--compare", default=None, help="earlier results JSON to diff against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="relative change reported by --compare")
+    ap.add_argument("--embedder", choices=("stub", "configured"), default="stub")
+    ap.add_argument("--index-type", default="flat")
+    ap.add_argument("--vec-dtype", default="float32")
+    ap.add_argument("--ann-candidates", type=int, default=20, help="0 skips the FAISS stage, like the API default")
+    ap.add_argument("--queries", type=int, default=300)
+    ap.add_argument("--chat-requests", type=int, default=256)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--llm-delay", type=float, default=0.2)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--scale", help=argparse.SUPPRESS)
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(args)))
+        return
+
+    config = {k: v for k, v in vars(args).items() if k not in ("scale", "worker", "out", "compare", "workdir")}
+    results = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": config,
+        "scales": [],
+    }
+    for scale in args.scales.split(","):
+        if scale not in SCALES:
+            raise SystemExit(f"unknown scale {scale!r}; expected one of {', '.join(SCALES)}")
+        cwd = Path(args.workdir).resolve() / scale
+        cwd.mkdir(parents=True, exist_ok=True)
+        print(f"[{scale}] running in {cwd} ...", flush=True)
+        out = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--worker", "--scale", scale,
+                              *[str(x) for x in _forward_args(args)]],
+                             cwd=cwd, env={**os.environ, "PYTHONPATH": str(REPO)},
+                             stdout=subprocess.PIPE, text=True, check=True)
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        results["scales"].append(result)
+        print(f"[{scale}] {result['n_chunks']} chunks: build {result['build_total_s']:.1f}s, "
+              f"retrieve p50 {result['retrieve']['p50_ms']:.2f} ms, "
+              f"chat {result['chat']['rps']:.0f} req/s p50 {result['chat'].get('p50_ms', 0):.0f} ms")
+
+    out_path = Path(args.out or REPO / "benchmarks" / "results" / f"{results['revision']}.json")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Saved: {out_path}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), results, args.threshold)
+
+
+def _forward_args(args):
+    # worker settings that are not per-scale
+    names = ("embedder", "index_type", "vec_dtype", "ann_candidates", "queries", "chat_requests",
+             "concurrency", "llm_delay", "seed")
+    out = []
+    for name in names:
+        out += ["--" + name.replace("_", "-"), getattr(args, name)]
+    return out
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Memory saved and ranking drift of float16 / int8 embedding storage (build_index --vec-dtype)
+against float32 on a fixed query set.
+
+Reference vectors are float32: the embedding cache of the current model by default,
+a float32 index_vecs.npy via --vecs, or --synthetic. Queries are the questions in
+--questions (one per line, encoded with the model) or, without a model, fixed noisy
+copies of corpus vectors.
+
+    python -m benchmarks.vector_precision [--questions questions.txt] [--k 10] [--candidates 60]
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.embedder import embedder_id, load_embedder
+from app.rag import MODEL_NAME, VEC_DTYPES, VectorStore
+
+EMB_CACHE_VECS = Path("data/emb_cache") / embedder_id(MODEL_NAME).replace("/", "__") / "vecs.npy"
+
+
+def normalize(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype("float32")
+
+
+def load_reference(args):
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        centers = rng.standard_normal((max(1, args.synthetic // 200), args.dim))
+        return normalize(centers[rng.integers(len(centers), size=args.synthetic)]
+                         + 0.5 * rng.standard_normal((args.synthetic, args.dim)))
+    store = VectorStore.load(args.vecs or EMB_CACHE_VECS)
+    if store.dtype != "float32":
+        raise SystemExit(f"{args.vecs} is stored as {store.dtype}; pass float32 vectors as the reference")
+    return store.reconstruct()
+
+
+def load_queries(args, vecs):
+    if args.questions:
+        questions = [q.strip() for q in open(args.questions, encoding="utf-8") if q.strip()]
+        model = load_embedder(MODEL_NAME)
+        return np.asarray(model.encode(["query: " + q for q in questions], normalize_embeddings=True), dtype="float32")
+    rng = np.random.default_rng(1)
+    base = vecs[rng.choice(len(vecs), size=min(args.queries, len(vecs)), replace=False)]
+    return normalize(base + 0.05 * rng.standard_normal(base.shape))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--vecs", default=None, help=f"float32 reference matrix (default {EMB_CACHE_VECS})")
+    ap.add_argument("--synthetic", type=int, default=0, help="generate N synthetic vectors instead")
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--questions", default=None)
+    ap.add_argument("--queries", type=int, default=500, help="noisy corpus queries when --questions is not given")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--candidates", type=int, default=60, help="rerank candidate set size, as in retrieve()")
+    args = ap.parse_args()
+
+    vecs = load_reference(args)
+    queries = load_queries(args, vecs)
+    k, n_cand = min(args.k, len(vecs)), min(args.candidates, len(vecs))
+    print(f"corpus={len(vecs)} x {vecs.shape[1]}  queries={len(queries)}  k={k}  candidates={n_cand}\n")
+
+    all_rows = np.arange(len(vecs))
+    ref = VectorStore.quantize(vecs, "float32")
+    ref_scores = np.stack([ref.scores(all_rows, q) for q in queries])
+    ref_top = np.argsort(-ref_scores, axis=1, kind="stable")[:, :k]
+    # the rerank only orders a candidate set; use each query's top-n_cand as a stand-in
+    cand = np.argsort(-ref_scores, axis=1, kind="stable")[:, :n_cand]
+
+    print(f"{'dtype':<9}{'MB':>9}{'saved':>8}{'top-1 same':>12}{'overlap@k':>11}{'rerank same':>13}"
+          f"{'max |err|':>11}{'rerank ms':>11}")
+    for dtype in VEC_DTYPES:
+        store = VectorStore.quantize(vecs, dtype)
+        scores = np.stack([store.scores(all_rows, q) for q in queries])
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        overlap = np.mean([len(np.intersect1d(a, b)) / k for a, b in zip(top, ref_top)])
+        top1 = np.mean(top[:, 0] == ref_top[:, 0])
+
+        t0 = time.perf_counter()
+        rerank_same = 0
+        for q, rows in zip(queries, cand):
+            order = rows[np.argsort(-store.scores(rows, q), kind="stable")]
+            rerank_same += np.array_equal(order[:k], rows[:k])
+        rerank_ms = 1000 * (time.perf_counter() - t0) / len(queries)
+
+        print(f"{dtype:<9}{store.nbytes / 2**20:>9.1f}{1 - store.nbytes / ref.nbytes:>8.0%}{top1:>12.3f}"
+              f"{overlap:>11.3f}{rerank_same / len(queries):>13.3f}{np.abs(scores - ref_scores).max():>11.4f}"
+              f"{rerank_ms:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Per-worker memory of a multi-worker API: `uvicorn --workers N` (each worker loads the
+index and model itself) versus gunicorn.conf.py (loaded once in the master, workers forked
+from it). Each server gets --requests /chat requests against a stub LLM, then every
+process's Rss, Pss (shared pages split between their users) and Private memory is read
+from /proc/<pid>/smaps_rollup. Linux only; run from a directory with a built index.
+
+    python -m benchmarks.worker_memory [--workers 4] [--embedder stub|configured] [--modes uvicorn,gunicorn]
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+REPO = Path(__file__).resolve().parent.parent
+APP = "benchmarks.worker_memory:app"
+
+
+def __getattr__(name):
+    # the servers import APP from here: swap in the stub embedder before the API loads anything
+    if name != "app":
+        raise AttributeError(name)
+    if os.environ.get("INFOHUB_BENCH_EMBEDDER") == "stub":
+        from app import rag
+        from benchmarks.stubs import HashEmbedder
+
+        embedder = HashEmbedder()
+        rag.load_embedder = lambda model_name: embedder
+    from app.api import app
+
+    return app
+
+
+def children(pid):
+    kids = []
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+            cmdline = (stat.parent / "cmdline").read_bytes()
+        except OSError:
+            continue
+        if int(fields[1]) == pid and b"resource_tracker" not in cmdline:
+            kids.append(int(stat.parent.name))
+    return sorted(kids)
+
+
+def memory(pid):
+    """Rss, Pss and Private (clean + dirty) of a process, in MB."""
+    kb = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        key, value = line.split(":", 1)
+        kb[key] = int(value.split()[0])
+    return {"rss": kb["Rss"] / 1024, "pss": kb["Pss"] / 1024,
+            "private": (kb["Private_Clean"] + kb["Private_Dirty"]) / 1024}
+
+
+def command(mode, workers, port):
+    if mode == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", APP, "--workers", str(workers), "--port", str(port),
+                "--log-level", "warning"]
+    return [sys.executable, "-m", "gunicorn", "-c", str(REPO / "gunicorn.conf.py"), APP,
+            "--workers", str(workers), "--bind", f"127.0.0.1:{port}", "--log-level", "warning"]
+
+
+def wait_ready(url, proc, workers, timeout=600):
+    t0 = time.perf_counter()
+    while time.perf_counter() - t0 < timeout:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with {proc.returncode}")
+        try:
+            # every worker warms up before it accepts: ready once all of them answer
+            if httpx.get(url, timeout=1).status_code == 200 and len(children(proc.pid)) >= workers:
+                return time.perf_counter() - t0
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit("server did not become ready")
+
+
+def run_mode(mode, args, llm_url, questions):
+    from benchmarks.chat_load import run_load
+    from benchmarks.suite import free_port
+
+    port = free_port()
+    env = dict(os.environ, OPENAI_BASE_URL=llm_url, OPENAI_API_KEY="stub", INFOHUB_BENCH_EMBEDDER=args.embedder,
+               PYTHONPATH=os.pathsep.join(filter(None, [str(REPO), os.environ.get("PYTHONPATH")])))
+    proc = subprocess.Popen(command(mode, args.workers, port), env=env)
+    try:
+        ready_s = wait_ready(f"http://127.0.0.1:{port}/metrics", proc, args.workers)
+        asyncio.run(run_load(f"http://127.0.0.1:{port}/chat", args.requests, args.concurrency, questions))
+        time.sleep(args.settle)
+        workers = [memory(pid) for pid in children(proc.pid)]
+        master = memory(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    mean = lambda key: sum(w[key] for w in workers) / len(workers)
+    total_pss = master["pss"] + sum(w["pss"] for w in workers)
+    print(f"{mode:<9}{len(workers):>8}{mean('rss'):>10.0f}{mean('pss'):>10.0f}{mean('private'):>10.0f}"
+          f"{master['rss']:>11.0f}{total_pss:>11.0f}{ready_s:>9.1f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--modes", default="uvicorn,gunicorn")
+    ap.add_argument("--embedder", choices=("stub", "configured"), default="configured",
+                    help="stub: benchmarks.stubs.HashEmbedder, for indexes the suite built")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--settle", type=float, default=1.0, help="seconds to wait after the load before measuring")
+    ap.add_argument("--raw-docs", default="data/raw_docs")
+    args = ap.parse_args()
+
+    from benchmarks.chat_load import QUESTIONS, make_stub_llm, serve
+    from benchmarks.corpus import sample_queries
+    from benchmarks.suite import free_port
+
+    llm_port = free_port()
+    serve(make_stub_llm(0.0), llm_port)
+    questions = sample_queries(args.raw_docs, args.requests, seed=7) if args.embedder == "stub" else QUESTIONS
+
+    print(f"{args.workers} workers, {args.requests} /chat requests per server; MB, per-worker means")
+    print(f"{'server':<9}{'workers':>8}{'rss':>10}{'pss':>10}{'private':>10}{'master rss':>11}"
+          f"{'total pss':>11}{'ready s':>9}")
+    for mode in args.modes.split(","):
+        run_mode(mode, args, f"http://127.0.0.1:{llm_port}/v1", questions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+"""
+Multi-worker serving with the index shared between workers:
+
+    gunicorn -c gunicorn.conf.py app.api:app
+
+The app is imported and the index (plus the torch model) loaded once in the master,
+then the workers are forked from it: memory-mapped artifacts are shared through the
+page cache, the model's weights through copy-on-write pages. Each worker runs
+rag.warmup() in the app's startup before it accepts requests.
+"""
+import os
+
+from app import rag
+
+bind = os.environ.get("INFOHUB_BIND", "127.0.0.1:8000")
+workers = int(os.environ.get("INFOHUB_WORKERS", "4"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120  # the first load of a large index can take a while
+
+
+def when_ready(server):
+    # after the app import, before the first fork
+    rag.preload()
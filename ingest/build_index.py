@@ -1,18 +1,62 @@
+import argparse
+import hashlib
 import json
+import math
+import os
 import re
+import shutil
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from collections import Counter
 
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+
+from app import versions
+from app.embedder import embedder_id, load_embedder
+from app.rag import (
+    VEC_DTYPES,
+    BM25Builder,
+    ChunkStoreWriter,
+    VectorStore,
+    _tokenize,
+    set_search_params,
+)
+from ingest.dedupe import NearDupIndex, minhash
 
 RAW_DIR = Path("data/raw_docs")
-OUT_INDEX = Path("data/index.faiss")
-OUT_META = Path("data/index_meta.json")
+CACHE_DIR = Path("data/emb_cache")  # embeddings keyed by (model, chunk hash)
+BUILD_DIR = Path("data/build")  # checkpoint of an unfinished build; removed once it completes
+STAGE_DIR = BUILD_DIR / "index"  # the new version's artifacts (app.versions layout) until published
+
+# Streaming build: raw docs are cleaned/chunked in a process pool, DOC_WINDOW at a time,
+# and chunks are embedded and checkpointed SHARD_SIZE at a time, so memory stays flat
+BUILD_WORKERS = os.cpu_count() or 1
+DOC_WINDOW = 256
+SHARD_SIZE = 2048
+FAISS_TRAIN_MAX = 65536  # rows sampled to train IVF / SQ indexes
+# MinHash estimate of Jaccard similarity (word 5-gram shingles) at which a doc or chunk
+# counts as a near-duplicate of an earlier one and is dropped; 0 turns this off
+NEAR_DUP_THRESHOLD = 0.85
 
 MODEL_NAME = "intfloat/multilingual-e5-base"  # multilingual, good for Georgian
 
+# FAISS index type and its build/search knobs; recorded in the version manifest for the API
+INDEX_TYPES = ("flat", "flat_fp16", "flat_sq8", "hnsw", "ivf_flat", "ivf_pq")
+DEFAULT_INDEX_PARAMS = {
+    "hnsw_m": 32,           # graph degree
+    "ef_construction": 200,
+    "ef_search": 64,        # query-time beam width
+    "nlist": 0,             # IVF cells; 0 = about 4*sqrt(n)
+    "nprobe": 16,           # IVF cells visited per query
+    "pq_m": 16,             # PQ sub-quantizers (must divide dim)
+    "pq_bits": 8,
+}
+SEARCH_PARAMS = ("ef_search", "nprobe")  # query-time only; changing them needs no rebuild
+
 # --- Cleaning helpers ---
 
 WS_RE = re.compile(r"\s+")
@@ -55,21 +99,46 @@ def clean_text_to_lines(text: str):
         lines.append(ln)
     return lines
 
+def line_fingerprint(line: str) -> int:
+    # 64-bit stand-in for the line: presence is counted without holding any line text
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest(), "little")
+
+def line_fingerprints(lines):
+    """Distinct fingerprints of a document's lines, as a sorted uint64 array."""
+    return np.unique(np.fromiter((line_fingerprint(ln) for ln in lines), dtype=np.uint64, count=len(lines)))
+
+def common_lines(docs_fingerprints, common_threshold=0.35):
+    """
+    Fingerprints of the lines present in at least `common_threshold` of the documents.
+    Takes one line_fingerprints() array per doc; counts are merged in sorted arrays (16 bytes per distinct line).
+    """
+    doc_count = 0
+    values, counts = np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+    pending = []
+
+    def merge():
+        merged, inverse = np.unique(np.concatenate([values] + pending), return_inverse=True)
+        weights = np.concatenate([counts] + [np.ones(len(p), dtype=np.int64) for p in pending])
+        pending.clear()
+        return merged, np.bincount(inverse, weights=weights, minlength=len(merged)).astype(np.int64)
+
+    for fps in docs_fingerprints:
+        doc_count += 1
+        pending.append(fps)
+        if sum(len(p) for p in pending) > len(values) + (1 << 20):
+            values, counts = merge()
+    values, counts = merge()
+    return set(values[counts >= common_threshold * doc_count].tolist()) if doc_count else set()
+
 def drop_globally_common_lines(all_docs_lines, common_threshold=0.35):
     """
     Remove lines that appear in too many documents (nav/footer repeated everywhere).
     common_threshold = fraction of docs that contain the line.
     """
-    doc_count = len(all_docs_lines)
-    presence = Counter()
-    for lines in all_docs_lines:
-        for ln in set(lines):
-            presence[ln] += 1
-
-    too_common = {ln for ln, c in presence.items() if c / doc_count >= common_threshold}
+    too_common = common_lines((line_fingerprints(lines) for lines in all_docs_lines), common_threshold)
     filtered = []
     for lines in all_docs_lines:
-        filtered.append([ln for ln in lines if ln not in too_common])
+        filtered.append([ln for ln in lines if line_fingerprint(ln) not in too_common])
     return filtered
 
 def chunk_text(text: str, chunk_size=900, overlap=200):
@@ -83,72 +152,573 @@ def chunk_text(text: str, chunk_size=900, overlap=200):
         start = max(0, end - overlap)
     return chunks
 
+# --- Per-document work (runs in the build's process pool) ---
+
+def read_doc(fp):
+    doc = json.loads(Path(fp).read_text(encoding="utf-8"))
+    return doc.get("url", ""), doc.get("title", ""), clean_text_to_lines(doc.get("text", ""))
+
+def doc_line_fingerprints(fp):
+    url, _, lines = read_doc(fp)
+    return url, line_fingerprints(lines)
+
+_too_common = frozenset()
+_near_dup = False
+
+def _init_chunk_worker(too_common, near_dup):
+    global _too_common, _near_dup
+    _too_common, _near_dup = too_common, near_dup
+
+def doc_chunks(fp):
+    """
+    (url, title, doc signature, [(chunk, tokens, chunk signature), ...]) for one raw doc,
+    minus the globally common lines. Signatures are MinHashes, None unless near-dup detection is on.
+    """
+    url, title, lines = read_doc(fp)
+    # Join back to text for chunking
+    text = " ".join(ln for ln in lines if line_fingerprint(ln) not in _too_common)
+    text = WS_RE.sub(" ", text).strip()
+
+    # Skip docs that became too short after cleaning
+    if len(text) < 1200:
+        return url, title, None, []
+
+    # Skip tiny chunks
+    chunks = [ch for ch in chunk_text(text, chunk_size=900, overlap=200) if len(ch) >= 300]
+    chunks = [(ch, _tokenize(ch)) for ch in chunks]
+    if not _near_dup:
+        return url, title, None, [(ch, tokens, None) for ch, tokens in chunks]
+    return url, title, minhash(_tokenize(text)), [(ch, tokens, minhash(tokens)) for ch, tokens in chunks]
+
+def parallel_map(fn, items, workers, initializer=None, initargs=()):
+    """
+    map(fn, items) in order on `workers` processes. Items are submitted one DOC_WINDOW
+    ahead of the consumer, so results never pile up faster than they are used.
+    """
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        yield from map(fn, items)
+        return
+    windows = [items[i:i + DOC_WINDOW] for i in range(0, len(items), DOC_WINDOW)]
+    chunksize = max(1, DOC_WINDOW // (4 * workers))
+    with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = pool.map(fn, windows[0], chunksize=chunksize) if windows else iter(())
+        for window in windows[1:]:
+            ahead = pool.map(fn, window, chunksize=chunksize)
+            yield from pending
+            pending = ahead
+        yield from pending
+
+# --- Incremental embedding ---
+
+def chunk_hash(chunk: str) -> bytes:
+    return hashlib.sha1(chunk.encode("utf-8")).digest()
+
+def url_shard(url: str, n_shards: int) -> int:
+    # by URL, so a doc's chunks stay together and the per-URL de-dupe needs one shard only
+    return zlib.crc32(url.encode("utf-8")) % n_shards
+
+def chunk_id(url: str, chunk: str) -> int:
+    # stable 63-bit FAISS id: same URL + same text keeps its id across builds
+    h = hashlib.sha1(f"{url}\n{chunk}".encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "little") & 0x7FFFFFFFFFFFFFFF
+
+def _cache_dir(model_name: str) -> Path:
+    return CACHE_DIR / model_name.replace("/", "__")
+
+def _file_crc(path, block=1 << 24):
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(block):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+class EmbeddingCache:
+    """
+    The previous build's (chunk hash -> vector) cache, memory-mapped: keys.npz holds one
+    20-byte hash per row of vecs.npy, and lookups binary-search a sorted copy of the keys.
+    keys.npz also records the row count and CRC-32 of the vecs.npy it was written with; a
+    pair that doesn't match (a crash between the two writes) is ignored, not trusted.
+    """
+
+    def __init__(self, model_name: str):
+        d = _cache_dir(model_name)
+        self.keys = np.empty(0, dtype="S20")
+        self.vecs = None
+        if (d / "keys.npz").exists() and (d / "vecs.npy").exists():
+            with np.load(d / "keys.npz") as saved:
+                keys, n_rows, crc = saved["keys"], int(saved["rows"]), int(saved["crc"])
+            vecs = np.load(d / "vecs.npy", mmap_mode="r")
+            if len(keys) == n_rows == len(vecs) and _file_crc(d / "vecs.npy") == crc:
+                self.keys = np.ascontiguousarray(keys).view("S20").ravel()
+                self.vecs = vecs
+            else:
+                print(f"Embedding cache {d}/ is inconsistent (interrupted update?); ignoring it")
+        self.order = np.argsort(self.keys, kind="stable")
+        self.sorted = self.keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def rows(self, hashes):
+        """Cache row of every hash, -1 where missing."""
+        q = np.frombuffer(b"".join(hashes), dtype="S20")
+        if not len(self.sorted):
+            return np.full(len(q), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted, q), len(self.sorted) - 1)
+        return np.where(self.sorted[pos] == q, self.order[pos], -1)
+
+    @staticmethod
+    def replace(model_name: str, hashes, vecs_path):
+        """Make (hashes, the float32 matrix at vecs_path) the cache: only live chunks are kept."""
+        d = _cache_dir(model_name)
+        d.mkdir(parents=True, exist_ok=True)
+        keys = np.frombuffer(hashes, dtype=np.uint8).reshape(-1, 20)
+        tmp = d / "keys.tmp.npz"
+        np.savez(tmp, keys=keys, rows=len(keys), crc=_file_crc(vecs_path))
+        # either file may be the new one after a crash; the row count and CRC tell
+        os.replace(tmp, d / "keys.npz")
+        os.replace(vecs_path, d / "vecs.npy")
+        (d / "keys.npy").unlink(missing_ok=True)  # unchecked layout of older builds
+
+class ShardEmbedder:
+    """
+    Embeds chunks SHARD_SIZE at a time into BUILD_DIR/shard_*.npy. A shard whose saved ids
+    match is reused as it is (resume); otherwise only texts missing from the cache are encoded.
+    """
+
+    def __init__(self, cache: EmbeddingCache):
+        self.cache = cache
+        self.embedder = None
+        self.dim = None
+        self.shards = []
+        self.stats = Counter()
+        self.seconds = 0.0
+
+    def _paths(self, i):
+        return BUILD_DIR / f"shard_{i:05d}.npy", BUILD_DIR / f"shard_{i:05d}.ids.npy"
+
+    def add(self, ids, hashes, texts):
+        t0 = time.perf_counter()
+        vecs_path, ids_path = self._paths(len(self.shards))
+        ids = np.asarray(ids, dtype=np.int64)
+        try:
+            done = ids_path.exists() and np.array_equal(np.load(ids_path), ids)
+        except (OSError, ValueError):
+            done = False  # torn write from a crash: redo the shard
+        if done:
+            self.stats["resumed"] += len(ids)
+            vecs = np.load(vecs_path, mmap_mode="r")
+        else:
+            vecs = self._embed(hashes, texts)
+            np.save(vecs_path, vecs)
+            np.save(ids_path, ids)  # ids last: their presence marks a complete shard
+        self.dim = vecs.shape[1]
+        self.shards.append(vecs_path)
+        self.seconds += time.perf_counter() - t0
+
+    def _embed(self, hashes, texts):
+        rows = self.cache.rows(hashes)
+        hit, todo = np.flatnonzero(rows >= 0), np.flatnonzero(rows < 0)
+        self.stats["cached"] += len(hit)
+        self.stats["embedded"] += len(todo)
+        new = None
+        if len(todo):
+            if self.embedder is None:
+                self.embedder = load_embedder(MODEL_NAME)
+            new = np.asarray(self.embedder.encode(["passage: " + texts[i] for i in todo],
+                                                  normalize_embeddings=True), dtype="float32")
+        dim = new.shape[1] if new is not None else self.cache.vecs.shape[1]
+        vecs = np.empty((len(rows), dim), dtype="float32")
+        if new is not None:
+            vecs[todo] = new
+        if len(hit):
+            vecs[hit] = self.cache.vecs[rows[hit]]
+        return vecs
+
+    def assemble(self, path, n):
+        """Concatenate the shards into one float32 .npy at `path` (memory-mapped, n rows)."""
+        out = np.lib.format.open_memmap(path, mode="w+", dtype="float32", shape=(n, self.dim))
+        start = 0
+        for shard in self.shards:
+            block = np.load(shard, mmap_mode="r")
+            out[start:start + len(block)] = block
+            start += len(block)
+        out.flush()
+        return np.load(path, mmap_mode="r")
+
+def make_faiss_index(index_type, vecs, params, n_total=None):
+    """
+    Empty ID-mapped inner-product index (cosine on normalized vectors), trained on `vecs` if needed.
+    `n_total` is the size of the whole collection when `vecs` is a training sample of it.
+    Returns (index, params) where params has auto values (nlist) resolved.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **params}
+    n, dim = vecs.shape
+    n_total = n_total or n
+    metric = faiss.METRIC_INNER_PRODUCT
+
+    if index_type == "flat":
+        base = faiss.IndexFlatIP(dim)
+    elif index_type in ("flat_fp16", "flat_sq8"):
+        # exhaustive search over half-size / quarter-size codes
+        qtype = faiss.ScalarQuantizer.QT_fp16 if index_type == "flat_fp16" else faiss.ScalarQuantizer.QT_8bit
+        base = faiss.IndexScalarQuantizer(dim, qtype, metric)
+        base.train(vecs)
+    elif index_type == "hnsw":
+        base = faiss.IndexHNSWFlat(dim, params["hnsw_m"], metric)
+        base.hnsw.efConstruction = params["ef_construction"]
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        # FAISS wants ~39 training points per cell
+        nlist = params["nlist"] or int(4 * math.sqrt(n_total))
+        params["nlist"] = nlist = max(1, min(nlist, n // 39 or 1))
+        quantizer = faiss.IndexFlatIP(dim)
+        if index_type == "ivf_flat":
+            base = faiss.IndexIVFFlat(quantizer, dim, nlist, metric)
+        else:
+            base = faiss.IndexIVFPQ(quantizer, dim, nlist, params["pq_m"], params["pq_bits"], metric)
+        base.train(vecs)
+    else:
+        raise ValueError(f"unknown index type {index_type!r}; expected one of {INDEX_TYPES}")
+
+    index = faiss.IndexIDMap(base)
+    set_search_params(index, index_type, params)
+    return index, params
+
+def training_sample(vecs, max_rows=FAISS_TRAIN_MAX):
+    """Evenly spaced rows of a (memory-mapped) matrix, at most `max_rows` of them."""
+    if len(vecs) <= max_rows:
+        return np.asarray(vecs[:], dtype="float32")
+    return np.asarray(vecs[np.linspace(0, len(vecs) - 1, max_rows).astype(np.int64)], dtype="float32")
+
+class RowSubset:
+    """vecs[rows] without the copy: indexing reads only the rows asked for, so it can be written in blocks."""
+
+    def __init__(self, vecs, rows):
+        self.vecs = vecs
+        self.rows = rows
+        self.shape = (len(rows), vecs.shape[1])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        return self.vecs[self.rows[key]]
+
+def previous_build():
+    """Manifest of the CURRENT index version, or None if there is none (or it can't be used)."""
+    version = versions.current()
+    if version is None:
+        return None
+    try:
+        return versions.read_manifest(version)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring the current index {version}: {e}")
+        return None
+
+def update_faiss_index(ids, vecs, index_type="flat", params=None):
+    """
+    Apply additions/deletions to the previous build's ID-mapped index.
+    Builds a fresh one if there is none, it was built with another model/type/build params,
+    or the index type can't delete (HNSW). `vecs` may be memory-mapped; it is added in shards.
+    """
+    dim = vecs.shape[1]
+    index = None
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    info = previous_build()
+    if info is not None and info.get("shards", 1) == 1:
+        prev = info["index"]
+        same_params = all(prev["params"].get(k) == v for k, v in params.items()
+                          if k not in SEARCH_PARAMS and (k != "nlist" or v))
+        if (info.get("embedder", info.get("model")) == embedder_id(MODEL_NAME) and info.get("dim") == dim
+                and prev["type"] == index_type and same_params):
+            index = faiss.read_index(str(versions.path(info["version"]) / versions.ANN_FILE))
+            params = {**prev["params"], **{k: params[k] for k in SEARCH_PARAMS}}
+            set_search_params(index, index_type, params)
+            if not isinstance(index, faiss.IndexIDMap):
+                index = None
+
+    if index is not None:
+        old_ids = faiss.vector_to_array(index.id_map)
+        removed = np.setdiff1d(old_ids, ids)
+        if len(removed):
+            try:
+                index.remove_ids(removed)
+            except RuntimeError:
+                index = None  # e.g. HNSW has no deletions
+
+    if index is None:
+        index, params = make_faiss_index(index_type, training_sample(vecs), params, n_total=len(vecs))
+        old_ids = np.empty(0, dtype=np.int64)
+        removed = old_ids
+
+    added = ~np.isin(ids, old_ids)
+    for start in range(0, len(ids), SHARD_SIZE):
+        rows = start + np.flatnonzero(added[start:start + SHARD_SIZE])
+        if len(rows):
+            index.add_with_ids(np.asarray(vecs[rows], dtype="float32"), ids[rows])
+
+    print(f"FAISS {index_type} index: +{int(added.sum())} added, -{len(removed)} removed, {index.ntotal} total")
+    return index, params
+
+def write_faiss_shards(stage_dirs, shard_rows, ids, vecs, index_type="flat", params=None):
+    """
+    A fresh ID-mapped index per index shard, written next to its chunk ids and corpus-wide
+    rows as soon as it is built (sharded builds don't update the previous indexes).
+    `vecs` may be memory-mapped: each shard's rows are read SHARD_SIZE at a time.
+    """
+    params = {**DEFAULT_INDEX_PARAMS, **(params or {})}
+    for shard, (out, rows) in enumerate(zip(stage_dirs, shard_rows)):
+        shard_vecs = RowSubset(vecs, rows)
+        index, _ = make_faiss_index(index_type, training_sample(shard_vecs), params, n_total=len(rows))
+        for start in range(0, len(rows), SHARD_SIZE):
+            block = slice(start, start + SHARD_SIZE)
+            index.add_with_ids(np.asarray(shard_vecs[block], dtype="float32"), ids[rows[block]])
+        faiss.write_index(index, str(out / versions.ANN_FILE))
+        np.save(out / versions.ANN_IDS_FILE, ids[rows])
+        np.save(out / versions.ROWS_FILE, rows)
+        print(f"FAISS {index_type} index, shard {shard}: {index.ntotal} total")
+    return params
+
 # --- Main build ---
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    ap.add_argument("--vec-dtype", choices=VEC_DTYPES, default="float32",
+                    help="precision of the stored embedding matrix used by the rerank")
+    ap.add_argument("--workers", type=int, default=BUILD_WORKERS, help="processes cleaning and chunking docs")
+    ap.add_argument("--near-dup-threshold", type=float, default=NEAR_DUP_THRESHOLD,
+                    help="MinHash Jaccard estimate above which docs/chunks are dropped as near-duplicates; 0 = off")
+    ap.add_argument("--keep-versions", type=int, default=versions.KEEP_VERSIONS,
+                    help="index versions kept under data/index/, the CURRENT one included")
+    ap.add_argument("--shards", type=int, default=1,
+                    help="split the index into N shards, each served by its own app.shard process")
+    for name, default in DEFAULT_INDEX_PARAMS.items():
+        ap.add_argument("--" + name.replace("_", "-"), type=int, default=default)
+    args = ap.parse_args()
+    build(args.index_type, {name: getattr(args, name) for name in DEFAULT_INDEX_PARAMS}, args.vec_dtype,
+          args.workers, args.near_dup_threshold, args.keep_versions, args.shards)
+
+def _lap(timings, stage, t0):
+    now = time.perf_counter()
+    timings[stage] = now - t0
+    return now
+
+def inputs_digest(files):
+    """Identifies the raw docs (names, sizes, mtimes) a checkpoint was made from."""
+    h = hashlib.sha1()
+    for fp in files:
+        st = fp.stat()
+        h.update(f"{fp.name}\0{st.st_size}\0{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()
+
+def open_checkpoint(files, common_threshold):
+    """
+    Resume state of an interrupted build of the same inputs, or a fresh BUILD_DIR.
+    Returns (globally common lines, file names in build order) if pass 1 already ran, else None.
+    """
+    state_path = BUILD_DIR / "state.json"
+    key = {"inputs": inputs_digest(files), "embedder": embedder_id(MODEL_NAME),
+           "shard_size": SHARD_SIZE, "common_threshold": common_threshold}
+    if state_path.exists():
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+        if state.get("key") == key and "order" in state:
+            print(f"Resuming the interrupted build in {BUILD_DIR}/")
+            return set(state["common_lines"]), state["order"]
+    shutil.rmtree(BUILD_DIR, ignore_errors=True)
+    BUILD_DIR.mkdir(parents=True)
+    state_path.write_text(json.dumps({"key": key}), encoding="utf-8")
+    return None
+
+def save_checkpoint(too_common, order):
+    state_path = BUILD_DIR / "state.json"
+    state = json.loads(state_path.read_text(encoding="utf-8"))
+    state["common_lines"] = sorted(too_common)
+    state["order"] = order
+    state_path.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+
+def build(index_type="flat", index_params=None, vec_dtype="float32", workers=BUILD_WORKERS,
+          near_dup_threshold=NEAR_DUP_THRESHOLD, keep_versions=versions.KEEP_VERSIONS, n_shards=1):
+    """
+    Build the index as a new version under data/index/ and make it CURRENT, keeping
+    `keep_versions` versions; returns seconds spent per stage. A build identical to the
+    CURRENT one (same build id) publishes nothing.
+
+    With `n_shards` > 1 the docs are split by URL hash into that many index shards, each
+    with its own chunk store, BM25 index, embedding matrix and FAISS index, to be served
+    by one app.shard process each. Shard BM25 indexes keep the whole corpus's statistics.
+
+    Streams: docs are read lazily and cleaned/chunked on `workers` processes, chunk text
+    goes straight to disk, and embeddings are made and checkpointed per shard, so memory
+    does not grow with the corpus beyond ids and lexical postings. Re-running after a crash
+    reuses the finished shards.
+
+    Docs are processed in URL order. Docs and chunks whose MinHash similarity to an earlier
+    kept one reaches `near_dup_threshold` are dropped before they are embedded, so of
+    near-duplicate docs the one with the lowest URL stays, whatever the file names.
+    """
+    timings = {}
+    t0 = time.perf_counter()
     files = sorted(RAW_DIR.glob("doc_*.json"))
     if not files:
         raise SystemExit("No raw docs found in data/raw_docs. Run fetch_docs.py first.")
 
-    docs = []
-    all_lines = []
-    for fp in files:
-        doc = json.loads(fp.read_text(encoding="utf-8"))
-        lines = clean_text_to_lines(doc.get("text", ""))
-        all_lines.append(lines)
-        docs.append({
-            "url": doc.get("url", ""),
-            "title": doc.get("title", ""),
-            "lines": lines
-        })
-
-    # Drop lines that are repeated across many docs (footer/nav)
-    all_lines = drop_globally_common_lines(all_lines, common_threshold=0.35)
-    for d, lines in zip(docs, all_lines):
-        d["lines"] = lines
+    # Pass 1: lines repeated across many docs (footer/nav), and each doc's URL
+    resumed = open_checkpoint(files, common_threshold=0.35)
+    if resumed is None:
+        urls = []
 
-    # Join back to text for chunking
-    metas = []
-    passages = []
+        def fingerprints():
+            for url, fps in parallel_map(doc_line_fingerprints, files, workers):
+                urls.append(url)
+                yield fps
 
-    for d in docs:
-        url, title = d["url"], d["title"]
-        text = " ".join(d["lines"])
-        text = WS_RE.sub(" ", text).strip()
+        too_common = common_lines(fingerprints(), common_threshold=0.35)
+        # file names are URL hashes: build (and keep the first near-duplicate) in URL order instead
+        order = [fp.name for _, fp in sorted(zip(urls, files))]
+        save_checkpoint(too_common, order)
+    else:
+        too_common, order = resumed
+    files = [RAW_DIR / name for name in order]
+    t0 = _lap(timings, "clean", t0)
 
-        # Skip docs that became too short after cleaning
-        if len(text) < 1200:
-            continue
+    # Pass 2: chunk, tokenize, embed; every chunk is written out as it comes. Only the
+    # embeddings are resumed: an interrupted run's staged files (perhaps of another --shards
+    # layout) are all rewritten, so drop them rather than publish leftovers
+    shutil.rmtree(STAGE_DIR, ignore_errors=True)
+    if n_shards == 1:
+        stage_dirs = [STAGE_DIR]
+    else:
+        stage_dirs = [STAGE_DIR / versions.SHARDS_DIR / str(shard) for shard in range(n_shards)]
+    chunks_out = [ChunkStoreWriter(out / versions.CHUNKS_DIR) for out in stage_dirs]
+    chunk_shards = array("h")
+    lexical = BM25Builder()
+    embedder = ShardEmbedder(EmbeddingCache(embedder_id(MODEL_NAME)))
+    ids, hashes, seen_ids = array("q"), bytearray(), set()
+    titles_hash = hashlib.sha1()
+    near_dup = bool(near_dup_threshold)
+    near_docs, near_chunks = NearDupIndex(near_dup_threshold), NearDupIndex(near_dup_threshold)
+    dropped = Counter()
+    shard_ids, shard_hashes, shard_texts = [], [], []
 
-        chunks = chunk_text(text, chunk_size=900, overlap=200)
+    def flush_shard():
+        embedder.add(shard_ids, shard_hashes, shard_texts)
+        shard_ids.clear()
+        shard_hashes.clear()
+        shard_texts.clear()
 
-        for ch in chunks:
-            # Skip tiny chunks
-            if len(ch) < 300:
+    docs = parallel_map(doc_chunks, files, workers, _init_chunk_worker, (too_common, near_dup))
+    for url, title, doc_sig, chunks in docs:
+        # near-identical documents (amended versions, re-published orders): keep the first
+        if doc_sig is not None and near_docs.add(doc_sig) >= 0:
+            dropped["docs"] += 1
+            continue
+        shard = url_shard(url, n_shards)
+        for ch, tokens, sig in chunks:
+            cid = chunk_id(url, ch)
+            if cid in seen_ids:  # exact repeat within the same doc
+                continue
+            seen_ids.add(cid)
+            if sig is not None and near_chunks.add(sig) >= 0:
+                dropped["chunks"] += 1
                 continue
-            metas.append({"url": url, "title": title, "chunk": ch})
-            passages.append("passage: " + ch)
+            h = chunk_hash(ch)
+            ids.append(cid)
+            hashes += h
+            titles_hash.update(title.encode("utf-8"))
+            chunks_out[shard].append(url, title, ch)
+            chunk_shards.append(shard)
+            lexical.add(tokens)
+            shard_ids.append(cid)
+            shard_hashes.append(h)
+            shard_texts.append(ch)
+            if len(shard_ids) == SHARD_SIZE:
+                flush_shard()
+    if shard_ids:
+        flush_shard()
+    for out in chunks_out:
+        out.close()
+    del seen_ids, near_docs, near_chunks
 
-    if not metas:
+    if not ids:
         raise SystemExit("After cleaning, no chunks left. Lower thresholds or check raw text.")
+    ids = np.frombuffer(ids, dtype=np.int64)
+    t0 = _lap(timings, "chunk", t0)
+    timings["chunk"] -= embedder.seconds
+    timings["embed"] = embedder.seconds
+    stats = embedder.stats
+    print(f"Chunks: {len(ids)} total, {stats['embedded']} embedded, {stats['cached']} cached, "
+          f"{stats['resumed']} from checkpoint")
+    if near_dup:
+        print(f"Near-duplicates dropped: {dropped['docs']} docs, {dropped['chunks']} chunks")
 
-    print(f"Chunks to embed: {len(metas)}")
+    chunk_shards = np.frombuffer(chunk_shards, dtype=np.int16)
+    shard_rows = [np.flatnonzero(chunk_shards == shard) for shard in range(n_shards)]
+    if not all(len(rows) for rows in shard_rows):
+        raise SystemExit(f"Some of the {n_shards} shards got no chunks; use fewer --shards.")
 
-    embedder = SentenceTransformer(MODEL_NAME)
-    vecs = embedder.encode(passages, normalize_embeddings=True, show_progress_bar=True)
-    vecs = np.asarray(vecs, dtype="float32")
+    vecs = embedder.assemble(BUILD_DIR / "vecs.npy", len(ids))
+    if n_shards == 1:
+        index, index_params = update_faiss_index(ids, vecs, index_type, index_params)
+    else:
+        index_params = write_faiss_shards(stage_dirs, shard_rows, ids, vecs, index_type, index_params)
+    t0 = _lap(timings, "faiss", t0)
 
-    dim = vecs.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine similarity via normalized vectors
-    index.add(vecs)
+    # same model + chunks + titles + ANN/vector settings -> same id, so API caches survive no-op rebuilds
+    build_hash = hashlib.sha1(embedder_id(MODEL_NAME).encode("utf-8") + ids.tobytes())
+    build_hash.update(titles_hash.digest())
+    settings = [index_type, index_params, vec_dtype] + ([n_shards] if n_shards > 1 else [])
+    build_hash.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    build_id = build_hash.hexdigest()[:16]
+    previous = previous_build()
+    unchanged = previous is not None and previous["build_id"] == build_id
+
+    dim, float32_mb = int(vecs.shape[1]), vecs.nbytes / 2**20
+    if not unchanged and n_shards == 1:
+        faiss.write_index(index, str(STAGE_DIR / versions.ANN_FILE))
+        del index
+        store_mb = VectorStore.write(STAGE_DIR / versions.VECS_FILE, vecs, vec_dtype).nbytes / 2**20
+        np.save(STAGE_DIR / versions.ANN_IDS_FILE, ids)
+    elif not unchanged:
+        store_mb = sum(VectorStore.write(out / versions.VECS_FILE, RowSubset(vecs, rows), vec_dtype).nbytes
+                       for out, rows in zip(stage_dirs, shard_rows)) / 2**20
+    # keep only live chunks so the cache doesn't grow forever
+    del vecs
+    EmbeddingCache.replace(embedder_id(MODEL_NAME), bytes(hashes), BUILD_DIR / "vecs.npy")
+    t0 = _lap(timings, "write", t0)
 
-    faiss.write_index(index, str(OUT_INDEX))
-    OUT_META.write_text(json.dumps(metas, ensure_ascii=False, indent=2), encoding="utf-8")
+    # Prebuilt lexical index: the API maps it instead of re-tokenizing every chunk
+    if not unchanged:
+        bm25 = lexical.finish()
+        if n_shards == 1:
+            bm25.save(STAGE_DIR / versions.BM25_DIR)
+        for out, rows in zip(stage_dirs if n_shards > 1 else [], shard_rows):
+            bm25.subset(rows).save(out / versions.BM25_DIR)
+        del bm25
+        version = versions.publish(STAGE_DIR, {
+            "build_id": build_id,
+            "model": MODEL_NAME,
+            "embedder": embedder_id(MODEL_NAME),
+            "dim": dim,
+            "n_chunks": len(ids),
+            "vec_dtype": vec_dtype,
+            "index": {"type": index_type, "params": index_params},
+            "shards": n_shards,
+        }, keep=keep_versions)
+    shutil.rmtree(BUILD_DIR)
+    _lap(timings, "bm25", t0)
 
-    print("\n✅ Index built successfully")
-    print(f"Saved: {OUT_INDEX}")
-    print(f"Saved: {OUT_META}")
-    print(f"Total chunks indexed: {len(metas)}")
+    if unchanged:
+        print(f"\n✅ Index unchanged (build {build_id}); still serving {previous['version']}")
+    else:
+        print("\n✅ Index built successfully")
+        print(f"Saved: {versions.path(version)}/ (now CURRENT)" + (f", {n_shards} shards" if n_shards > 1 else ""))
+        print(f"Embeddings: {vec_dtype}, {store_mb:.1f} MB vs {float32_mb:.1f} MB float32")
+    print(f"Total chunks indexed: {len(ids)}")
+    print("Stage times: " + ", ".join(f"{k} {v:.1f}s" for k, v in timings.items()))
+    return timings
 
 if __name__ == "__main__":
     main()
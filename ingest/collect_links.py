@@ -1,18 +1,24 @@
+import argparse
+import asyncio
 import re
 import json
 from pathlib import Path
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
 
 from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 
 DOC_RE = re.compile(r"/ka/workspace/document/[0-9a-fA-F-]{36}")
 BASE = "https://infohub.rs.ge"
 
 OUT_FILE = Path("data/doc_links.json")
+# append-only log of completed search pages; lets an interrupted crawl resume
+CHECKPOINT_FILE = Path("data/doc_links.checkpoint.jsonl")
 
 MAX_DOCS = 80          # how many document links you want total
 TAKE = 10              # results per page (InfoHub seems to use 10)
 MAX_PAGES = 20         # safety cap so we don't loop forever
+STALE_PAGES = 2        # parallel mode: stop after this many pages in a row with no new links
 
 # Put YOUR working search URL here (must be the one that shows docs)
 START_URL = "https://infohub.rs.ge/ka/search?types=1&types=15&types=16&types=17&types=75&types=76&types=77"
@@ -75,5 +81,149 @@ def collect_links():
     print(f"\nSaved {len(links)} links to {OUT_FILE}")
 
 
+# --- Parallel mode: concurrent search pages, checkpointed and resumable ---
+
+def read_checkpoint():
+    """
+    State of an unfinished run: (completed skips, links found, skip where results ended).
+    Returns None when there is no checkpoint or the last run finished.
+    """
+    if not CHECKPOINT_FILE.exists():
+        return None
+    done_skips, links, end_skip = set(), {}, None
+    for line in CHECKPOINT_FILE.read_text(encoding="utf-8").splitlines():
+        try:
+            rec = json.loads(line)
+        except json.JSONDecodeError:
+            continue  # torn last line from a crash
+        if rec.get("done"):
+            return None
+        done_skips.add(rec["skip"])
+        links.update(dict.fromkeys(rec["links"]))  # a dict keeps discovery order
+        if not rec["links"]:
+            end_skip = rec["skip"] if end_skip is None else min(end_skip, rec["skip"])
+    return done_skips, list(links), end_skip
+
+
+async def fetch_search_page(page, skip: int, take: int):
+    url = set_skip_take(START_URL, skip=skip, take=take)
+    await page.goto(url, wait_until="networkidle", timeout=60000)
+    await page.wait_for_timeout(1200)
+    html = await page.content()
+    return sorted({BASE + rel for rel in DOC_RE.findall(html)})
+
+
+async def collect_links_parallel(concurrency=4, max_docs=MAX_DOCS, max_pages=MAX_PAGES, stale_pages=STALE_PAGES):
+    """
+    Fetch search pages `concurrency` at a time and append each completed page to CHECKPOINT_FILE.
+    Links already in OUT_FILE are kept and count as seen, so a re-crawl stops once pages bring
+    nothing new. max_docs caps the links this crawl adds, in discovery order; a crawl stopped
+    by the cap stays resumable, so the next run first adds the links cut off and then goes
+    on from the last page fetched. max_docs / max_pages of 0 mean no cap.
+    """
+    OUT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    known = set(json.loads(OUT_FILE.read_text(encoding="utf-8"))) if OUT_FILE.exists() else set()
+    found = set(known)
+    added = []  # new links, in discovery order
+
+    def add(links):
+        new = [u for u in links if u not in found]
+        found.update(new)
+        added.extend(new)
+        return new
+
+    state = read_checkpoint()
+    if state is None:
+        CHECKPOINT_FILE.write_text("", encoding="utf-8")
+        done_skips, end_skip = set(), None
+    else:
+        done_skips, links, end_skip = state
+        add(links)
+        print(f"Resuming: {len(done_skips)} pages already done, {len(added)} new links so far")
+
+    def pending_skips():
+        page_num = 0
+        while not max_pages or page_num < max_pages:
+            skip = page_num * TAKE
+            if end_skip is not None and skip >= end_skip:
+                return
+            if skip not in done_skips:
+                yield skip
+            page_num += 1
+
+    skips = pending_skips()
+    failed = 0
+    stale = 0
+    stop = False
+
+    with open(CHECKPOINT_FILE, "a", encoding="utf-8") as checkpoint:
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            pages = [await browser.new_page() for _ in range(concurrency)]
+
+            while not stop and not (max_docs and len(added) >= max_docs):
+                batch = [skip for _, skip in zip(pages, skips)]
+                if not batch:
+                    break
+                print(f"Opening pages skip={batch[0]}..{batch[-1]} take={TAKE}")
+                results = await asyncio.gather(
+                    *(fetch_search_page(pg, skip, TAKE) for pg, skip in zip(pages, batch)),
+                    return_exceptions=True,
+                )
+
+                # process in skip order so "end of results" and staleness are well defined
+                for skip, res in zip(batch, results):
+                    if isinstance(res, Exception):
+                        failed += 1
+                        print(f"skip={skip} FAILED: {res}")
+                        continue
+                    checkpoint.write(json.dumps({"skip": skip, "links": res}, ensure_ascii=False) + "\n")
+                    checkpoint.flush()
+
+                    if not res:
+                        print(f"skip={skip}: no document links, reached the end.")
+                        stop = True
+                        break
+                    new = add(res)
+                    stale = 0 if new else stale + 1
+                    print(f"skip={skip}: added {len(new)} links ({len(added)} new this crawl)")
+                    if stale >= stale_pages:
+                        print(f"{stale} pages in a row with only known links. Stopping.")
+                        stop = True
+                        break
+
+            await browser.close()
+
+        new_links = added[:max_docs] if max_docs else added
+        links = sorted(known.union(new_links))
+        OUT_FILE.write_text(json.dumps(links, ensure_ascii=False, indent=2), encoding="utf-8")
+
+        # failed pages stay pending and a capped crawl unfinished: the next run resumes
+        capped = bool(max_docs) and len(added) >= max_docs and (not stop or len(added) > max_docs)
+        if not failed and not capped:
+            checkpoint.write(json.dumps({"done": True}) + "\n")
+
+    print(f"\nSaved {len(links)} links ({len(new_links)} new) to {OUT_FILE}"
+          + (f" ({failed} pages failed; re-run to resume)" if failed else "")
+          + (" (--max-docs reached; re-run to continue)" if capped else ""))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--concurrency", type=int, default=1,
+                    help="parallel search pages; >1 switches to the checkpointed, resumable crawler")
+    ap.add_argument("--max-docs", type=int, default=MAX_DOCS,
+                    help="parallel mode: new links per run, on top of those already saved; the next run "
+                         "continues where the cap stopped. 0 = no cap")
+    ap.add_argument("--max-pages", type=int, default=MAX_PAGES, help="0 = no cap (parallel mode)")
+    ap.add_argument("--stale-pages", type=int, default=STALE_PAGES)
+    args = ap.parse_args()
+
+    if args.concurrency > 1:
+        asyncio.run(collect_links_parallel(args.concurrency, args.max_docs, args.max_pages, args.stale_pages))
+    else:
+        collect_links()
+
+
 if __name__ == "__main__":
-    collect_links()
+    main()
@@ -0,0 +1,89 @@
+"""
+MinHash / LSH near-duplicate detection for build_index.
+
+A text is the set of its word SHINGLE_SIZE-grams. MinHash keeps NUM_PERM minima of
+randomly permuted shingle hashes; the fraction of equal minima estimates the Jaccard
+similarity of two texts. NearDupIndex bands the signatures (LSH_BANDS bands of
+NUM_PERM / LSH_BANDS values) so only texts sharing a band are ever compared.
+"""
+import zlib
+from array import array
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+NUM_PERM = 64
+LSH_BANDS = 8  # 8 rows per band: pairs at Jaccard 0.85 collide in some band ~92% of the time
+
+_PRIME = np.uint64((1 << 31) - 1)
+# multiply-shift hashing, (a * x + b) mod 2**64 >> 32, one (odd a, b) pair per permutation
+_rng = np.random.default_rng(20240611)
+_A = _rng.integers(1, 1 << 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+
+
+def shingle_hashes(tokens, size=SHINGLE_SIZE):
+    """Distinct hashes (< 2**31) of the word `size`-grams of `tokens` (one shingle if shorter)."""
+    if not tokens:
+        return np.empty(0, dtype=np.uint64)
+    h = np.fromiter((zlib.crc32(t.encode("utf-8")) for t in tokens), dtype=np.uint64, count=len(tokens))
+    size = min(size, len(h))
+    n = len(h) - size + 1
+    acc = np.zeros(n, dtype=np.uint64)
+    for j in range(size):
+        acc = (acc * np.uint64(1_000_003) + h[j:j + n]) % _PRIME
+    return np.unique(acc)
+
+
+def minhash(tokens):
+    """uint32 MinHash signature of the token shingles, or None for a text without tokens."""
+    x = shingle_hashes(tokens)
+    if not len(x):
+        return None
+    return ((_A[:, None] * x[None, :] + _B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class NearDupIndex:
+    """
+    Signatures kept so far, banded for LSH. add() indexes a signature unless an earlier one
+    is a near-duplicate (estimated Jaccard >= threshold); first come, first kept, so the
+    caller's order decides which of a group of near-duplicates stays.
+    """
+
+    def __init__(self, threshold, num_perm=NUM_PERM, bands=LSH_BANDS):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        # hash of (band, band values) -> the row with them, or a list once several rows share them
+        self.buckets = {}
+        self.sigs = array("I")
+
+    def __len__(self):
+        return len(self.sigs) // self.num_perm
+
+    def signature(self, row):
+        return np.frombuffer(self.sigs[row * self.num_perm:(row + 1) * self.num_perm], dtype=np.uint32)
+
+    def add(self, sig):
+        """-1 if `sig` was added, else the row of the indexed near-duplicate it matches."""
+        keys = [hash((b, sig[b * self.rows:(b + 1) * self.rows].tobytes())) for b in range(self.bands)]
+        candidates = set()
+        for k in keys:
+            rows = self.buckets.get(k)
+            if isinstance(rows, list):
+                candidates.update(rows)
+            elif rows is not None:
+                candidates.add(rows)
+        for row in sorted(candidates):
+            if np.mean(self.signature(row) == sig) >= self.threshold:
+                return row
+        row = len(self)
+        self.sigs.frombytes(sig.astype(np.uint32).tobytes())
+        for k in keys:
+            rows = self.buckets.setdefault(k, row)
+            if isinstance(rows, list):
+                rows.append(row)
+            elif rows != row:
+                self.buckets[k] = [rows, row]
+        return -1
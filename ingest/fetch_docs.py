@@ -1,13 +1,31 @@
+import argparse
+import asyncio
+import hashlib
 import json
+import random
 import re
+import time
+from datetime import datetime, timezone
 from pathlib import Path
+
+import requests
 from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 
 RAW_DIR = Path("data/raw_docs")
 RAW_DIR.mkdir(parents=True, exist_ok=True)
+# url -> {file, fingerprint, precheck, fetched_at}; drives change detection on re-crawls
+REGISTRY_FILE = Path("data/doc_registry.json")
 
 WS_RE = re.compile(r"\s+")
 
+MIN_TEXT_LEN = 800                         # shorter pages are menus/empty shells
+BLOCKED_RESOURCES = {"image", "font", "media"}
+RETRIES = 3                                # attempts per document (async mode)
+BACKOFF = 1.0                              # seconds, doubled on every retry
+MAX_AGE_DAYS = 7                           # re-render even if the pre-check says unchanged
+REGISTRY_SAVE_EVERY = 20
+
 
 def clean_text(text: str) -> str:
     # normalize whitespace
@@ -31,8 +49,127 @@ def fetch_document(page, url: str):
     }
 
 
-def main():
-    links = json.load(open("data/doc_links.json", "r", encoding="utf-8"))
+def save_document(doc, out_path: Path):
+    out_path.write_text(
+        json.dumps(doc, ensure_ascii=False, indent=2),
+        encoding="utf-8"
+    )
+
+
+# --- Change detection ---
+
+def doc_filename(url: str) -> str:
+    # stable per URL, so skipping or reordering links never renames other docs
+    return f"doc_{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}.json"
+
+
+def load_registry(path: Path = REGISTRY_FILE):
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {}
+
+
+def save_registry(registry, path: Path = REGISTRY_FILE):
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(registry, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+
+def precheck(session, url: str):
+    """
+    Cheap change token without rendering: ETag / Last-Modified from a HEAD request, or None
+    (render, then compare the text fingerprint). The raw HTML is no fallback: InfoHub is a
+    single-page app whose HTML is the same shell for every document, so hashing it would
+    cost a GET per doc and say nothing about the content. MAX_AGE_DAYS bounds how long
+    a header token is trusted.
+    """
+    try:
+        resp = session.head(url, allow_redirects=True, timeout=15)
+        if resp.ok:
+            return resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+    except requests.RequestException:
+        pass
+    return None
+
+
+def prune(links, registry, out_dir: Path, delete: bool = False):
+    """
+    Forget registry entries of URLs no longer in `links` and tidy the doc_*.json files the
+    registry doesn't name: one left from before URL-hash names (doc_NNNN.json) is renamed to
+    its URL-hash name, or removed if that file already exists. Files of URLs missing from
+    `links` are kept unless `delete`: the links file may be capped (collect_links' default
+    crawl keeps MAX_DOCS), and build_index indexes every file in out_dir.
+    Returns (files removed, files renamed).
+    """
+    wanted = set(links)
+    for url in [u for u in registry if u not in wanted]:
+        del registry[url]
+    named = {entry["file"] for entry in registry.values()}
+    removed = renamed = 0
+    for path in sorted(out_dir.glob("doc_*.json")):
+        if path.name in named:
+            continue
+        try:
+            url = json.loads(path.read_text(encoding="utf-8")).get("url")
+        except (OSError, ValueError):
+            url = None
+        target = out_dir / doc_filename(url) if url else None
+        if delete and url not in wanted:
+            path.unlink()
+            removed += 1
+        elif target is None or target == path:
+            continue
+        elif target.exists():
+            path.unlink()  # the same URL's doc under its current name
+            removed += 1
+        else:
+            path.rename(target)
+            renamed += 1
+    return removed, renamed
+
+
+def report_prune(counts):
+    removed, renamed = counts
+    if removed or renamed:
+        print(f"Removed {removed} stale doc files, renamed {renamed} to URL-hash names")
+
+
+def is_unchanged(entry, token, out_dir: Path) -> bool:
+    if not entry or not token or entry.get("precheck") != token:
+        return False
+    if not (out_dir / entry["file"]).exists():
+        return False
+    age = datetime.now(timezone.utc) - datetime.fromisoformat(entry["fetched_at"])
+    return age.days < MAX_AGE_DAYS
+
+
+def store_document(doc, token, registry, out_dir: Path) -> bool:
+    """Record a rendered doc in the registry; write its file only if the text changed."""
+    url = doc["url"]
+    fingerprint = hashlib.sha256(doc["text"].encode("utf-8")).hexdigest()
+    out_path = out_dir / doc_filename(url)
+    entry = registry.get(url)
+    changed = not (entry and entry["fingerprint"] == fingerprint and out_path.exists())
+    if changed:
+        save_document(doc, out_path)
+    registry[url] = {
+        "file": out_path.name,
+        "fingerprint": fingerprint,
+        "precheck": token,
+        "fetched_at": datetime.now(timezone.utc).isoformat(),
+    }
+    return changed
+
+
+def fetch_all(links, out_dir: Path = RAW_DIR, registry_path: Path = REGISTRY_FILE, force: bool = False,
+              delete_stale: bool = False):
+    """
+    Sequential fetch on a single page (original mode). Returns the number of files written.
+    `delete_stale` removes the files of docs not in `links` (see prune()).
+    """
+    registry = load_registry(registry_path)
+    report_prune(prune(links, registry, out_dir, delete_stale))
+    session = requests.Session()
 
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
@@ -40,29 +177,170 @@ def main():
 
         saved = 0
         for i, url in enumerate(links, start=1):
+            if i % REGISTRY_SAVE_EVERY == 0:
+                save_registry(registry, registry_path)
             try:
+                token = precheck(session, url)
+                if not force and is_unchanged(registry.get(url), token, out_dir):
+                    print(f"[{i}/{len(links)}] unchanged (pre-check)")
+                    continue
+
                 doc = fetch_document(page, url)
 
                 # Skip very short pages (menus, empty, etc.)
-                if len(doc["text"]) < 800:
+                if len(doc["text"]) < MIN_TEXT_LEN:
                     print(f"[{i}/{len(links)}] skipped (too short)")
                     continue
 
-                out_path = RAW_DIR / f"doc_{saved:04d}.json"
-                out_path.write_text(
-                    json.dumps(doc, ensure_ascii=False, indent=2),
-                    encoding="utf-8"
-                )
-
-                saved += 1
-                print(f"[{i}/{len(links)}] saved {out_path.name}")
+                if store_document(doc, token, registry, out_dir):
+                    saved += 1
+                    print(f"[{i}/{len(links)}] saved {doc_filename(url)}")
+                else:
+                    print(f"[{i}/{len(links)}] unchanged (same text)")
 
             except Exception as e:
                 print(f"[{i}/{len(links)}] FAILED {url}: {e}")
 
         browser.close()
 
-    print(f"\nDone. Saved {saved} documents into {RAW_DIR}")
+    save_registry(registry, registry_path)
+    return saved
+
+
+# --- Async mode: a bounded pool of browser contexts fetching in parallel ---
+
+async def _block_heavy(route):
+    if route.request.resource_type in BLOCKED_RESOURCES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+async def fetch_document_async(page, url: str, selector: str = None):
+    resp = await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+    if resp is not None and (resp.status == 429 or resp.status >= 500):
+        raise RuntimeError(f"HTTP {resp.status}")  # transient; caller retries
+
+    # Wait for rendered content instead of networkidle + a fixed sleep
+    try:
+        if selector:
+            await page.wait_for_selector(selector, timeout=15000)
+        else:
+            await page.wait_for_function(
+                "n => document.body && document.body.innerText.length >= n",
+                arg=MIN_TEXT_LEN,
+                timeout=15000,
+            )
+    except PlaywrightTimeoutError:
+        pass  # genuinely short page; the length filter decides
+
+    title = await page.title()
+    text = await page.evaluate("() => document.body.innerText")
+
+    return {
+        "url": url,
+        "title": title,
+        "text": clean_text(text)
+    }
+
+
+async def fetch_all_async(links, concurrency: int = 4, out_dir: Path = RAW_DIR, selector: str = None,
+                          registry_path: Path = REGISTRY_FILE, force: bool = False, delete_stale: bool = False):
+    """
+    Fetch links with `concurrency` browser contexts (one page each) pulling from a shared queue.
+    Images/fonts/media are blocked; failed documents are retried with exponential backoff.
+    `delete_stale` as in fetch_all(). Returns the number of files written.
+    """
+    registry = load_registry(registry_path)
+    report_prune(prune(links, registry, out_dir, delete_stale))
+    session = requests.Session()
+    done = 0
+    queue = asyncio.Queue()
+    for i, url in enumerate(links, start=1):
+        queue.put_nowait((i, url))
+
+    saved = 0
+
+    async def worker(browser):
+        nonlocal saved, done
+        context = await browser.new_context()
+        await context.route("**/*", _block_heavy)
+        page = await context.new_page()
+
+        while True:
+            try:
+                i, url = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+
+            done += 1
+            if done % REGISTRY_SAVE_EVERY == 0:
+                save_registry(registry, registry_path)
+
+            token = await asyncio.to_thread(precheck, session, url)
+            if not force and is_unchanged(registry.get(url), token, out_dir):
+                print(f"[{i}/{len(links)}] unchanged (pre-check)")
+                continue
+
+            doc = None
+            for attempt in range(RETRIES):
+                try:
+                    doc = await fetch_document_async(page, url, selector)
+                    break
+                except Exception as e:
+                    if attempt == RETRIES - 1:
+                        print(f"[{i}/{len(links)}] FAILED {url}: {e}")
+                    else:
+                        await asyncio.sleep(BACKOFF * 2 ** attempt * random.uniform(0.5, 1.5))
+            if doc is None:
+                continue
+
+            if len(doc["text"]) < MIN_TEXT_LEN:
+                print(f"[{i}/{len(links)}] skipped (too short)")
+                continue
+
+            if store_document(doc, token, registry, out_dir):
+                saved += 1
+                print(f"[{i}/{len(links)}] saved {doc_filename(url)}")
+            else:
+                print(f"[{i}/{len(links)}] unchanged (same text)")
+
+        await context.close()
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        workers = [worker(browser) for _ in range(max(1, min(concurrency, len(links))))]
+        await asyncio.gather(*workers)
+        await browser.close()
+
+    save_registry(registry, registry_path)
+    return saved
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--links", default="data/doc_links.json")
+    ap.add_argument("--concurrency", type=int, default=1,
+                    help="parallel browser pages; >1 switches to the async fetcher")
+    ap.add_argument("--selector", default=None,
+                    help="CSS selector marking rendered content (async mode); default waits for body text")
+    ap.add_argument("--force", action="store_true", help="ignore the registry pre-check and re-render everything")
+    ap.add_argument("--prune", action="store_true",
+                    help="delete the raw docs of URLs not in --links (only with a complete, uncapped links file)")
+    args = ap.parse_args()
+
+    links = json.load(open(args.links, "r", encoding="utf-8"))
+
+    t0 = time.perf_counter()
+    if args.concurrency > 1:
+        saved = asyncio.run(fetch_all_async(links, args.concurrency, selector=args.selector, force=args.force,
+                                            delete_stale=args.prune))
+    else:
+        saved = fetch_all(links, force=args.force, delete_stale=args.prune)
+    elapsed = time.perf_counter() - t0
+
+    print(f"\nDone. Wrote {saved} new/changed documents into {RAW_DIR}")
+    print(f"Throughput: {len(links) / elapsed:.2f} docs/sec ({len(links)} links in {elapsed:.1f}s)")
 
 
 if __name__ == "__main__":
@@ -1,7 +1,8 @@
 import re
 import streamlit as st
 from openai import OpenAI
-from app.rag import retrieve
+from app.context import build_context, format_context
+from app.rag import retrieve, with_neighbours
 
 # Streamlit page setup
 st.set_page_config(page_title="InfoHub RAG Assistant", page_icon="🇬🇪")
@@ -44,18 +45,15 @@ if st.button("კითხვა"):
         st.stop()
 
     with st.spinner("ვიძიებ ინფორმაციას..."):
-        hits = retrieve(question, k=5)
+        hits = with_neighbours(retrieve(question, k=5))
 
     if not hits:
         st.error("შესაბამისი ინფორმაცია ვერ მოიძებნა")
         st.stop()
 
-    context = ""
-    sources_map = {}
-
-    for i, h in enumerate(hits, start=1):
-        context += f"[{i}] {h['chunk']}\n\n"
-        sources_map[i] = h["url"]
+    passages = build_context(question, hits)
+    context = format_context(passages)
+    sources_map = {p["n"]: p["url"] for p in passages}
 
     prompt = f"""
 კონტექსტი:
@@ -67,21 +65,21 @@ if st.button("კითხვა"):
 
     client = OpenAI()
 
-    with st.spinner("მუშავდება"):
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.2,
-            max_tokens=350,
-        )
-
-    answer = response.choices[0].message.content
-
+    # Stream tokens into the page as they arrive instead of waiting for the whole answer
     st.subheader("პასუხი")
-    st.write(answer)
+    stream = client.chat.completions.create(
+        model="gpt-4o-mini",
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt},
+        ],
+        temperature=0.2,
+        max_tokens=350,
+        stream=True,
+    )
+    answer = st.write_stream(
+        chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices
+    )
 
     st.subheader("წყაროები")
     sources = extract_used_sources(answer, sources_map)
@@ -1,7 +1,25 @@
+import json
 import streamlit as st
 import requests
 
 API_URL = "http://127.0.0.1:8000/chat"
+STREAM_URL = API_URL + "/stream"
+
+
+def iter_sse(response):
+    """Yield (event, data) pairs from a text/event-stream response."""
+    event, data = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line:
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data.append(line[len("data:"):].strip())
+            continue
+        if data:
+            yield event, json.loads("\n".join(data))
+        event, data = "message", []
+
 
 st.title("InfoHub RAG Assistant 🇬🇪")
 st.write("დასვით შეკითხვა საქართველოს საბაჟო თემებზე")
@@ -12,18 +30,31 @@ if st.button("კითხვა"):
     if not question:
         st.warning("გთხოვთ შეიყვანოთ შეკითხვა.")
     else:
-        with st.spinner("მუშავდება..."):
-            try:
-                response = requests.post(API_URL, json={"question": question})
-                data = response.json()
+        try:
+            st.subheader("პასუხი")
+            answer_box = st.empty()
+            answer_box.write("მუშავდება...")
+
+            answer = ""
+            sources = []
+            with requests.post(STREAM_URL, json={"question": question}, stream=True, timeout=120) as response:
+                response.raise_for_status()
+                response.encoding = "utf-8"
+                for event, data in iter_sse(response):
+                    if event == "token":
+                        answer += data["text"]
+                        answer_box.markdown(answer + "▌")
+                    elif event == "citations":
+                        sources = data["sources"]
+                    elif event == "error":
+                        raise RuntimeError(data["message"])
 
-                st.subheader("პასუხი")
-                st.write(data["answer"])
+            answer_box.markdown(answer)
 
-                if data.get("sources"):
-                    st.subheader("წყაროები")
-                    for src in data["sources"]:
-                        st.write(src)
+            if sources:
+                st.subheader("წყაროები")
+                for src in sources:
+                    st.write(src)
 
-            except Exception as e:
-                st.error(f"შეცდომა: {e}")
+        except Exception as e:
+            st.error(f"შეცდომა: {e}")